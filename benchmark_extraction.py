@@ -0,0 +1,253 @@
+"""
+Benchmark of the PDF text extraction engines.
+
+Generates a corpus of contract-like PDFs with a known clause structure and a
+pricing table page, runs every engine over it and reports pages/sec, MB/sec,
+peak RSS and clause precision/recall (via extract_clause).
+
+    python benchmark_extraction.py --docs 50 --engines pypdf docling textract
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CLAUSE_HEADINGS = [
+    "Term", "Pricing", "Payment Terms", "Audit Rights", "Termination",
+    "Confidentiality", "Dispute Resolution", "Governing Law", "Notices",
+    "Performance Requirement", "Rebate", "Eligible Participants",
+    "Assignment", "Force Majeure", "Entire Agreement",
+]
+FILLER = (
+    "The Customer shall purchase the Products from the Company in accordance with "
+    "the terms of this Agreement and any applicable amendment executed by both parties. "
+)
+TABLE_ROWS = 12
+TABLE_COLS = ["Product Code", "Description", "List Price", "Contract Price", "Rebate"]
+
+
+# ---------------------------
+# Corpus generation
+# ---------------------------
+def generate_contract_pdf(pdf_path: Path, n_clauses: int, rng: random.Random) -> dict:
+    """Write one synthetic contract and return its ground truth."""
+    headings = rng.sample(CLAUSE_HEADINGS, n_clauses)
+    clauses = []
+
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 72
+    for number, heading in enumerate(headings, start=1):
+        body = FILLER * rng.randint(2, 6)
+        text = f"{number}. {heading}. {body}"
+        rect = fitz.Rect(72, y, 540, 770)
+        # insert_textbox returns the unused height, negative if the text did not fit
+        remaining = page.insert_textbox(rect, text, fontsize=10)
+        if remaining < 0:
+            page = doc.new_page()
+            y = 72
+            rect = fitz.Rect(72, y, 540, 770)
+            remaining = page.insert_textbox(rect, text, fontsize=10)
+        y = 770 - remaining + 12
+        clauses.append({"clause_number": str(number), "heading": heading})
+
+    # Pricing exhibit: enough "$" values to trip remove_tables.DOLLAR_THRESHOLD
+    pricing_page = len(doc)
+    page = doc.new_page()
+    page.insert_text((72, 60), "Exhibit A - Pricing", fontsize=12)
+    col_x = [72, 160, 300, 390, 480]
+    for c, name in enumerate(TABLE_COLS):
+        page.insert_text((col_x[c], 90), name, fontsize=9)
+    for r in range(TABLE_ROWS):
+        row_y = 110 + r * 18
+        values = [
+            f"P-{rng.randint(1000, 9999)}",
+            "Trauma implant",
+            f"${rng.randint(100, 9000):,}.00",
+            f"${rng.randint(100, 9000):,}.00",
+            f"${rng.randint(1, 90)}.00",
+        ]
+        for c, value in enumerate(values):
+            page.insert_text((col_x[c], row_y), value, fontsize=9)
+        page.draw_line((72, row_y + 4), (540, row_y + 4))
+
+    page = doc.new_page()
+    page.insert_text((72, 72), "IN WITNESS WHEREOF, the parties have executed this Agreement.", fontsize=10)
+    page.insert_text((72, 100), "The Company: ____________", fontsize=10)
+    page.insert_text((72, 120), "The Customer: ____________", fontsize=10)
+
+    doc.save(pdf_path)
+    pages = len(doc)
+    doc.close()
+    return {"clauses": clauses, "pricing_page": pricing_page, "pages": pages}
+
+
+def generate_corpus(corpus_dir: Path, n_docs: int, seed: int = 7) -> dict:
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    truth = {}
+    for i in range(n_docs):
+        pdf_path = corpus_dir / f"bench_{i:04d}.pdf"
+        truth[pdf_path.name] = generate_contract_pdf(pdf_path, rng.randint(4, len(CLAUSE_HEADINGS)), rng)
+    with open(corpus_dir / "truth.json", "w", encoding="utf-8") as f:
+        json.dump(truth, f, indent=4)
+    print(f"✅ Generated {n_docs} PDFs in {corpus_dir}")
+    return truth
+
+
+# ---------------------------
+# Engines
+# ---------------------------
+def engine_pypdf(pdf_path: str, work_dir: Path) -> dict:
+    from extract_text_pypdf import read_pdf_pages
+    return {"text": "\n\n".join(read_pdf_pages(pdf_path))}
+
+
+def engine_docling(pdf_path: str, work_dir: Path) -> dict:
+    from extract_text_docling import convert_pdf_to_markdown
+    return {"text": convert_pdf_to_markdown(pdf_path)}
+
+
+def engine_textract(pdf_path: str, work_dir: Path) -> dict:
+    """Textract table detection + truncation, then pypdf over the truncated PDF."""
+    from remove_tables import find_truncation_page
+    from extract_text_pypdf import read_pdf_pages
+
+    out_pdf = work_dir / Path(pdf_path).name
+    with fitz.open(pdf_path) as doc:
+        truncate_from = find_truncation_page(pdf_path, doc=doc)
+        if truncate_from is None:
+            doc.save(out_pdf)
+        else:
+            with fitz.open() as new_doc:
+                if truncate_from > 0:
+                    new_doc.insert_pdf(doc, from_page=0, to_page=truncate_from - 1)
+                new_doc.save(out_pdf)
+    return {"text": "\n\n".join(read_pdf_pages(str(out_pdf))), "truncate_from": truncate_from}
+
+
+ENGINES = {
+    "pypdf": engine_pypdf,
+    "docling": engine_docling,
+    "textract": engine_textract,
+}
+
+
+# ---------------------------
+# Scoring
+# ---------------------------
+def clause_scores(text: str, expected: list[dict]) -> tuple[int, int, int]:
+    """Return (true positives, predicted, expected) on (number, heading) pairs."""
+    from extract_clause import extract_numbered_clauses, remove_signature_block_text
+
+    predicted = extract_numbered_clauses(remove_signature_block_text(text))
+    pred_keys = {(c["clause_number"], c["heading"].strip().lower()) for c in predicted}
+    truth_keys = {(c["clause_number"], c["heading"].lower()) for c in expected}
+    return len(pred_keys & truth_keys), len(pred_keys), len(truth_keys)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_engine(engine_name: str, corpus_dir: str, truth: dict) -> dict:
+    """Runs in a fresh worker process so peak RSS belongs to this engine only."""
+    engine = ENGINES[engine_name]
+    work_dir = Path(tempfile.mkdtemp(prefix=f"bench_{engine_name}_"))
+    pages = 0
+    total_bytes = 0
+    tp = n_pred = n_truth = 0
+    truncation_hits = 0
+    failures = 0
+
+    start = time.perf_counter()
+    for name, doc_truth in truth.items():
+        pdf_path = os.path.join(corpus_dir, name)
+        try:
+            result = engine(pdf_path, work_dir)
+        except Exception as e:
+            print(f"⚠️ {engine_name} failed on {name}: {e}")
+            failures += 1
+            continue
+        pages += doc_truth["pages"]
+        total_bytes += os.path.getsize(pdf_path)
+        d_tp, d_pred, d_truth = clause_scores(result["text"], doc_truth["clauses"])
+        tp += d_tp
+        n_pred += d_pred
+        n_truth += d_truth
+        if result.get("truncate_from") == doc_truth["pricing_page"]:
+            truncation_hits += 1
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "engine": engine_name,
+        "docs": len(truth) - failures,
+        "failures": failures,
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+        "mb_per_sec": round(total_bytes / (1024 * 1024) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "clause_precision": round(tp / n_pred, 4) if n_pred else 0.0,
+        "clause_recall": round(tp / n_truth, 4) if n_truth else 0.0,
+    }
+    if engine_name == "textract":
+        report["truncation_accuracy"] = round(truncation_hits / max(len(truth) - failures, 1), 4)
+    return report
+
+
+def print_report(reports: list[dict]):
+    columns = ["engine", "docs", "pages_per_sec", "mb_per_sec", "peak_rss_mb", "clause_precision", "clause_recall"]
+    print("\n" + " | ".join(f"{c:>16}" for c in columns))
+    print("-" * (19 * len(columns)))
+    for r in reports:
+        cells = []
+        for c in columns:
+            v = r.get(c)
+            cells.append(f"{v:>16.2f}" if isinstance(v, float) else f"{str(v):>16}")
+        print(" | ".join(cells))
+        if "truncation_accuracy" in r:
+            print(f"{'':>16}   truncation accuracy: {r['truncation_accuracy']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction engines")
+    parser.add_argument("--docs", type=int, default=25, help="Number of synthetic PDFs to generate")
+    parser.add_argument("--corpus-dir", type=str, default="bench_corpus", help="Where the synthetic corpus is written")
+    parser.add_argument("--engines", nargs="+", default=["pypdf"], choices=list(ENGINES), help="Engines to benchmark")
+    parser.add_argument("--output", type=str, default="bench_extraction.json", help="JSON report path")
+    args = parser.parse_args()
+
+    corpus_dir = Path(args.corpus_dir)
+    truth = generate_corpus(corpus_dir, args.docs)
+
+    reports = []
+    for engine_name in args.engines:
+        print(f"🔍 Benchmarking {engine_name} ...")
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            reports.append(pool.submit(run_engine, engine_name, str(corpus_dir), truth).result())
+
+    print_report(reports)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(reports, f, indent=4)
+    print(f"\n✅ Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import json
+import sqlite3
+import hashlib
+from datetime import datetime, timezone
+
+MANIFEST_DB = "build_manifest.db"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class BuildManifest:
+    """
+    SQLite manifest of what each pipeline stage produced for each document.
+
+    Every stage records, per document, the hash of the input it consumed, the
+    extractor version that produced the output, and the hash of that output.
+    A re-run only needs to process documents whose input hash or extractor
+    version differs from what was recorded.
+    """
+
+    def __init__(self, db_path: str = MANIFEST_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stage_outputs (
+                stage TEXT NOT NULL,
+                doc TEXT NOT NULL,
+                source_hash TEXT NOT NULL,
+                extractor_version TEXT NOT NULL,
+                output_hash TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (stage, doc)
+            );
+            """
+        )
+        self.conn.commit()
+
+    def file_hash(self, path) -> str:
+        """
+        sha256 of a file. Files whose size and mtime are unchanged since the
+        last run are not re-read, so checking an untouched corpus only costs a stat().
+        """
+        path = os.path.abspath(str(path))
+        st = os.stat(path)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha = digest.hexdigest()
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, sha)
+        )
+        return sha
+
+    @staticmethod
+    def payload_hash(payload) -> str:
+        """sha256 of a JSON-serialisable object (key order independent)."""
+        data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def is_current(self, stage: str, doc: str, source_hash: str, extractor_version: str,
+                   output_path=None) -> bool:
+        """
+        True if `stage` already processed `doc` from this exact input with this
+        extractor version. With `output_path`, that file must also still exist
+        with the output hash that was recorded.
+        """
+        row = self.conn.execute(
+            "SELECT source_hash, extractor_version, output_hash FROM stage_outputs WHERE stage = ? AND doc = ?",
+            (stage, doc)
+        ).fetchone()
+        if row is None or row[0] != source_hash or row[1] != extractor_version:
+            return False
+        if output_path is None:
+            return True
+        return os.path.exists(output_path) and self.file_hash(output_path) == row[2]
+
+    def record(self, stage: str, doc: str, source_hash: str, extractor_version: str,
+               output_hash: str = None, commit: bool = True):
+        self.conn.execute(
+            """
+            INSERT INTO stage_outputs (stage, doc, source_hash, extractor_version, output_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (stage, doc) DO UPDATE SET
+                source_hash = excluded.source_hash,
+                extractor_version = excluded.extractor_version,
+                output_hash = excluded.output_hash,
+                updated_at = excluded.updated_at
+            """,
+            (stage, doc, source_hash, extractor_version, output_hash,
+             datetime.now(timezone.utc).isoformat())
+        )
+        if commit:
+            self.conn.commit()
+
+    def output_hash(self, stage: str, doc: str):
+        row = self.conn.execute(
+            "SELECT output_hash FROM stage_outputs WHERE stage = ? AND doc = ?", (stage, doc)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def docs(self, stage: str) -> set:
+        rows = self.conn.execute("SELECT doc FROM stage_outputs WHERE stage = ?", (stage,))
+        return {r[0] for r in rows}
+
+    def forget(self, stage: str, docs, commit: bool = True):
+        self.conn.executemany(
+            "DELETE FROM stage_outputs WHERE stage = ? AND doc = ?",
+            [(stage, d) for d in docs]
+        )
+        if commit:
+            self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,109 @@
+import re
+from typing import List
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _encoding = None
+
+CHUNK_MAX_TOKENS = 400
+CHUNK_OVERLAP_TOKENS = 60
+
+# New sub-clause: a line starting with (a), (iv), 1.1, 2.3.4, a), or a bullet
+SUBCLAUSE_BOUNDARY = re.compile(r"\n+(?=\s*(?:\([a-zA-Z0-9]{1,4}\)|[a-zA-Z0-9]{1,3}\)|\d+(?:\.\d+)+\s|[•\-\*]\s))")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.;!?])\s+(?=[A-Z(\"'\d])")
+
+
+def count_tokens(text: str) -> int:
+    """Tokens for the embedding model (cl100k_base), or a ~4 chars/token estimate without tiktoken."""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _split_oversized(unit: str, max_tokens: int) -> List[str]:
+    """Split a unit with no usable boundary (e.g. a flattened table) on whitespace."""
+    words = unit.split()
+    pieces = []
+    current = []
+    current_tokens = 0
+    for word in words:
+        word_tokens = count_tokens(word + " ")
+        if current and current_tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+            current_tokens = 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_units(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[str]:
+    """Split a clause into sub-clauses, then sentences, each no longer than max_tokens."""
+    units = []
+    for subclause in SUBCLAUSE_BOUNDARY.split(text):
+        for sentence in SENTENCE_BOUNDARY.split(subclause.strip()):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if count_tokens(sentence) > max_tokens:
+                units.extend(_split_oversized(sentence, max_tokens))
+            else:
+                units.append(sentence)
+    return units
+
+
+def chunk_clause(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """
+    Split a clause into chunks of at most max_tokens, breaking only on
+    sub-clause and sentence boundaries. Consecutive chunks share up to
+    overlap_tokens of trailing sentences. Short clauses come back as one chunk.
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    units = [(u, count_tokens(u)) for u in split_units(text, max_tokens)]
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for unit, unit_tokens in units:
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append(" ".join(u for u, _ in current))
+            # Carry trailing units into the next chunk as overlap
+            overlap = []
+            overlap_total = 0
+            for prev, prev_tokens in reversed(current):
+                if overlap_total + prev_tokens > overlap_tokens or overlap_total + prev_tokens + unit_tokens > max_tokens:
+                    break
+                overlap.insert(0, (prev, prev_tokens))
+                overlap_total += prev_tokens
+            current = overlap
+            current_tokens = overlap_total
+        current.append((unit, unit_tokens))
+        current_tokens += unit_tokens
+
+    if current:
+        chunks.append(" ".join(u for u, _ in current))
+    return chunks
+
+
+def collapse_chunks(results) -> list:
+    """
+    Collapse Qdrant hits so each clause appears once. Chunk points carry their
+    clause's record id in `parent_id`; results are expected best-first, so the
+    first hit of each clause is kept.
+    """
+    seen = set()
+    collapsed = []
+    for res in results:
+        key = res.payload.get("parent_id") or res.id
+        if key in seen:
+            continue
+        seen.add(key)
+        collapsed.append(res)
+    return collapsed
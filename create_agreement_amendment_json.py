@@ -1,128 +1,209 @@
 import pandas as pd
 from pathlib import Path
-import json
+from json_store import dump_json
+import heapq
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# (substring of the lowercased title, amendment type), in payload order
+AMENDMENT_TYPES = [
+    ("ext", "ext"),
+    ("repl", "repl"),
+    ("add", "add"),
+    ("del", "del"),
+    ("add prod agree", "add_prod_agree"),
+    ("notice", "notice"),
+    ("chg", "chg"),
+    ("address", "address"),
+]
+
+
+def _split_list(values: pd.Series) -> list:
+    return [[x.strip() for x in v.split(",") if x.strip()] for v in values]
+
+
+def _numbered_ids(prefix: str, mask: pd.Series, start: int = 1001) -> pd.Series:
+    # Ids are handed out in row order within each record kind
+    return (prefix + (mask.cumsum() + start - 1).astype(str)).where(mask, "")
+
+
+def build_product_matcher(products: list):
+    """
+    Return a function mapping a lowercased title to the set of `products`
+    that occur in it. Uses an Aho–Corasick automaton when pyahocorasick is
+    installed, so a title is scanned once whatever the number of products.
+    """
+    # An empty product title is a substring of every title
+    always = {p for p in products if not p}
+    products = sorted({p for p in products if p})
+
+    if ahocorasick is not None and products:
+        automaton = ahocorasick.Automaton()
+        for p in products:
+            automaton.add_word(p, p)
+        automaton.make_automaton()
+
+        def match(title: str) -> set:
+            return always | {p for _, p in automaton.iter(title)}
+    else:
+        def match(title: str) -> set:
+            return always | {p for p in products if p in title}
+
+    return match
+
+
+def resolve_product_agreements(titles: pd.Series, pa_products: pd.Series, pa_ids: pd.Series,
+                               pa_records: pd.Series) -> pd.Series:
+    """
+    For each amendment title, the id of the product agreement whose product
+    title occurs in it ("" if none). All series share the row index of the
+    metadata sheet, which gives the row order: only product agreements above
+    the amendment count, a record number listed twice counts with its latest
+    row, and among several matches the record number first listed last wins.
+    """
+    match = build_product_matcher(pa_products.tolist())
+
+    # Sweep the product agreements and amendments in row order
+    events = sorted(
+        [(row, 0, (record, product, pa_id)) for row, record, product, pa_id
+         in zip(pa_products.index, pa_records, pa_products, pa_ids)]
+        + [(row, 1, title) for row, title in titles.items()]
+    )
+
+    rank = {}       # record number -> order in which it was first listed
+    live = {}       # record number -> (product, pa_id) of its latest row
+    by_product = {}  # product -> max-heap of (-rank, record), stale entries dropped lazily
+    resolved = {}
+    for row, kind, value in events:
+        if kind == 0:
+            record, product, pa_id = value
+            rank.setdefault(record, len(rank))
+            live[record] = (product, pa_id)
+            heapq.heappush(by_product.setdefault(product, []), (-rank[record], record))
+            continue
+
+        best = None
+        for product in match(value):
+            heap = by_product.get(product)
+            while heap and live[heap[0][1]][0] != product:
+                heapq.heappop(heap)
+            if heap and (best is None or heap[0] < best):
+                best = heap[0]
+        if best is not None:
+            resolved[row] = live[best[1]][1]
+    return pd.Series(resolved, dtype=object).reindex(titles.index, fill_value="")
+
 
 def split_and_build_json(excel_path: str):
     df = pd.read_excel(excel_path, dtype=str)
     df = df.fillna("")
+    df = df.reset_index(drop=True)
 
-    agreements = []
-    amendments = []
+    def column(name: str) -> pd.Series:
+        return df[name] if name in df.columns else pd.Series("", index=df.index)
 
-    ma_counter = 1001
-    pa_counter = 1001
-    am_counter = 1001
-
-    # Map article base → agreement_id (for amendment linkage)
-    agreement_lookup = {}
-    product_agreement_lookup = {}
-
-    for _, row in df.iterrows():
-        article_no = row["Article_Number"].strip()
-        is_agreement = article_no.endswith(".001")
-
-        base_article = article_no.split(".")[0]
-
-        common_payload = {
-            "record_no": article_no,
-            "filename": row.get("FileName", ""),
-            "title": row.get("Title", ""),
-            "effective_date": row.get("Effective_Date", ""),
-            "end_date": row.get("End_Date", ""),
-            "customer_id": row.get("UCN", ""),
-            "customer_name": row.get("Customer_Name", ""),
-            "business_unit": row.get("Business_Unit", ""),
-            "product_lines": [x.strip() for x in row.get("Product_Lines", "").split(",") if x.strip()],
-            "keywords": [x.strip() for x in row.get("Keywords", "").split(",") if x.strip()],
-            "eligible_participants": [
-                x.strip() for x in row.get("Eligible_Participants", "").split(",") if x.strip()
-            ]
-        }
-
-        if is_agreement:
-            agreement_id = f"MA-{ma_counter}"
-            ma_counter += 1
-
-            agreement_lookup[base_article] = agreement_id
+    article_no = df["Article_Number"].str.strip()
+    title = column("Title")
+    title_lower = title.str.lower()
 
-            agreements.append({
-                "id": f"AGR|{agreement_id}",
-                "vector": [0.0],
-                "payload": {
-                    "agreement_id": agreement_id,
-                    "doc_type": "master_agreement",
-                    **common_payload
-                }
-            })
+    # Classify every row at once: master agreement, product agreement or amendment
+    is_agreement = article_no.str.endswith(".001")
+    is_product_agreement = ~is_agreement & title_lower.str.contains("add prod agree", regex=False)
+    is_amendment = ~is_agreement & ~is_product_agreement
 
-        elif "add prod agree" in row.get("Title", "").lower():
-            pa_id = f"PA-{pa_counter}"
-            pa_counter += 1
+    agreement_ids = _numbered_ids("MA-", is_agreement)
+    pa_ids = _numbered_ids("PA-", is_product_agreement)
+    amendment_ids = _numbered_ids("AM-", is_amendment)
 
+    # Parent master agreement: latest .001 record of the same base article above the row
+    base_article = article_no.str.split(".", n=1).str[0]
+    parent_ids = agreement_ids.where(is_agreement).groupby(base_article).ffill().fillna("")
+
+    type_flags = {
+        name: title_lower.str.contains(needle, regex=False)
+        for needle, name in AMENDMENT_TYPES
+    }
+
+    # Product agreement extensions point at the product agreement instead
+    pa_products = (
+        title_lower[is_product_agreement]
+        .str.replace("amendment,", "", regex=False)
+        .str.replace("add prod agree", "", regex=False)
+        .str.strip()
+    )
+    is_pa_extension = is_amendment & type_flags["ext"] & title_lower.str.contains("prod agree", regex=False)
+    if is_pa_extension.any() and not pa_products.empty:
+        pa_parents = resolve_product_agreements(
+            title_lower[is_pa_extension], pa_products, pa_ids[is_product_agreement],
+            article_no[is_product_agreement]
+        )
+        has_pa_parent = pa_parents != ""
+        parent_ids.loc[pa_parents.index[has_pa_parent]] = pa_parents[has_pa_parent]
+
+    common_columns = {
+        "record_no": article_no,
+        "filename": column("FileName"),
+        "title": title,
+        "effective_date": column("Effective_Date"),
+        "end_date": column("End_Date"),
+        "customer_id": column("UCN"),
+        "customer_name": column("Customer_Name"),
+        "business_unit": column("Business_Unit"),
+        "product_lines": _split_list(column("Product_Lines")),
+        "keywords": _split_list(column("Keywords")),
+        "eligible_participants": _split_list(column("Eligible_Participants")),
+    }
+    keys = list(common_columns)
+    common_payloads = [
+        dict(zip(keys, values))
+        for values in zip(*(
+            v.tolist() if isinstance(v, pd.Series) else v for v in common_columns.values()
+        ))
+    ]
+
+    type_names = [name for _, name in AMENDMENT_TYPES]
+    type_rows = pd.DataFrame(type_flags).to_numpy().tolist()
+
+    agreements = []
+    amendments = []
+    for i, (is_ma, is_pa, ma_id, pa_id, am_id, parent_id) in enumerate(zip(
+        is_agreement.tolist(), is_product_agreement.tolist(), agreement_ids.tolist(),
+        pa_ids.tolist(), amendment_ids.tolist(), parent_ids.tolist()
+    )):
+        common_payload = common_payloads[i]
+        if is_ma or is_pa:
+            agreement_id = ma_id if is_ma else pa_id
             agreements.append({
-                "id": f"AGR|{pa_id}",
+                "id": f"AGR|{agreement_id}",
                 "vector": [0.0],
                 "payload": {
-                    "agreement_id": pa_id,
-                    "doc_type": "product_agreement",
+                    "agreement_id": agreement_id,
+                    "doc_type": "master_agreement" if is_ma else "product_agreement",
                     **common_payload
                 }
             })
-            
-            # Create lookup from title to agreement_id for amendments
-            # Remove "add prod agree amendment" from title for matching
-            product_agreement_title = row.get("Title", "").lower().replace("amendment,", "").replace("add prod agree", "").strip()
-            product_agreement_lookup[article_no] = {"product": product_agreement_title, "pa_id": pa_id}
-        
         else:
-            amendment_id = f"AM-{am_counter}"
-            am_counter += 1
-
-            parent_agreement_id = agreement_lookup.get(base_article, "")
-            
-            # Determine amendment type(s)
-            type_amendment = []
-            title_lower = row.get("Title", "").lower()
-            if "ext" in title_lower:
-                type_amendment.append("ext")
-                if "prod agree" in title_lower:
-                    for key, val in product_agreement_lookup.items():
-                        if val["product"] in title_lower:
-                            parent_agreement_id = val["pa_id"]
-                            
-            if "repl" in title_lower:
-                type_amendment.append("repl")
-            if "add" in title_lower:
-                type_amendment.append("add")
-            if "del" in title_lower:
-                type_amendment.append("del")
-            if "add prod agree" in title_lower:
-                type_amendment.append("add_prod_agree")
-            if "notice" in title_lower:
-                type_amendment.append("notice")
-            if "chg" in title_lower:
-                type_amendment.append("chg")
-            if "address" in title_lower:
-                type_amendment.append("address")
-                
             amendments.append({
-                "id": f"AMD|{amendment_id}",
+                "id": f"AMD|{am_id}",
                 "vector": [0.0],
                 "payload": {
-                    "amendment_id": amendment_id,
-                    "agreement_id": parent_agreement_id,
+                    "amendment_id": am_id,
+                    "agreement_id": parent_id,
                     "doc_type": "amendment",
-                    "type_amendment": type_amendment,
+                    "type_amendment": [n for n, flag in zip(type_names, type_rows[i]) if flag],
                     **common_payload
                 }
             })
+
     final_json = {
         "agreement": agreements,
         "amendment": amendments
     }
 
-    with open("agreements_and_amendments.json", "w", encoding="utf-8") as f:
-        json.dump(final_json, f, ensure_ascii=False, indent=4)
+    dump_json(final_json, "agreements_and_amendments.json")
 
     print(f"✅ Agreements: {len(agreements)}")
     print(f"✅ Master Agreements: {sum(1 for a in agreements if a['payload']['doc_type'] == 'master_agreement')}")
@@ -1,11 +1,10 @@
 
 import re
 from pathlib import Path
-import json
+from json_store import load_json, dump_json
 
 def build_filename_lookup(agreements_json_path: str):
-    with open(agreements_json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_json(agreements_json_path)
 
     lookup = {}
 
@@ -15,6 +14,7 @@ def build_filename_lookup(agreements_json_path: str):
             "agreement_id": payload["agreement_id"],
             "amendment_id": "",
             "record_no": payload.get("record_no", ""),
+            "effective_date": payload.get("effective_date", ""),
             "customer_id": payload.get("customer_id", ""),
             "customer_name": payload.get("customer_name", "")
         }
@@ -25,6 +25,7 @@ def build_filename_lookup(agreements_json_path: str):
             "agreement_id": payload["agreement_id"],
             "amendment_id": payload["amendment_id"],
             "record_no": payload.get("record_no", ""),
+            "effective_date": payload.get("effective_date", ""),
             "customer_id": payload.get("customer_id", ""),
             "customer_name": payload.get("customer_name", "")
         }
@@ -51,14 +52,51 @@ def extract_clauses_from_md(md_path: Path):
 from collections import defaultdict
 from pathlib import Path
 
-def build_clause_json(md_folder: str, agreements_json_path: str):
+from build_manifest import BuildManifest
+from create_metadata_json import to_iso
+from versioning import VersionIndex, version_order
+
+CLAUSE_JSON_VERSION = "clause-json-1"
+
+def effective_iso(date_str: str) -> str:
+    # Unknown or unparseable dates order before every dated version
+    try:
+        return to_iso(date_str) if date_str.strip() else ""
+    except ValueError:
+        return ""
+
+def load_previous_clauses(clauses_json_path: str):
+    """
+    Group the clauses of a previous run by source markdown file so unchanged
+    files can be reused without re-reading them.
+    """
+    if not Path(clauses_json_path).exists():
+        return {}
+    previous = load_json(clauses_json_path)
+
+    by_file = defaultdict(list)
+    for c in previous.get("clause", []):
+        payload = c["payload"]
+        by_file[payload["filename"].replace(".PDF", ".md")].append({
+            "clause_title": payload["clause_title"],
+            "text": payload["clause_text"]
+        })
+    return by_file
+
+def build_clause_json(md_folder: str, agreements_json_path: str, previous_clauses_path: str = None,
+                      manifest: BuildManifest = None):
     filename_lookup = build_filename_lookup(agreements_json_path)
+    previous_clauses = load_previous_clauses(previous_clauses_path) if previous_clauses_path else {}
     clauses_out = []
 
     # (agreement_id, normalized_title) → counter
     clause_counters = defaultdict(int)
+    # ✅ Only the latest version per (agreement_id, clause_title) is current
+    versions = VersionIndex()
+    reused = 0
 
-    for md_file in Path(md_folder).glob("*.md"):
+    # Sorted so clause versions do not depend on filesystem order
+    for md_file in sorted(Path(md_folder).glob("*.md")):
         filename = md_file.name
 
         if filename not in filename_lookup:
@@ -66,8 +104,19 @@ def build_clause_json(md_folder: str, agreements_json_path: str):
 
         meta = filename_lookup[filename]
         agreement_id = meta["agreement_id"]
-
-        extracted_clauses = extract_clauses_from_md(md_file)
+        order = version_order(effective_iso(meta["effective_date"]), meta["record_no"])
+
+        # Only re-extract clause files that changed since the last build
+        if manifest is not None:
+            source_hash = manifest.file_hash(md_file)
+            if filename in previous_clauses and manifest.is_current("clause_json", filename, source_hash, CLAUSE_JSON_VERSION):
+                extracted_clauses = previous_clauses[filename]
+                reused += 1
+            else:
+                extracted_clauses = extract_clauses_from_md(md_file)
+                manifest.record("clause_json", filename, source_hash, CLAUSE_JSON_VERSION, commit=False)
+        else:
+            extracted_clauses = extract_clauses_from_md(md_file)
 
         for cl in extracted_clauses:
             normalized_title = cl["clause_title"].strip().lower()
@@ -80,7 +129,7 @@ def build_clause_json(md_folder: str, agreements_json_path: str):
 
             clause_id = f"CL-{safe_title}-{version:03d}"
 
-            clauses_out.append({
+            clause = {
                 "id": f"CL|{agreement_id}|{clause_id}",
                 "vector": [0.0],
                 "payload": {
@@ -91,34 +140,32 @@ def build_clause_json(md_folder: str, agreements_json_path: str):
                     "record_no": meta["record_no"],
                     "doc_type": "clause",
                     "clause_title": cl["clause_title"],
-                    "is_current": True,  # corrected later
+                    "is_current": True,  # set by VersionIndex
                     "customer_id": meta["customer_id"],
                     "customer_name": meta["customer_name"],
                     "clause_text": cl["text"]
                 }
-            })
-
-    # ✅ Mark only latest version per (agreement_id, clause_title) as current
-    latest = {}
-
-    for c in clauses_out:
-        key = (c["payload"]["agreement_id"], c["payload"]["clause_title"].lower())
-        latest[key] = c
+            }
+            versions.add(counter_key, order, clause["payload"])
+            clauses_out.append(clause)
 
-    for c in clauses_out:
-        key = (c["payload"]["agreement_id"], c["payload"]["clause_title"].lower())
-        c["payload"]["is_current"] = (c is latest[key])
+    if manifest is not None:
+        print(f"⏭️ Reused clauses of {reused} unchanged files")
 
     return {"clause": clauses_out}
 
 
 
+manifest = BuildManifest()
 clause_json = build_clause_json(
     md_folder="pdfs_clauses",
-    agreements_json_path="agreements_and_amendments.json"
+    agreements_json_path="agreements_and_amendments.json",
+    previous_clauses_path="clauses.json",
+    manifest=manifest
 )
 
-with open("clauses.json", "w", encoding="utf-8") as f:
-    json.dump(clause_json, f, indent=4, ensure_ascii=False)
+dump_json(clause_json, "clauses.json")
+# Commit the manifest only once clauses.json reflects it
+manifest.close()
 
 print(f"✅ Saved {len(clause_json['clause'])} clauses")
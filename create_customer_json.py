@@ -1,73 +1,71 @@
 import pandas as pd
 from pathlib import Path
-import json
 
-import pandas as pd
-import json
-
-def build_customers_json(excel_path: str):
-    # Force string dtype to preserve leading zeros
-    df = pd.read_excel(excel_path, dtype=str).fillna("")
+from json_store import dump_json
 
-    customers = {}
+CHILD_FIELDS = ["indiv_id", "shipto_id", "name", "type"]
 
-    for _, row in df.iterrows():
-        parent_ucn = row["M_SUPER_PARNT_UNI_CUST_NO"].strip()
-        parent_name = row.get("IDN_NAME", "").strip()
+def build_customer_children(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per distinct child of each parent IDN: every individual UCN,
+    then every ship-to UCN, in sheet order. A child already listed under
+    the same UCN and name (e.g. an individual that is its own ship-to) is
+    not repeated.
+    """
+    def column(name: str) -> pd.Series:
+        return df[name].str.strip() if name in df.columns else pd.Series("", index=df.index)
 
-        indiv_ucn = row.get("INDIV_UCN", "").strip()
-        indiv_name = row.get("CUST_LN1_NM", "").strip()
+    parent_ucn = column("M_SUPER_PARNT_UNI_CUST_NO")
+    indiv_ucn = column("INDIV_UCN")
+    name = column("CUST_LN1_NM")
+    shipto_ucn = column("MEMBER_SHIPTO_UCN")
+    row_order = pd.Series(range(len(df)), index=df.index)
 
-        shipto_ucn = row.get("MEMBER_SHIPTO_UCN", "").strip()
-        shipto_name = row.get("CUST_LN1_NM", "").strip()
+    individuals = pd.DataFrame({
+        "parent_ucn": parent_ucn, "indiv_id": indiv_ucn, "shipto_id": indiv_ucn,
+        "name": name, "type": "Individual", "order": 2 * row_order,
+    })[indiv_ucn != ""]
+    shiptos = pd.DataFrame({
+        "parent_ucn": parent_ucn, "indiv_id": indiv_ucn, "shipto_id": shipto_ucn,
+        "name": name, "type": "Ship-to", "order": 2 * row_order + 1,
+    })[shipto_ucn != ""]
 
-        # Initialize parent if not seen
-        if parent_ucn not in customers:
-            customers[parent_ucn] = {
-                "id": f"CUST-{parent_ucn}",
-                "vector": [0.0],
-                "payload": {
-                    "doc_type": "customer",
-                    "type": "parent",
-                    "customer_id": parent_ucn,
-                    "customer_name": parent_name,
-                    "customer_type": "Parent",
-                    "children": [],
-                }
-            }
+    children = pd.concat([individuals, shiptos]).sort_values("order", kind="stable")
+    return children.drop_duplicates(["parent_ucn", "shipto_id", "name"])
 
-        children = customers[parent_ucn]["payload"]["children"]
+def build_customers_json(excel_path: str):
+    # Force string dtype to preserve leading zeros
+    df = pd.read_excel(excel_path, dtype=str).fillna("")
+    df["M_SUPER_PARNT_UNI_CUST_NO"] = df["M_SUPER_PARNT_UNI_CUST_NO"].str.strip()
+    if "IDN_NAME" not in df.columns:
+        df["IDN_NAME"] = ""
 
-        # Add INDIV node
-        if indiv_ucn:
-            indiv_entry = {
-                "indiv_id": indiv_ucn,
-                "shipto_id": indiv_ucn,
-                "name": indiv_name,
-                "type": "Individual"
+    # First row of each parent names it
+    parents = df.drop_duplicates("M_SUPER_PARNT_UNI_CUST_NO")
+    customers = {}
+    for parent_ucn, parent_name in zip(parents["M_SUPER_PARNT_UNI_CUST_NO"], parents["IDN_NAME"].str.strip()):
+        customers[parent_ucn] = {
+            "id": f"CUST-{parent_ucn}",
+            "vector": [0.0],
+            "payload": {
+                "doc_type": "customer",
+                "type": "parent",
+                "customer_id": parent_ucn,
+                "customer_name": parent_name,
+                "customer_type": "Parent",
+                "children": [],
             }
-            indiv_entry = str(indiv_ucn) + "," + str(indiv_name)
-            if indiv_entry not in children:
-                children.append(indiv_entry)
+        }
 
-        # Add SHIP-TO node
-        if shipto_ucn:
-            shipto_entry = {
-                "indiv_id": indiv_ucn,
-                "shipto_id": shipto_ucn,
-                "name": shipto_name,
-                "type": "Ship-to"
-            }
-            shipto_entry = str(shipto_ucn) + "," + str(shipto_name)
-            if shipto_entry not in children:
-                children.append(shipto_entry)
+    children = build_customer_children(df)
+    for parent_ucn, *child in zip(children["parent_ucn"], *(children[f] for f in CHILD_FIELDS)):
+        customers[parent_ucn]["payload"]["children"].append(dict(zip(CHILD_FIELDS, child)))
 
     final_json = {
         "customers": list(customers.values())
     }
 
-    with open("customers.json", "w", encoding="utf-8") as f:
-        json.dump(final_json, f, ensure_ascii=False, indent=4)
+    dump_json(final_json, "customers.json")
 
     print(f"✅ Saved {len(final_json['customers'])} customers")
     return final_json
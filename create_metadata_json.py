@@ -1,117 +1,126 @@
+import os
+import re
+import sys
 from collections import defaultdict
-from datetime import datetime, timezone
-import json
 
-def to_iso(date_str: str) -> str:
-    """
-    Convert multiple date formats to ISO-8601 UTC.
-    """
-    date_str = date_str.strip()
-
-    formats = [
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%d",
-        "%m/%d/%Y",
-        "%m/%d/%y"
-    ]
-
-    for fmt in formats:
-        try:
-            dt = datetime.strptime(date_str, fmt)
-            return dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-        except ValueError:
+from json_store import load_json, dump_json
+
+# metadata/ modules import date_parsing by bare name; import it the same way so it (and its cache) loads once
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "metadata"))
+from date_parsing import to_iso
+from versioning import VersionIndex, version_order
+
+def metadata_key(payload: dict) -> tuple:
+    return (payload["agreement_id"], payload["meta_field"])
+
+def metadata_order(payload: dict) -> tuple:
+    # metadata.json files written before source_effective_date existed sort as unknown dates
+    return version_order(payload.get("source_effective_date", ""), payload.get("record_no", ""))
+
+def metadata_records(section: str, item: dict, meta_counters: dict):
+    """Yield the metadata records of one agreement or amendment."""
+    payload = item["payload"]
+    type_amendment = payload.get("type_amendment", [])
+    if "ext" not in type_amendment and section == "amendment":
+        return  # only extract metadata from extension amendments
+
+    agreement_id = payload.get("agreement_id")
+    amendment_id = payload.get("amendment_id", "")
+    clause_id = payload.get("clause_id", "")  # optional
+
+    record_no = payload.get("record_no", "")
+    filename = payload.get("filename", "")
+    customer_id = payload.get("customer_id", "")
+    customer_name = payload.get("customer_name", "")
+    title = payload.get("title", "")
+    effective_date = payload.get("effective_date", "")
+    source_effective_date = to_iso(effective_date) if effective_date.strip() else ""
+
+    for meta_field in ["effective_date", "end_date"]:
+        # if meta_field not in payload or not payload[meta_field]:
+        #     continue
+
+        meta_counters[(agreement_id, meta_field)] += 1
+        version = meta_counters[(agreement_id, meta_field)]
+
+        # Extract end date from title this format 4/30/2024 or 4/30/24 
+        end_date_match = re.search(r"(\d{1,2}/\d{1,2}/\d{2,4})", title)
+        if meta_field == "end_date" and end_date_match:
+            meta_value = end_date_match.group(1)
+        else:
+            meta_value = payload[meta_field]
+        
+        if meta_value.strip() == "":
             continue
 
-    raise ValueError(f"Unsupported date format: {date_str}")
+        metadata_id = f"{meta_field}-{version:03d}"
+
+        yield {
+            "id": f"META|{agreement_id}|{metadata_id}",
+            "vector": [0.0],
+            "payload": {
+                "metadata_id": metadata_id,
+                "amendment_id": amendment_id,
+                "agreement_id": agreement_id,
+                "doc_type": "metadata",
+                "record_no": record_no,
+                "filename": filename,
+                "meta_field": meta_field,
+                "meta_value": meta_value,
+                "meta_value_iso": to_iso(meta_value),
+                "source_effective_date": source_effective_date,
+                "is_current": True,  # set by VersionIndex
+                "customer_id": customer_id,
+                "customer_name": customer_name
+            }
+        }
 
 def build_metadata_from_contracts(contract_json: dict):
     metadata_out = []
 
     # (agreement_id, meta_field) → counter
     meta_counters = defaultdict(int)
+    # ✅ Only the latest version per (agreement_id, meta_field) is current
+    versions = VersionIndex()
 
     for section in ["agreement", "amendment"]:
         for item in contract_json.get(section, []):
-            payload = item["payload"]
-            type_amendment = payload.get("type_amendment", [])
-            if "ext" not in type_amendment and section == "amendment":
-                continue  # only extract metadata from extension amendments
-            
-            agreement_id = payload.get("agreement_id")
-            amendment_id = payload.get("amendment_id", "")
-            clause_id = payload.get("clause_id", "")  # optional
-
-            record_no = payload.get("record_no", "")
-            filename = payload.get("filename", "")
-            customer_id = payload.get("customer_id", "")
-            customer_name = payload.get("customer_name", "")
-            title = payload.get("title", "")
-
-            for meta_field in ["effective_date", "end_date"]:
-                # if meta_field not in payload or not payload[meta_field]:
-                #     continue
-
-                meta_counters[(agreement_id, meta_field)] += 1
-                version = meta_counters[(agreement_id, meta_field)]
-
-                # Extract end date from title this format 4/30/2024 or 4/30/24 
-                import re
-                end_date_match = re.search(r"(\d{1,2}/\d{1,2}/\d{2,4})", title)
-                if meta_field == "end_date" and end_date_match:
-                    meta_value = end_date_match.group(1)
-                else:
-                    meta_value = payload[meta_field]
-                
-                if meta_value.strip() == "":
-                    continue
-
-                metadata_id = f"{meta_field}-{version:03d}"
-
-                metadata_out.append({
-                    "id": f"META|{agreement_id}|{metadata_id}",
-                    "vector": [0.0],
-                    "payload": {
-                        "metadata_id": metadata_id,
-                        "amendment_id": amendment_id,
-                        "agreement_id": agreement_id,
-                        "doc_type": "metadata",
-                        "record_no": record_no,
-                        "filename": filename,
-                        "meta_field": meta_field,
-                        "meta_value": meta_value,
-                        "meta_value_iso": to_iso(meta_value),
-                        "is_current": True,  # fixed later
-                        "customer_id": customer_id,
-                        "customer_name": customer_name
-                    }
-                })
-
-    # ✅ Mark only latest version as current
-    latest = {}
-
-    for m in metadata_out:
-        key = (
-            m["payload"]["agreement_id"],
-            m["payload"]["meta_field"]
-        )
-        latest[key] = m
-
-    for m in metadata_out:
-        key = (
-            m["payload"]["agreement_id"],
-            m["payload"]["meta_field"]
-        )
-        m["payload"]["is_current"] = (m is latest[key])
-
-    with open("metadata.json", "w", encoding="utf-8") as f:
-        json.dump({"metadata": metadata_out}, f, ensure_ascii=False, indent=4)
+            for m in metadata_records(section, item, meta_counters):
+                versions.add(metadata_key(m["payload"]), metadata_order(m["payload"]), m["payload"])
+                metadata_out.append(m)
+
+    dump_json({"metadata": metadata_out}, "metadata.json")
     
     print(f"✅ Metadata entries: {len(metadata_out)}")
     return {"metadata": metadata_out}
 
-with open("agreements_and_amendments.json", "r", encoding="utf-8") as f:
-    agreements_and_amendments_json = json.load(f)
-    
-metadata_json = build_metadata_from_contracts(agreements_and_amendments_json)
+def add_amendment_metadata(metadata_json: dict, amendment_item: dict):
+    """
+    Add the metadata of one new amendment to an existing metadata.json
+    payload, superseding the versions it replaces, without rebuilding the
+    metadata of every other contract. Returns the added records.
+    """
+    metadata_out = metadata_json["metadata"]
+    payloads = [m["payload"] for m in metadata_out]
+    for p in payloads:
+        p.setdefault("source_effective_date", "")  # backfill files written before the field existed
+    versions = VersionIndex.from_payloads(payloads, metadata_key, metadata_order)
+
+    # Continue numbering after the highest existing version of each key
+    meta_counters = defaultdict(int)
+    for p in payloads:
+        key = metadata_key(p)
+        meta_counters[key] = max(meta_counters[key], int(p["metadata_id"].rsplit("-", 1)[1]))
+
+    added = list(metadata_records("amendment", amendment_item, meta_counters))
+    for m in added:
+        versions.add(metadata_key(m["payload"]), metadata_order(m["payload"]), m["payload"])
+        metadata_out.append(m)
+    return added
+
+if __name__ == "__main__":
+    agreements_and_amendments_json = load_json("agreements_and_amendments.json")
+
+    metadata_json = build_metadata_from_contracts(agreements_and_amendments_json)
 
-print(metadata_json["metadata"][0])
+    print(metadata_json["metadata"][0])
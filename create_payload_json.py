@@ -1,17 +1,13 @@
-import json
+from json_store import load_json, dump_sections
 
-with open('customers.json', 'r', encoding='utf-8') as f:
-    customers_payload = json.load(f)
+customers_payload = load_json('customers.json')
+
+agreements_and_amendments_payload = load_json('agreements_and_amendments.json')
+
+clauses_payload = load_json('clauses.json')
+
+metadata_payload = load_json('metadata.json')
 
-with open('agreements_and_amendments.json', 'r', encoding='utf-8') as f:
-    agreements_and_amendments_payload = json.load(f)
-    
-with open('clauses.json', 'r', encoding='utf-8') as f:
-    clauses_payload = json.load(f)  
-    
-with open('metadata.json', 'r', encoding='utf-8') as f:
-    metadata_payload = json.load(f)
-    
 final_payload = {
     "customers": customers_payload["customers"],
     "agreements": agreements_and_amendments_payload["agreement"],
@@ -22,5 +18,5 @@ final_payload = {
 
 print(f"✅ Final payload created with {len(final_payload['customers'])} customers, {len(final_payload['agreements'])} agreements, {len(final_payload['amendments'])} amendments, {len(final_payload['clauses'])} clauses, and {len(final_payload['metadata'])} metadata records.")
 print(f"✅ Total records in final payload: {len(final_payload['customers']) + len(final_payload['agreements']) + len(final_payload['amendments']) + len(final_payload['clauses']) + len(final_payload['metadata'])}")
-with open('payload.json', 'w', encoding='utf-8') as f:
-    json.dump(final_payload, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+# One record per line so ingestion can stream it
+dump_sections(final_payload, 'payload.jsonl')
@@ -62,6 +62,10 @@ import os
 import re
 from pathlib import Path
 
+from build_manifest import BuildManifest
+
+EXTRACTOR_VERSION = "numbered-clauses-1"
+
 def extract_numbered_clauses(text: str) -> list[dict]:
     """
     Extract clauses that start with numbered headings like:
@@ -128,12 +132,25 @@ def run_extract(filename: str):
             f.write(f"## {clause['clause_number']}. {clause['heading']}\n\n")
             f.write(f"{clause['text']}\n\n")
     print(f"✅ Extracted {len(clauses)} clauses from {filename} to {output_dir / output_file}")
+    return output_dir / output_file
             
 # filename = "896307.md"
 # run_extract(filename)
 
-files = os.listdir("pdfs_md")
-for file in files:
-    if file.endswith(".md"):
-        md_file = os.path.join("pdfs_md", file)
-        run_extract(md_file)
\ No newline at end of file
+if __name__ == "__main__":
+    # Only new or changed markdown files are re-extracted, see build_manifest.py
+    manifest = BuildManifest()
+    files = os.listdir("pdfs_md")
+    skipped = 0
+    for file in files:
+        if file.endswith(".md"):
+            md_file = os.path.join("pdfs_md", file)
+            source_hash = manifest.file_hash(md_file)
+            clause_file = os.path.join("pdfs_clauses", Path(file).stem + ".md")
+            if manifest.is_current("clauses", file, source_hash, EXTRACTOR_VERSION, clause_file):
+                skipped += 1
+                continue
+            clause_file = run_extract(md_file)
+            manifest.record("clauses", file, source_hash, EXTRACTOR_VERSION, manifest.file_hash(clause_file))
+    manifest.close()
+    print(f"⏭️ Skipped {skipped} unchanged markdown files")
\ No newline at end of file
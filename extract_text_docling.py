@@ -23,11 +23,20 @@ def clean_markdown(md: str) -> str:
     md = re.sub(r'\n\s*\n\s*\n+', '\n\n', md)  # 2+ blank lines → 1
     return md.strip()
  
+_converter = None
+
+def get_converter() -> DocumentConverter:
+    """Build the docling converter once; its layout models are large."""
+    global _converter
+    if _converter is None:
+        _converter = DocumentConverter()
+    return _converter
+
 def convert_pdf_to_markdown(pdf_path: str):
     """Convert PDF and return clean structured markdown including tables."""
    
-    converter = DocumentConverter()
-    result = converter.convert(pdf_path)
+    # Pass the path (not bytes) so docling reads the file itself
+    result = get_converter().convert(pdf_path)
  
     md = result.document.export_to_markdown()
  
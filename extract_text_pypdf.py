@@ -2,11 +2,12 @@ from pypdf import PdfReader
 from pathlib import Path
 import os
 
-def extract_text_pypdf(pdf_path: str) -> str:
-    """
-    Fast text extraction for text-based PDFs using pypdf.
-    Returns combined text from all pages.
-    """
+from build_manifest import BuildManifest
+
+EXTRACTOR_VERSION = "pypdf-1"
+
+def read_pdf_pages(pdf_path: str) -> list[str]:
+    """Return the non-empty text of every page of a text-based PDF."""
     reader = PdfReader(pdf_path)
     pages_text = []
 
@@ -17,6 +18,14 @@ def extract_text_pypdf(pdf_path: str) -> str:
                 pages_text.append(text)
         except Exception as e:
             print(f"⚠️ Page {i+1} failed: {e}")
+    return pages_text
+
+def extract_text_pypdf(pdf_path: str) -> str:
+    """
+    Fast text extraction for text-based PDFs using pypdf.
+    Returns combined text from all pages.
+    """
+    pages_text = read_pdf_pages(pdf_path)
 
     # Save as md file to
     outptut_dir = Path("pdfs_md")
@@ -26,13 +35,26 @@ def extract_text_pypdf(pdf_path: str) -> str:
         f.write("\n\n".join(pages_text))
         
     print(f"✅ Extracted {len(pages_text)} pages from {pdf_path} to {outptut_dir / filename}")
+    return outptut_dir / filename
 
-# Get all pdfs from pdfs folder using pathlib
-pdfs = os.listdir("pdfs")
-for pdf in pdfs:
-    if pdf.endswith(".pdf"):
-        pdf_file = os.path.join("pdfs", pdf)
-        extract_text_pypdf(pdf_file)
+if __name__ == "__main__":
+    # Get all pdfs from pdfs folder using pathlib
+    # Only new or changed PDFs are re-extracted, see build_manifest.py
+    manifest = BuildManifest()
+    pdfs = os.listdir("pdfs")
+    skipped = 0
+    for pdf in pdfs:
+        if pdf.endswith(".pdf"):
+            pdf_file = os.path.join("pdfs", pdf)
+            source_hash = manifest.file_hash(pdf_file)
+            md_file = os.path.join("pdfs_md", Path(pdf).stem + ".md")
+            if manifest.is_current("pdf_md", pdf, source_hash, EXTRACTOR_VERSION, md_file):
+                skipped += 1
+                continue
+            md_file = extract_text_pypdf(pdf_file)
+            manifest.record("pdf_md", pdf, source_hash, EXTRACTOR_VERSION, manifest.file_hash(md_file))
+    manifest.close()
+    print(f"⏭️ Skipped {skipped} unchanged PDFs")
 
 # pdf_file = r"1008315.pdf"
 # extract_text_pypdf(pdf_file)
\ No newline at end of file
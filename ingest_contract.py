@@ -5,13 +5,21 @@ from qdrant_client.models import (
     Distance,
     PayloadSchemaType,
     PointStruct,
+    PointIdsList,
+    FilterSelector,
+    Filter,
+    FieldCondition,
+    MatchAny,
     TextIndexParams,
     TokenizerType
 )
 from typing import List
 from datetime import datetime
 import uuid
-import json
+
+from build_manifest import BuildManifest
+from json_store import iter_sections
+from clause_chunker import chunk_clause, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
 
 from langchain_openai import AzureOpenAIEmbeddings
 from tenacity import retry, stop_after_attempt, wait_exponential
@@ -22,6 +30,8 @@ URL = config.get('QDRANT', 'URL')
 API_KEY = config.get('QDRANT', 'API_KEY')
 
 COLLECTION = config.get('QDRANT', 'COLLECTION')
+CHUNK_MAX_TOKENS = config.getint('CHUNKING', 'MAX_TOKENS', fallback=CHUNK_MAX_TOKENS)
+CHUNK_OVERLAP_TOKENS = config.getint('CHUNKING', 'OVERLAP_TOKENS', fallback=CHUNK_OVERLAP_TOKENS)
 
 azure_endpoint_url=config["DEFAULT"]["azure_llm_gpt35_url"],
 azure_api_key=config["DEFAULT"]["azure_api_key"]
@@ -41,8 +51,6 @@ qdrant_token = config["DEFAULT"]["qdrantToken"]
 qdrant_client = QdrantClient(
     url=url, api_key=qdrant_token, prefer_grpc=False, https=True, timeout=3600
 )
-with open('payload.json', 'r', encoding='utf-8') as f:
-    payload = json.load(f)
 
 def create_collection_if_not_exists(collection_name: str):
     existing_collections = qdrant_client.get_collections().collections
@@ -68,7 +76,10 @@ def create_payload_indexes():
         "clause_title",
         "amendment_id",
         "template_id",
-        "meta_field"
+        "meta_field",
+        "parent_id",
+        "children[].indiv_id",
+        "children[].shipto_id"
     ]
     TEXT_FIELDS = [
         "text",
@@ -122,85 +133,199 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
 EMBED_BATCH_SIZE = 16
 UPSERT_BATCH_SIZE = 200
 VECTOR_DIM = 1536
+POINTS_VERSION = "points-2"
+
+def point_id(record_id: str) -> str:
+    # Deterministic so re-ingesting a changed record overwrites its point
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, record_id))
 
-def flush_points(points_buffer: List[PointStruct]):
+def flush_points(points_buffer: List[PointStruct], manifest: BuildManifest = None, pending: list = None):
     qdrant_client.upsert(
         collection_name=COLLECTION,
         points=points_buffer
     )
     print(f"⬆️ Upserted {len(points_buffer)} points")
     points_buffer.clear()
+    # Only mark records as ingested once Qdrant has accepted them
+    if manifest is not None and pending:
+        for record_id, source_hash in pending:
+            manifest.record("points", record_id, source_hash, POINTS_VERSION, commit=False)
+        manifest.commit()
+        pending.clear()
+
+def delete_record_points(record_ids):
+    """Delete the points of records, including every chunk point of a clause."""
+    record_ids = list(record_ids)
+    qdrant_client.delete(
+        collection_name=COLLECTION,
+        points_selector=PointIdsList(points=[point_id(r) for r in record_ids])
+    )
+    qdrant_client.delete(
+        collection_name=COLLECTION,
+        points_selector=FilterSelector(
+            filter=Filter(must=[FieldCondition(key="parent_id", match=MatchAny(any=record_ids))])
+        )
+    )
+
+def delete_legacy_points():
+    """
+    Delete the points of ingestions that predate the manifest: their ids were
+    random (uuid4) rather than point_id(), so re-ingesting would duplicate
+    them instead of overwriting them.
+    """
+    legacy = []
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=COLLECTION, limit=UPSERT_BATCH_SIZE, offset=offset,
+            with_payload=False, with_vectors=False
+        )
+        legacy.extend(p.id for p in points if not _is_point_id(p.id))
+        if offset is None:
+            break
+    for i in range(0, len(legacy), UPSERT_BATCH_SIZE):
+        qdrant_client.delete(
+            collection_name=COLLECTION,
+            points_selector=PointIdsList(points=legacy[i:i + UPSERT_BATCH_SIZE])
+        )
+    print(f"🗑️ Deleted {len(legacy)} points with pre-manifest ids")
+
+def _is_point_id(value) -> bool:
+    try:
+        return uuid.UUID(str(value)).version == 5
+    except ValueError:
+        return False
 
-def ingest_payload(payload: dict):
+def delete_stale_points(manifest: BuildManifest, live_ids: set):
+    stale = manifest.docs("points") - live_ids
+    if not stale:
+        return
+    delete_record_points(stale)
+    manifest.forget("points", stale)
+    print(f"🗑️ Deleted {len(stale)} stale points")
+
+def ingest_payload(records, manifest: BuildManifest = None):
+    """
+    Embed and upsert every (category, record) pair of the payload, as yielded
+    by json_store.iter_sections. With a manifest only records whose payload
+    changed since the last ingestion are embedded and upserted, and points
+    whose record disappeared from the payload are deleted. The first run with
+    a manifest also deletes the points of earlier, manifest-less ingestions.
+
+    Clauses longer than CHUNK_MAX_TOKENS are embedded as overlapping chunks,
+    one point per chunk. Every clause point carries the clause record id in
+    `parent_id` and the full clause in `clause_text`; the embedded chunk is in
+    `chunk_text`.
+    """
     points_buffer: List[PointStruct] = []
+    pending = []
 
     clause_texts = []
     clause_payloads = []
+    clause_keys = []
+    changed_clauses = []
+    live_ids = set()
+    skipped = 0
+    known_ids = manifest.docs("points") if manifest is not None else set()
+    if manifest is not None and not known_ids:
+        # First ingestion with a manifest: clear the points earlier ingestions left under random ids
+        delete_legacy_points()
 
     # 1️⃣ Collect clause texts first (for batched embeddings)
-    for category, items in payload.items():
-        if category == "clauses":
-            for item in items:
-                payload_data = item["payload"]
+    for category, item in records:
+        payload_data = item["payload"]
+        live_ids.add(item["id"])
+        source_hash = BuildManifest.payload_hash(payload_data)
+        if manifest is not None and manifest.is_current("points", item["id"], source_hash, POINTS_VERSION):
+            skipped += 1
+            continue
 
-                for k, v in payload_data.items():
-                    if isinstance(v, list):
-                        payload_data[k] = ", ".join(v).lower().strip()
-                    elif isinstance(v, str):
-                        payload_data[k] = v.lower().strip()
+        # Chunk boundaries need the original casing (sentences start upper-case)
+        clause_text = payload_data.get("clause_text") if category == "clauses" else None
 
-                clause_texts.append(payload_data["clause_text"])
-                clause_payloads.append(payload_data)
+        for k, v in payload_data.items():
+            if isinstance(v, list) and v and isinstance(v[0], dict):
+                # Structured lists (customer children) stay filterable as nested payload
+                payload_data[k] = [
+                    {ck: cv.lower().strip() if isinstance(cv, str) else cv for ck, cv in entry.items()}
+                    for entry in v
+                ]
+            elif isinstance(v, list):
+                payload_data[k] = ", ".join(v).lower().strip()
+            elif isinstance(v, str):
+                payload_data[k] = v.lower().strip()
+
+        if category == "clauses":
+            if item["id"] in known_ids:
+                changed_clauses.append(item["id"])
+
+            chunks = [chunk.lower() for chunk in chunk_clause(clause_text.strip(), CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)]
+            for n, chunk in enumerate(chunks):
+                chunk_payload = dict(payload_data)
+                chunk_payload["parent_id"] = item["id"]
+                chunk_payload["chunk_index"] = n
+                chunk_payload["chunk_count"] = len(chunks)
+                chunk_payload["chunk_text"] = chunk
+                clause_texts.append(chunk)
+                clause_payloads.append(chunk_payload)
+                # A clause is recorded as ingested with its last chunk
+                last = n == len(chunks) - 1
+                chunk_id = item["id"] if len(chunks) == 1 else f"{item['id']}#chunk-{n}"
+                clause_keys.append((chunk_id, (item["id"], source_hash) if last else None))
 
         else:
             # Non-embedded payloads
-            for item in items:
-                payload_data = item["payload"]
-
-                for k, v in payload_data.items():
-                    if isinstance(v, list):
-                        payload_data[k] = ", ".join(v).lower().strip()
-                    elif isinstance(v, str):
-                        payload_data[k] = v.lower().strip()
-
-                points_buffer.append(
-                    PointStruct(
-                        id=str(uuid.uuid4()),
-                        vector=[0.0] * VECTOR_DIM,
-                        payload=payload_data
-                    )
+            points_buffer.append(
+                PointStruct(
+                    id=point_id(item["id"]),
+                    vector=[0.0] * VECTOR_DIM,
+                    payload=payload_data
                 )
+            )
+            pending.append((item["id"], source_hash))
+
+            if len(points_buffer) >= UPSERT_BATCH_SIZE:
+                flush_points(points_buffer, manifest, pending)
+
+    # Chunk counts may have changed: drop the old points of re-ingested clauses
+    if changed_clauses:
+        delete_record_points(changed_clauses)
 
-                if len(points_buffer) >= UPSERT_BATCH_SIZE:
-                    flush_points(points_buffer)
-                    pass
-                
     # 2️⃣ Generate embeddings in batches
     for i in range(0, len(clause_texts), EMBED_BATCH_SIZE):
         batch_texts = clause_texts[i:i + EMBED_BATCH_SIZE]
         batch_payloads = clause_payloads[i:i + EMBED_BATCH_SIZE]
+        batch_keys = clause_keys[i:i + EMBED_BATCH_SIZE]
 
         vectors = get_embeddings(batch_texts)
 
-        for vector, payload_data in zip(vectors, batch_payloads):
+        for vector, payload_data, key in zip(vectors, batch_payloads, batch_keys):
             points_buffer.append(
                 PointStruct(
-                    id=str(uuid.uuid4()),
+                    id=point_id(key[0]),
                     vector=vector,
                     payload=payload_data
                 )
             )
+            if key[1] is not None:
+                pending.append(key[1])
 
         if len(points_buffer) >= UPSERT_BATCH_SIZE:
-            flush_points(points_buffer)
+            flush_points(points_buffer, manifest, pending)
 
     # 3️⃣ Final flush
     if points_buffer:
-        flush_points(points_buffer)
+        flush_points(points_buffer, manifest, pending)
+
+    if manifest is not None:
+        delete_stale_points(manifest, live_ids)
+        print(f"⏭️ Skipped {skipped} unchanged records")
 
     print("✅ Ingestion completed successfully")
 # create_collection_if_not_exists(COLLECTION)
 # create_payload_indexes()
-ingest_payload(payload)
+manifest = BuildManifest()
+ingest_payload(iter_sections('payload.jsonl'), manifest)
+manifest.close()
 # col = qdrant_client.get_collections()
 # print("Collections:", col)
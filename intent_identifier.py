@@ -13,6 +13,7 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from fastapi import Request
 from prompt import build_prompt
+from clause_chunker import collapse_chunks
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -168,12 +169,14 @@ async def query_qdrant(request: Request):
             query_filter=qdrant_filter,
             limit=100
         )
+        result = collapse_chunks(result)
     else:
         result, _ = qdrant_client.scroll(
             collection_name=COLLECTION,
             scroll_filter=qdrant_filter,
             limit=1000
         )
+        result = collapse_chunks(result)
     formatted_result = format_results(result)
     return formatted_result
 
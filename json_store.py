@@ -0,0 +1,77 @@
+import os
+import json
+from pathlib import Path
+from typing import Iterator, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Set PRETTY_JSON=1 to get indented, human-readable output from the builders
+PRETTY_JSON = os.environ.get("PRETTY_JSON", "") == "1"
+
+
+def _dumps(obj, pretty: bool = False) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if pretty else 0
+        return orjson.dumps(obj, option=option | orjson.OPT_SERIALIZE_NUMPY, default=str)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_json(obj, path, pretty: bool = None):
+    """Write obj to path as compact JSON (indented if pretty, or PRETTY_JSON is set)."""
+    if pretty is None:
+        pretty = PRETTY_JSON
+    with open(path, "wb") as f:
+        f.write(_dumps(obj, pretty))
+
+
+def load_json(path):
+    with open(path, "rb") as f:
+        return _loads(f.read())
+
+
+def dump_sections(sections: dict, path, pretty: bool = None):
+    """
+    Write a {section: [record, ...]} mapping. A .jsonl path gets one
+    {"section": ..., "record": ...} object per line so readers can stream it;
+    any other path is written as a single JSON document.
+    """
+    if Path(path).suffix != ".jsonl":
+        dump_json(sections, path, pretty)
+        return
+    with open(path, "wb") as f:
+        for section, records in sections.items():
+            for record in records:
+                f.write(_dumps({"section": section, "record": record}))
+                f.write(b"\n")
+
+
+def iter_sections(path) -> Iterator[Tuple[str, dict]]:
+    """Yield (section, record) pairs. JSONL files are read one line at a time."""
+    if Path(path).suffix != ".jsonl":
+        for section, records in load_json(path).items():
+            for record in records:
+                yield section, record
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                row = _loads(line)
+                yield row["section"], row["record"]
+
+
+def load_sections(path) -> dict:
+    sections = {}
+    for section, record in iter_sections(path):
+        sections.setdefault(section, []).append(record)
+    return sections
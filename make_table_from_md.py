@@ -43,6 +43,7 @@ table_text = """| Participant                                             | Desc
 | Ogallala Community Hospital                             | Joint Reconstruction Products         | 5/8/2018     | 5/31/2021  |
 | Melissa Memorial Hospital                               | Mitek Sports Medicine Products        | 9/18/2019    | 9/17/2022  |"""
 import pandas as pd
+from pathlib import Path
 
 def markdown_table_to_df(md_text: str) -> pd.DataFrame:
     rows = []
@@ -68,9 +69,82 @@ def markdown_table_to_df(md_text: str) -> pd.DataFrame:
 
     return df
 
-df = markdown_table_to_df(table_text)
-print(df)
+ESCAPED_PIPE = "\x00"
+TABLE_KEYS = ["document", "table_index", "in_extracted_tables", "row_index"]
 
+def markdown_tables_from_lines(lines: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parse every pipe table in `lines` (columns: document, line) into one long
+    DataFrame with a row per cell: document, table_index, in_extracted_tables,
+    row_index, column_index, column_name, value.
 
-with pd.ExcelWriter("table.xlsx", engine="openpyxl") as writer:
-    df.to_excel(writer, index=False, sheet_name="Table2")
+    All documents are processed together with pandas string ops; ragged rows
+    are padded with "" and cells beyond the header get a positional name.
+    """
+    text = lines["line"].str.strip()
+    is_table = text.str.startswith("|")
+    same_doc = lines["document"].eq(lines["document"].shift())
+
+    # Everything after docling's "# Extracted Tables" heading
+    lines = lines.assign(
+        in_extracted_tables=text.eq("# Extracted Tables").groupby(lines["document"]).cummax(),
+        table_id=(is_table & ~(is_table.shift(fill_value=False) & same_doc)).cumsum()
+    )
+
+    tables = lines[is_table].copy()
+    tables["line"] = text[is_table].str.replace("\\|", ESCAPED_PIPE, regex=False)
+    # Drop separator rows like |---|:---:|
+    tables = tables[~tables["line"].str.fullmatch(r"[\s|:\-]+")]
+    if tables.empty:
+        return pd.DataFrame(columns=TABLE_KEYS + ["column_index", "column_name", "value"])
+
+    tables["table_index"] = tables.groupby("document")["table_id"].rank(method="dense").astype(int) - 1
+    tables["row_index"] = tables.groupby("table_id").cumcount()
+
+    cells = tables["line"].str.slice(1).str.removesuffix("|").str.split("|", expand=True)
+    cells = pd.concat([tables[["table_id"] + TABLE_KEYS], cells], axis=1)
+
+    long = cells.melt(id_vars=["table_id"] + TABLE_KEYS, var_name="column_index", value_name="value")
+    long["value"] = long["value"].str.strip().str.replace(ESCAPED_PIPE, "|", regex=False)
+
+    header = (
+        long[long["row_index"] == 0][["table_id", "column_index", "value"]]
+        .rename(columns={"value": "column_name"})
+    )
+    long = long[long["row_index"] > 0].merge(header, on=["table_id", "column_index"], how="left")
+
+    # Cells past the end of both the header and the row are padding from expand=True
+    long = long[long["value"].notna() | long["column_name"].notna()]
+    long["column_name"] = long["column_name"].fillna("col_" + long["column_index"].astype(str))
+    long["value"] = long["value"].fillna("")
+
+    return (
+        long[TABLE_KEYS + ["column_index", "column_name", "value"]]
+        .sort_values(TABLE_KEYS + ["column_index"])
+        .reset_index(drop=True)
+    )
+
+def extract_markdown_tables(md_folder: str, output_parquet: str) -> pd.DataFrame:
+    """Scan every markdown file in `md_folder` and write all pipe tables to Parquet."""
+    frames = []
+    for md_file in sorted(Path(md_folder).glob("*.md")):
+        file_lines = md_file.read_text(encoding="utf-8").splitlines()
+        frames.append(pd.DataFrame({"document": md_file.stem, "line": file_lines}))
+    if not frames:
+        print(f"⚠️ No markdown files found in {md_folder}")
+        return pd.DataFrame()
+
+    tables = markdown_tables_from_lines(pd.concat(frames, ignore_index=True))
+    tables.to_parquet(output_parquet, index=False)
+    n_tables = tables[["document", "table_index"]].drop_duplicates().shape[0]
+    print(f"✅ Saved {len(tables)} cells from {n_tables} tables in {len(frames)} documents to {output_parquet}")
+    return tables
+
+if __name__ == "__main__":
+    df = markdown_table_to_df(table_text)
+    print(df)
+
+    with pd.ExcelWriter("table.xlsx", engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="Table2")
+
+    extract_markdown_tables("pdfs_md", "markdown_tables.parquet")
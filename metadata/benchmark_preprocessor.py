@@ -0,0 +1,165 @@
+"""
+Benchmark of the metadata_preprocessor column mapping.
+
+Generates a synthetic TRIM search response (containers with their electronic
+child records), maps every child with the rule-interpreting loop
+metadata_preprocessor used to run and with the compiled map_record, checks
+both produce identical rows and reports records/sec for each.
+
+    python benchmark_preprocessor.py --containers 2000 --children 10
+"""
+import json
+import time
+import random
+import argparse
+
+from metadata_preprocessor import column_mapper, compile_column_mapper, format_value, get_value_from_path
+
+RECORD_TYPES = ["CONTRACT COMMERCIAL DOCUMENT", "CONTRACT PA DOCUMENT", "CONTRACT SUPPORTING DOCUMENT"]
+CONTRACT_TYPES = ["MASTER AGREEMENT", "REBATE", "PRICING LETTER", "LETTER OF PARTICIPATION", None]
+
+
+# ---------------------------
+# Payload generation
+# ---------------------------
+def _date(rng: random.Random) -> str:
+    return f"{rng.randint(2018, 2030)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00.0000000Z"
+
+
+def generate_results(n_containers: int, n_children: int, seed: int = 7) -> list:
+    """TRIM Results with n_containers containers of n_children records each."""
+    rng = random.Random(seed)
+    results = []
+    for c in range(n_containers):
+        container_number = f"{rng.randint(100000000, 999999999)}~{c:08d}"
+        results.append({
+            "Uri": 1_000_000 + c,
+            "RecordIsElectronic": {"Value": False},
+            "RecordNumber": {"Value": container_number},
+            "RecordTitle": {"Value": f"Customer {c}"},
+            "Fields": {
+                "JJContract": {"Value": f"JJ{c:06d}"},
+                "CustomerUCN": {"Value": f"{rng.randint(10000000, 99999999)}"},
+                "ContractType": {"Value": rng.choice(CONTRACT_TYPES)},
+                "ProductLineS": {"Value": "DePuy Synthes; Ethicon"},
+                "AmendmentS": {"Value": rng.choice(["", "Amendment 1"])},
+            },
+            "RecordDateClosed": {"DateTime": _date(rng)},
+        })
+        for n in range(1, n_children + 1):
+            record_number = f"{container_number}.{n:03d}"
+            related = "\r\n".join(f"{container_number}.{rng.randint(1, n_children):03d}" for _ in range(rng.randint(0, 3)))
+            results.append({
+                "Uri": 2_000_000 + c * n_children + n,
+                "RecordIsElectronic": {"Value": True},
+                "RecordNumber": {"Value": record_number},
+                "RecordTitle": {"Value": f" Contract {record_number}_x000D_ "},
+                "RecordExtension": {"Value": "pdf"},
+                "RecordContainer": {"RecordNumber": {"Value": container_number}, "RecordTitle": {"Value": f"Customer {c}"}},
+                "RecordRecordType": {"RecordTypeName": {"Value": rng.choice(RECORD_TYPES)}},
+                "Fields": {"ICS": {"Value": f"ICS{rng.randint(1000, 9999)}"}},
+                "RecordDateClosed": {"DateTime": _date(rng)},
+                "RecordDateCreated": {"DateTime": _date(rng)},
+                "RecordRevisionCount": {"Value": str(rng.randint(0, 5))},
+                "RecordCreator": {"NameString": "svc_trim"},
+                "RecordNotes": {"Value": "Scanned_x000D_\n_x000D_copy"},
+                "RecordKeywords": {"Value": "Pricing"},
+                "RecordRelatedRecs": {"Value": related},
+            })
+    return results
+
+
+def child_parent_pairs(results: list) -> list:
+    """(child, parent) pairs in the order metadata_preprocessor maps them."""
+    containers = {r["RecordNumber"]["Value"]: r for r in results if not r["RecordIsElectronic"]["Value"]}
+    return [(r, containers.get(r["RecordContainer"]["RecordNumber"]["Value"]))
+            for r in results if r["RecordIsElectronic"]["Value"]]
+
+
+# ---------------------------
+# Rule-interpreting reference
+# ---------------------------
+def interpret_rules(child, parent, counter: int) -> dict:
+    """One child row, mapped by walking column_mapper the way metadata_preprocessor used to."""
+    obj = {}
+    for rule in column_mapper:
+        if rule['is_system_generated']:
+            if rule["relative_path"] is None:
+                if rule['column_name'] == 'ContentID':
+                    obj[rule['column_name']] = f"{rule['default_value']}{str(counter).zfill(6)}"
+                else:
+                    obj[rule['column_name']] = format_value(rule, rule['default_value'])
+        elif rule['relative_path'] is None:
+            obj[rule['column_name']] = format_value(rule, rule['default_value'])
+        elif 'location' in rule and rule['location'] == 'PARENT':
+            val = get_value_from_path(parent, rule['relative_path'])
+            if rule['column_name'] == 'RecordNumber':
+                child_RecordNumber = child.get('RecordNumber', {}).get('Value', '')
+                obj[rule['column_name']] = format_value(rule, val) if child_RecordNumber.endswith('.001') else None
+            elif rule['column_name'] == 'Product_Lines':
+                if obj['Article_Number'].endswith('.001') and obj['Record_Type'] == 'CONTRACT COMMERCIAL DOCUMENT':
+                    obj[rule['column_name']] = format_value(rule, val)
+            elif rule['column_name'] == 'Amendments' and (val is None or len(val) == 0):
+                obj[rule['column_name']] = "NO"
+            else:
+                obj[rule['column_name']] = format_value(rule, val)
+        else:
+            val = get_value_from_path(child, rule['relative_path'])
+            if rule['column_name'] == 'RecordContainer_RecordNumber':
+                child_RecordNumber = child.get('RecordNumber', {}).get('Value', '')
+                obj[rule['column_name']] = format_value(rule, val) if not child_RecordNumber.endswith('.001') else None
+            elif rule['column_name'] == 'End_Date':
+                if obj['Record_Type'] == 'CONTRACT COMMERCIAL DOCUMENT':
+                    val = get_value_from_path(parent, rule['relative_path'])
+                obj[rule['column_name']] = format_value(rule, val)
+            else:
+                obj[rule['column_name']] = format_value(rule, val)
+    return obj
+
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+def time_mapper(mapper, pairs: list, repeat: int) -> tuple:
+    """(best records/sec over `repeat` runs, rows of the last run)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = [mapper(child, parent, counter) for counter, (child, parent) in enumerate(pairs, start=1)]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(pairs) / best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the metadata_preprocessor column mapping")
+    parser.add_argument("--containers", type=int, default=2000, help="Number of synthetic TRIM containers")
+    parser.add_argument("--children", type=int, default=10, help="Electronic records per container")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mapper, the fastest is reported")
+    parser.add_argument("--output", type=str, default="bench_preprocessor.json", help="JSON report path")
+    args = parser.parse_args()
+
+    pairs = child_parent_pairs(generate_results(args.containers, args.children))
+    interpreted_rate, interpreted_rows = time_mapper(interpret_rules, pairs, args.repeat)
+    compiled_rate, compiled_rows = time_mapper(compile_column_mapper(column_mapper), pairs, args.repeat)
+
+    identical = all(a == b and list(a) == list(b) for a, b in zip(interpreted_rows, compiled_rows))
+    report = {
+        "records": len(pairs),
+        "interpreted_records_per_sec": round(interpreted_rate, 1),
+        "compiled_records_per_sec": round(compiled_rate, 1),
+        "speedup": round(compiled_rate / interpreted_rate, 2),
+        "identical_rows": identical,
+    }
+    print(f"{'mapper':<12} {'records/sec':>12}")
+    print(f"{'interpreted':<12} {report['interpreted_records_per_sec']:>12,.1f}")
+    print(f"{'compiled':<12} {report['compiled_records_per_sec']:>12,.1f}")
+    print(f"speedup x{report['speedup']} over {report['records']:,} records, identical rows: {identical}")
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if not identical:
+        raise SystemExit("Compiled mapper output differs from the interpreted rules")
+
+
+if __name__ == "__main__":
+    main()
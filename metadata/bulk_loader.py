@@ -0,0 +1,145 @@
+"""
+Bulk loading of Excel extracts into the SQLite metadata store.
+
+Rows are staged into a temp table with executemany and merged into the
+target table with one UPDATE ... FROM and one INSERT of the unmatched rows
+per chunk, each chunk in its own transaction, instead of a SELECT and a
+commit per row. Keys are matched with IS, so NULL key columns match the
+way the per-row `col == None` lookups did.
+"""
+import time
+from datetime import datetime
+
+BULK_CHUNK_SIZE = 5000
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -200000,       # ~200 MB page cache
+    "mmap_size": 268435456,      # 256 MB
+    "busy_timeout": 30000,
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """SQLAlchemy 'connect' event listener applying SQLITE_PRAGMAS to every new connection."""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _sql_value(value):
+    # Same text format SQLAlchemy's SQLite DateTime type writes and parses
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    return value
+
+
+def bulk_upsert(engine, table, rows, key_columns, guard_columns=(), update_only=False,
+                chunk_size=BULK_CHUNK_SIZE, log=print):
+    """
+    Merge `rows` (dicts keyed by column name) into `table` (a SQLAlchemy
+    Table), matching existing rows on `key_columns` (NULL matches NULL).
+
+    Every non primary key column of a matched row is overwritten, columns
+    missing from a row become NULL. A matched row whose `guard_columns`
+    differ from the incoming row is left untouched and reported. With
+    update_only, rows without a match are skipped instead of inserted.
+
+    Returns {"rows", "inserted", "updated", "skipped", "seconds", "rows_per_sec", "mismatches"}.
+    """
+    columns = [c.name for c in table.columns if not c.primary_key]
+    name = table.name
+    stage = f"stage_{name}"
+    quoted = ", ".join(f'"{c}"' for c in columns)
+    key_list = ", ".join(f'"{c}"' for c in key_columns)
+    key_match = " AND ".join(f't."{c}" IS s."{c}"' for c in key_columns)
+    guard_differs = " OR ".join(f't."{c}" IS NOT s."{c}"' for c in guard_columns) or "0"
+
+    update_sql = (
+        f'UPDATE "{name}" AS t SET '
+        + ", ".join(f'"{c}" = s."{c}"' for c in columns)
+        + f' FROM "{stage}" AS s WHERE {key_match} AND NOT ({guard_differs})'
+    )
+    insert_sql = (
+        f'INSERT INTO "{name}" ({quoted}) SELECT {quoted} FROM "{stage}" AS s '
+        f'WHERE NOT EXISTS (SELECT 1 FROM "{name}" AS t WHERE {key_match})'
+    )
+    # Last staged row per key wins, as when each row was merged in turn (GROUP BY treats NULLs as equal)
+    dedupe_stage_sql = (
+        f'DELETE FROM "{stage}" WHERE rowid NOT IN (SELECT max(rowid) FROM "{stage}" GROUP BY {key_list})'
+    )
+    # (key..., incoming guard..., stored guard...) of matched rows the guard rejects
+    mismatch_columns = (
+        [f's."{c}"' for c in list(key_columns) + list(guard_columns)]
+        + [f't."{c}"' for c in guard_columns]
+    )
+    mismatch_sql = (
+        f'SELECT {", ".join(mismatch_columns)} '
+        f'FROM "{stage}" AS s JOIN "{name}" AS t ON {key_match} WHERE {guard_differs}'
+    )
+    matched_sql = (
+        f'SELECT count(*) FROM "{stage}" AS s WHERE EXISTS (SELECT 1 FROM "{name}" AS t WHERE {key_match})'
+    )
+    duplicate_keys_sql = (
+        f'SELECT count(*) FROM (SELECT 1 FROM "{name}" GROUP BY {key_list} HAVING count(*) > 1)'
+    )
+
+    stats = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "mismatches": []}
+    start = time.perf_counter()
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        # Not unique: tables loaded row by row may already hold duplicate keys, and NULLs never conflict
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS "ix_{name}_{"_".join(key_columns)}" ON "{name}" ({key_list})'
+        )
+        duplicate_keys = cursor.execute(duplicate_keys_sql).fetchone()[0]
+        if duplicate_keys:
+            log(f"{name}: {duplicate_keys} keys over ({key_list}) already have more than one row; "
+                "every row of a matched key is updated")
+        cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS "{stage}" AS SELECT {quoted} FROM "{name}" WHERE 0')
+        raw.commit()
+
+        insert_stage = f'INSERT INTO "{stage}" ({quoted}) VALUES ({", ".join("?" for _ in columns)})'
+        for offset in range(0, len(rows), chunk_size):
+            chunk = rows[offset:offset + chunk_size]
+            cursor.execute(f'DELETE FROM "{stage}"')
+            cursor.executemany(
+                insert_stage,
+                [tuple(_sql_value(row.get(c)) for c in columns) for row in chunk]
+            )
+            # Rows repeating a key within the chunk update the row staged after them
+            repeated = cursor.execute(dedupe_stage_sql).rowcount
+            mismatches = cursor.execute(mismatch_sql).fetchall() if guard_columns else []
+            matched = cursor.execute(matched_sql).fetchone()[0]
+            cursor.execute(update_sql)
+            if not update_only:
+                cursor.execute(insert_sql)
+            raw.commit()
+
+            staged = len(chunk) - repeated
+            stats["rows"] += len(chunk)
+            stats["mismatches"].extend(mismatches)
+            stats["updated"] += matched - len(mismatches) + repeated
+            if update_only:
+                stats["skipped"] += staged - matched + len(mismatches)
+            else:
+                stats["inserted"] += staged - matched
+                stats["skipped"] += len(mismatches)
+        cursor.execute(f'DROP TABLE IF EXISTS "{stage}"')
+        raw.commit()
+    finally:
+        raw.close()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["rows"] / elapsed, 1) if elapsed else None
+    log(
+        f"{name}: {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec) - "
+        f"{stats['inserted']} inserted, {stats['updated']} updated, {stats['skipped']} skipped"
+    )
+    return stats
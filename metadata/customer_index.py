@@ -0,0 +1,117 @@
+"""
+In-memory customer hierarchy built from the explosion report (IDN).
+
+Resolves a UCN to its type (PARENT, INDIVIDUAL, SHIPTO or UNKNOWN), its
+parent IDNs, and a parent to its individual and ship-to UCNs with dict and
+set lookups instead of per-UCN queries against explosion_report_data.
+"""
+import numpy as np
+import pandas as pd
+
+HIERARCHY_COLUMNS = ["M_SUPER_PARNT_UNI_CUST_NO", "IDN_NAME", "INDIV_UCN", "MEMBER_SHIPTO_UCN"]
+
+
+class CustomerHierarchyIndex:
+    def __init__(self, df: pd.DataFrame):
+        df = df.reindex(columns=HIERARCHY_COLUMNS)
+        df = df.astype(object).where(df.notna(), None)
+        self._frame = df.reset_index(drop=True)
+
+        self.parent_ucns = set()
+        self.individual_ucns = set()
+        self.shipto_ucns = set()
+        # ucn -> ([parent UCN, ...], [IDN name, ...]) in explosion report order
+        self._parents_of_individual = {}
+        self._parents_of_shipto = {}
+        self._individuals_of_parent = {}
+        self._shiptos_of_parent = {}
+
+        for parent, idn_name, indiv, shipto in df.itertuples(index=False, name=None):
+            self.parent_ucns.add(parent)
+            self.shipto_ucns.add(shipto)
+            # An individual is a UCN that is its own ship-to
+            if indiv == shipto:
+                self.individual_ucns.add(indiv)
+
+            pucns, names = self._parents_of_individual.setdefault(indiv, ([], []))
+            pucns.append(parent)
+            names.append(idn_name)
+            pucns, names = self._parents_of_shipto.setdefault(shipto, ([], []))
+            pucns.append(parent)
+            names.append(idn_name)
+
+            if indiv is not None:
+                self._individuals_of_parent.setdefault(parent, set()).add(indiv)
+            if shipto is not None:
+                self._shiptos_of_parent.setdefault(parent, set()).add(shipto)
+
+    # ---------------------------
+    # Loaders / persistence
+    # ---------------------------
+    @classmethod
+    def from_sql(cls, engine):
+        query = (
+            f"SELECT {', '.join(HIERARCHY_COLUMNS)} FROM explosion_report_data ORDER BY pk_id"
+        )
+        return cls(pd.read_sql(query, engine))
+
+    @classmethod
+    def from_excel(cls, excel_path: str = "IDN.xlsx", sheet_name: str = "Filtered_IDN"):
+        return cls(pd.read_excel(excel_path, sheet_name, dtype=str, usecols=HIERARCHY_COLUMNS))
+
+    def save(self, path: str):
+        """Persist as compressed numpy string arrays (None is stored as "")."""
+        arrays = {
+            column: np.array(["" if v is None else v for v in self._frame[column]], dtype=str)
+            for column in HIERARCHY_COLUMNS
+        }
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            df = pd.DataFrame({column: data[column] for column in HIERARCHY_COLUMNS})
+        return cls(df.replace({"": None}))
+
+    # ---------------------------
+    # Lookups
+    # ---------------------------
+    def ucn_type(self, ucn) -> str:
+        """Same precedence as generate_sqlite_db.findUCNType: PARENT, INDIVIDUAL, SHIPTO."""
+        if ucn in self.parent_ucns:
+            return "PARENT"
+        if ucn in self.individual_ucns:
+            return "INDIVIDUAL"
+        if ucn in self.shipto_ucns:
+            return "SHIPTO"
+        return "UNKNOWN"
+
+    def ucn_types(self, ucns) -> pd.Series:
+        """Resolve many UCNs at once; returns a Series of types indexed like `ucns`."""
+        ucns = pd.Series(ucns, dtype=object)
+        types = np.select(
+            [
+                ucns.isin(self.parent_ucns),
+                ucns.isin(self.individual_ucns),
+                ucns.isin(self.shipto_ucns),
+            ],
+            ["PARENT", "INDIVIDUAL", "SHIPTO"],
+            default="UNKNOWN",
+        )
+        return pd.Series(types, index=ucns.index)
+
+    def parents_of_individual(self, ucn):
+        """([parent UCN, ...], [IDN name, ...]) of the explosion rows with INDIV_UCN == ucn."""
+        pucns, names = self._parents_of_individual.get(ucn, ([], []))
+        return list(pucns), list(names)
+
+    def parents_of_shipto(self, ucn):
+        """([parent UCN, ...], [IDN name, ...]) of the explosion rows with MEMBER_SHIPTO_UCN == ucn."""
+        pucns, names = self._parents_of_shipto.get(ucn, ([], []))
+        return list(pucns), list(names)
+
+    def individuals(self, parent_ucn) -> set:
+        return set(self._individuals_of_parent.get(parent_ucn, ()))
+
+    def shiptos(self, parent_ucn) -> set:
+        return set(self._shiptos_of_parent.get(parent_ucn, ()))
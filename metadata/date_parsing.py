@@ -0,0 +1,164 @@
+"""
+Date normalization shared by the metadata pipeline and the JSON builders.
+
+Single values go through parse_date, which is memoized so repeated strings
+(the same end date on hundreds of records) are parsed once. Whole pandas
+columns go through parse_column, which detects the column's format from a
+sample and converts it with one pd.to_datetime call.
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import pandas as pd
+
+# Tried in order; "%d/%m/%Y" and "%m/%d/%Y" swap places with dayfirst=False
+DATE_FORMATS = [
+    "%b/%d/%Y",             # Dec/04/2003
+    "%Y-%m-%dT%H:%M:%S%z",  # with timezone offset
+    "%Y-%m-%dT%H:%M:%S",    # ISO without tz
+    "%Y-%m-%d %H:%M:%S",    # space-separated
+    "%Y-%m-%d",             # date only
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%m/%d/%y",             # 4/30/24
+    "%d/%b/%Y",
+    "%b %d, %Y",            # Dec 04, 2003
+    "%d %b %Y",
+    "%B %d, %Y",            # December 04, 2003
+    "%d %B %Y",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%S.%f",
+]
+_MONTH_FIRST_FORMATS = [
+    "%m/%d/%Y" if f == "%d/%m/%Y" else "%d/%m/%Y" if f == "%m/%d/%Y" else f
+    for f in DATE_FORMATS
+]
+FORMAT_SAMPLE_SIZE = 50
+
+
+def date_formats(dayfirst: bool = False) -> list:
+    return DATE_FORMATS if dayfirst else _MONTH_FIRST_FORMATS
+
+
+def _clean(s) -> str:
+    return str(s).strip().strip('"').strip("'")
+
+
+@lru_cache(maxsize=65536)
+def _parse(s: str, dayfirst: bool):
+    # fromisoformat handles most ISO variants and is much cheaper than strptime
+    try:
+        dt = datetime.fromisoformat(s)
+        return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+    except ValueError:
+        pass
+
+    for fmt in date_formats(dayfirst):
+        try:
+            dt = datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+        return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+    # Last resort: a bare year
+    if len(s) == 4 and s.isdigit():
+        return datetime(int(s), 1, 1, tzinfo=timezone.utc)
+    return None
+
+
+def parse_date(s, dayfirst: bool = False):
+    """
+    Parse a date/time string. Returns a timezone-aware datetime (naive
+    values are taken as UTC), or None if empty or unrecognized.
+    """
+    if s is None:
+        return None
+    s = _clean(s)
+    if s == "":
+        return None
+    return _parse(s, dayfirst)
+
+
+def to_iso(date_str: str, dayfirst: bool = False) -> str:
+    """
+    Convert a date string to ISO-8601 UTC ("2024-04-30T00:00:00Z"). Accepts
+    whatever parse_date does: ISO-8601, DATE_FORMATS and a bare year. Naive
+    values are taken as UTC and offsets are converted to UTC.
+    """
+    dt = parse_date(date_str, dayfirst)
+    if dt is None:
+        raise ValueError(f"Unsupported date format: {date_str}")
+    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def detect_format(values, dayfirst: bool = False):
+    """
+    The first format that parses every sampled non-empty value, or None if
+    the values do not share one. A column mixing 04/05/2023 and 13/05/2023
+    is detected as day-first whatever `dayfirst` says.
+    """
+    sample = []
+    for v in values:
+        if v is None or (isinstance(v, float) and pd.isna(v)):
+            continue
+        v = _clean(v)
+        if v:
+            sample.append(v)
+        if len(sample) >= FORMAT_SAMPLE_SIZE:
+            break
+    if not sample:
+        return None
+
+    for fmt in date_formats(dayfirst):
+        try:
+            for v in sample:
+                datetime.strptime(v, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+
+def parse_column(values: pd.Series, dayfirst: bool = False, utc: bool = True) -> pd.Series:
+    """
+    Vectorized parse_date over a column. Each distinct string is parsed once:
+    the detected column format converts them in one pd.to_datetime call and
+    only the values it misses fall back to parse_date. Unparseable or empty
+    values become NaT. With utc=False the result is naive (in UTC).
+    """
+    # Clean and parse the distinct values only
+    codes, raw = pd.factorize(values)
+    uniques = pd.Series(raw, dtype="string").str.strip().str.strip("\"'")
+    uniques = uniques.mask(uniques == "")
+
+    fmt = detect_format(uniques.head(FORMAT_SAMPLE_SIZE), dayfirst)
+    if fmt is not None:
+        parsed = pd.to_datetime(uniques, format=fmt, errors="coerce", utc=True)
+    else:
+        parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns, UTC]")
+
+    missed = parsed.isna() & uniques.notna()
+    if missed.any():
+        fallback = [parse_date(v, dayfirst) for v in uniques[missed]]
+        parsed[missed] = pd.to_datetime(fallback, utc=True)
+
+    # Missing values have code -1, which picks the trailing NaT
+    lookup = pd.concat([parsed, pd.Series([pd.NaT], dtype=parsed.dtype)], ignore_index=True)
+    result = pd.Series(lookup.to_numpy()[codes], index=values.index, dtype=parsed.dtype)
+    if not utc:
+        result = result.dt.tz_convert(None)
+    return result
+
+
+def parse_date_columns(df: pd.DataFrame, columns, dayfirst: bool = False) -> pd.DataFrame:
+    """
+    Replace date string columns with naive datetimes, and missing or
+    unparseable values with None, ready for to_dict(orient='records').
+    """
+    df = df.copy()
+    for column in columns:
+        if column in df.columns:
+            parsed = parse_column(df[column], dayfirst, utc=False)
+            df[column] = parsed.astype(object).where(parsed.notna(), None)
+    return df
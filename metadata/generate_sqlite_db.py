@@ -1,6 +1,6 @@
 import copy
 import numpy as np
-from sqlalchemy import Column, Integer, String, DateTime, and_, create_engine, select
+from sqlalchemy import Column, Integer, String, DateTime, Index, and_, create_engine, event, select
 from sqlalchemy.orm import relationship, backref, sessionmaker
 from sqlalchemy.orm import declarative_base
 import pandas as pd
@@ -8,10 +8,20 @@ import os
 from datetime import datetime
 import logging
 from logging.handlers import TimedRotatingFileHandler
-import re
 from collections import defaultdict
 from datetime import datetime, timedelta
 
+from date_parsing import parse_date_columns
+from customer_index import CustomerHierarchyIndex
+from bulk_loader import bulk_upsert, set_sqlite_pragmas
+from related_records import RelatedRecordsGraph, parse_related_records
+from query_plan import check_query_plans
+
+INVENTORY_DATE_COLUMNS = [
+    'Ingestion_Date', 'Effective_Date', 'End_Date', 'Created_Date',
+    'Last_Modified_Date', 'First_Published_Date', 'Date_of_Last_Review', 'Expiration_Date',
+]
+
 # Create logger start
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -75,6 +85,13 @@ class ExplosionReportData(Base):
     MULTIPLE_UCN_COUNT = Column(Integer, nullable=True)
     MULTIPLE_SUP_PRNT_IND = Column(String, nullable=True)
 
+    __table_args__ = (
+        # findExplosionReportData / bulk upsert key (the index bulk_upsert would create), also serves parent UCN lookups
+        Index('ix_explosion_report_data_M_SUPER_PARNT_UNI_CUST_NO_INDIV_UCN_MEMBER_SHIPTO_UCN',
+              'M_SUPER_PARNT_UNI_CUST_NO', 'INDIV_UCN', 'MEMBER_SHIPTO_UCN'),
+        Index('ix_explosion_report_data_MEMBER_SHIPTO_UCN_INDIV_UCN', 'MEMBER_SHIPTO_UCN', 'INDIV_UCN'),
+    )
+
     def __init__(self, **kwargs):
        # Initialize properties with default values (if needed)
        self.M_SUPER_PARNT_UNI_CUST_NO = kwargs.get('M_SUPER_PARNT_UNI_CUST_NO')
@@ -215,6 +232,17 @@ class InventoryData(Base):
     Pricing_Type = Column(String, nullable=True)
     Demo = Column(String, nullable=True, default='NO')
 
+    __table_args__ = (
+        # bulk upsert key, under the name bulk_upsert would create it with
+        Index('ix_inventory_data_ContentID', 'ContentID'),
+        # ContentID LIKE 'prefix%' is case-insensitive and can only use a NOCASE index
+        Index('ix_inventory_data_ContentID_nocase', ContentID.collate('NOCASE')),
+        Index('ix_inventory_data_Article_Number', 'Article_Number'),
+        Index('ix_inventory_data_FileName', 'FileName'),
+        Index('ix_inventory_data_Record_Type_Parent_UCN_Customer_Name', 'Record_Type', 'Parent_UCN', 'Customer_Name'),
+        Index('ix_inventory_data_Parent_UCN', 'Parent_UCN'),
+        Index('ix_inventory_data_Policy_Number_ContentID', 'Policy_Number', 'ContentID'),
+    )
 
     def __init__(self, **kwargs):
         self.ContentID = kwargs.get('ContentID')
@@ -375,6 +403,11 @@ class BindersData(Base):
     comments = Column(String, nullable=True)
     status = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        Index('ix_binders_data_trim_number_contract_type_ucn', 'trim_number', 'contract_type', 'ucn'),
+        Index('ix_binders_data_parent_ucn', 'parent_ucn'),
+    )
+
     def __init__(self, **kwargs):
         self.parent_ucn = kwargs.get('parent_ucn')
         self.ucn = kwargs.get('ucn')
@@ -407,9 +440,26 @@ class BindersData(Base):
         self.parent_record_number = kwargs.get('parent_record_number')
         self.child_record_numbers = kwargs.get('child_record_numbers')
 
-engine = create_engine('sqlite:///GSC_Data-DEV.db', pool_recycle=3600, echo = True)
+engine = create_engine('sqlite:///GSC_Data-DEV.db', pool_recycle=3600, echo = False)
+event.listen(engine, 'connect', set_sqlite_pragmas)
+
+# Unique key indexes declared before the keys became the non-unique ones bulk_upsert uses
+LEGACY_INDEXES = (
+    'uq_explosion_report_data_M_SUPER_PARNT_UNI_CUST_NO_INDIV_UCN_MEMBER_SHIPTO_UCN',
+    'uq_inventory_data_ContentID',
+)
+
+# create_all only indexes new tables; add missing indexes to an existing GSC_Data-DEV.db
+def migrateIndexes():
+    with engine.begin() as conn:
+        for name in LEGACY_INDEXES:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 Base.metadata.create_all(bind=engine)
+migrateIndexes()
 SessionMaker = sessionmaker(bind=engine)
 session = SessionMaker()
 
@@ -433,21 +483,34 @@ def isItShipToUCN(ucn):
     row = session.scalars(select(ExplosionReportData).where(ExplosionReportData.MEMBER_SHIPTO_UCN == ucn)).first()
     return None if row is None else row.__dict__
 
+CUSTOMER_INDEX_PATH = 'customer_index.npz'
+_customer_index = None
+
+# The saved index is current when it is newer than the database, its WAL included
+def customer_index_is_current(path=CUSTOMER_INDEX_PATH):
+    if not os.path.exists(path):
+        return False
+    saved = os.path.getmtime(path)
+    db_files = [f for f in (engine.url.database, f"{engine.url.database}-wal") if os.path.exists(f)]
+    return all(saved > os.path.getmtime(f) for f in db_files)
+
+# Explosion report hierarchy, loaded once per run from CUSTOMER_INDEX_PATH or rebuilt from the table
+def get_customer_index():
+    global _customer_index
+    if _customer_index is None:
+        if customer_index_is_current():
+            try:
+                _customer_index = CustomerHierarchyIndex.load(CUSTOMER_INDEX_PATH)
+            except Exception as e:
+                logger.warning(f"Could not load {CUSTOMER_INDEX_PATH}, rebuilding it: {e}")
+        if _customer_index is None:
+            _customer_index = CustomerHierarchyIndex.from_sql(engine)
+            _customer_index.save(CUSTOMER_INDEX_PATH)
+    return _customer_index
+
 # Find UCN Type (PARENT, INDIVIDUAL or SHIPTO)
 def findUCNType(ucn):
-    res = isItParentUCN(ucn)
-    if res is not None:
-        return 'PARENT'
-    else:
-        res = isItIndividualUCN(ucn)
-        if res is not None:
-            return 'INDIVIDUAL'
-        else:
-            res = isItShipToUCN(ucn)
-            if res is not None:
-                return 'SHIPTO'
-            else:
-                return 'UNKNOWN'
+    return get_customer_index().ucn_type(ucn)
 
 ''' find ExplosionReportData and return '''
 def findExplosionReportData(M_SUPER_PARNT_UNI_CUST_NO, INDIV_UCN, MEMBER_SHIPTO_UCN):
@@ -477,15 +540,16 @@ def processExplosionData():
     source_excel_df = source_excel_df.replace({pd.NA: None})
     source_excel_df = source_excel_df.to_dict(orient='records')   
 
-    for item in source_excel_df:
-        explosionData = findExplosionReportData(M_SUPER_PARNT_UNI_CUST_NO=item.get('M_SUPER_PARNT_UNI_CUST_NO'), INDIV_UCN=item.get('INDIV_UCN'), MEMBER_SHIPTO_UCN=item.get('MEMBER_SHIPTO_UCN'))
-        if explosionData is None:
-            logger.info(f"************ Data missing  - {item.get('M_SUPER_PARNT_UNI_CUST_NO')} - {item.get('INDIV_UCN')} - {item.get('MEMBER_SHIPTO_UCN')}")
-            explosionData = saveExplosionData(payload=item)
-        else:
-            pass
-            explosionData.update(**item)
-            session.commit()
+    bulk_upsert(
+        engine, ExplosionReportData.__table__, source_excel_df,
+        key_columns=['M_SUPER_PARNT_UNI_CUST_NO', 'INDIV_UCN', 'MEMBER_SHIPTO_UCN'],
+        log=logger.info,
+    )
+
+    # Rebuild the hierarchy index from the refreshed table
+    global _customer_index
+    _customer_index = CustomerHierarchyIndex.from_sql(engine)
+    _customer_index.save(CUSTOMER_INDEX_PATH)
 # ===========================================================
 # Function to dynamically generate an AND function
 def generate_and_function(*conditions):
@@ -556,6 +620,15 @@ def findInventoryDataByFileName(FileName):
         ).one_or_none()
     return res
 
+''' find InventoryData by a batch of Article_Numbers and return '''
+def findInventoryDataByArticleNumbers(article_numbers):
+    results = session.query(
+        InventoryData
+    ).filter(
+        InventoryData.Article_Number.in_(article_numbers)
+    ).order_by(InventoryData.pk_id).all()
+    return convertRowToDict(InventoryData, results)
+
 ''' save InventoryData and return '''
 def saveInventoryData(payload):
     data = InventoryData(**payload)
@@ -563,6 +636,10 @@ def saveInventoryData(payload):
     session.commit()
     return data
 
+def logInventoryMismatches(stats):
+    for content_id, file_name, db_file_name in stats['mismatches']:
+        logger.error(f"************ ContentID mismatch for  - {file_name}. Input - {content_id}  DB = {db_file_name}")
+
 def processInventoryData():
     # excel_file = r"C:\JAIDA\GSIIH_Contracts - HPE\Metadata_Store\Banner Health\HPE_Metadata_BannerHealth_Final_REGENERATED_Qdrant.xlsx"
     # excel_file = r"c:\JAIDA\GSHR Content\HPE\Deltas_Banner_Health\HPE_Metadata_Deltas_Banner_Health_Qdrant.xlsx"
@@ -587,20 +664,13 @@ def processInventoryData():
     # source_excel_df = source_excel_df[source_excel_df['STATUS'].str.upper() == 'Ingested'.upper()]
     # source_excel_df = source_excel_df[source_excel_df['Related_Records'].notnull()]
     source_excel_df = source_excel_df.sort_values(by='ContentID')
+    source_excel_df = parse_date_columns(source_excel_df, INVENTORY_DATE_COLUMNS)
     source_excel_df = source_excel_df.to_dict(orient='records')
     customer_name_tracker = {}
 
     for item in source_excel_df:
         # if item.get('Related_Records') is None:
         #     continue
-        item['Ingestion_Date'] = None if item.get('Ingestion_Date') is None else datetime.strptime(item['Ingestion_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Effective_Date'] = None if item.get('Effective_Date') is None else datetime.strptime(item['Effective_Date'], "%Y-%m-%d %H:%M:%S")
-        item['End_Date'] = None if item.get('End_Date') is None else datetime.strptime(item['End_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Created_Date'] = None if item.get('Created_Date') is None else datetime.strptime(item['Created_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Last_Modified_Date'] = None if item.get('Last_Modified_Date') is None else datetime.strptime(item['Last_Modified_Date'], "%Y-%m-%d %H:%M:%S")
-        item['First_Published_Date'] = None if item.get('First_Published_Date') is None else datetime.strptime(item['First_Published_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Date_of_Last_Review'] = None if item.get('Date_of_Last_Review') is None else datetime.strptime(item['Date_of_Last_Review'], "%Y-%m-%d %H:%M:%S")
-        item['Expiration_Date'] = None if item.get('Expiration_Date') is None else datetime.strptime(item['Expiration_Date'], "%Y-%m-%d %H:%M:%S")
         item['HPE_Title'] = item.get('Title')
         # TEMP CODE TO UPDATE CUSTOMER NAME FROM EXPLOSION REPORT
         # item['Customer_Name'] = temp_cust_name
@@ -621,16 +691,13 @@ def processInventoryData():
 
         if item.get('STATUS') == 'Already Ingested':
             item['ContentID'] = item['Comments'].strip()
-        inventoryData = findInventoryDataByContentID(ContentID=item.get('ContentID'))
-        if inventoryData is None:
-            logger.info(f"************ Data missing  - {item.get('ContentID')}")
-            inventoryData = saveInventoryData(payload=item)
-        else:
-            if item.get('FileName') == inventoryData.FileName:
-                inventoryData.update(**item)
-                session.commit()
-            else:
-                logger.error(f"************ ContentID mismatch for  - {item.get('FileName')}. Input - {item.get('ContentID')}  DB = {inventoryData.ContentID}")
+
+    # Existing ContentIDs are only overwritten when the FileName matches
+    stats = bulk_upsert(
+        engine, InventoryData.__table__, source_excel_df,
+        key_columns=['ContentID'], guard_columns=['FileName'], log=logger.info,
+    )
+    logInventoryMismatches(stats)
 
 
 # =============================================================================
@@ -657,6 +724,12 @@ def saveBindersData(payload):
     session.commit()
     return data
    
+# parent_UCN is a single UCN or a list of UCNs; empty means every customer
+def parentUCNCondition(parent_UCN):
+    if isinstance(parent_UCN, str):
+        return InventoryData.Parent_UCN == parent_UCN
+    return InventoryData.Parent_UCN.in_(list(parent_UCN))
+
 def processBindersDataCommercialContract(id_prefix = '', customer_name = '', parent_UCN = ''):
     conditions = [InventoryData.Record_Type == 'CONTRACT COMMERCIAL DOCUMENT']
     if len(id_prefix) > 0:
@@ -664,24 +737,26 @@ def processBindersDataCommercialContract(id_prefix = '', customer_name = '', par
     if len(customer_name) > 0:
         conditions.append(InventoryData.Customer_Name == customer_name)
     if len(parent_UCN) > 0:
-        conditions.append(InventoryData.Parent_UCN == parent_UCN)
+        conditions.append(parentUCNCondition(parent_UCN))
     # temp
     # conditions.append(InventoryData.pk_id >= 2368)
     records = findInventoryDataByParams(conditions)
+    # Binders are built per parent UCN, then per contract type and TRIM prefix
     binders = {}
     for record in records:
-        if not record.get('Contract_Type') in binders:
-            binders[record.get('Contract_Type')] = {}
+        group = (record.get('Parent_UCN'), record.get('Contract_Type'))
+        if not group in binders:
+            binders[group] = {}
         prefix = record.get('Article_Number')[:record.get('Article_Number').index('.')]
         suffix = int(record.get('Article_Number')[record.get('Article_Number').index('.')+1:])
-        if not prefix in binders[record.get('Contract_Type')]:
-            binders[record.get('Contract_Type')][prefix] = {"parent": None, "children": [], "status": 1}
+        if not prefix in binders[group]:
+            binders[group][prefix] = {"parent": None, "children": [], "status": 1}
         if suffix == 1:
-            binders[record.get('Contract_Type')][prefix]['parent'] = record
+            binders[group][prefix]['parent'] = record
         else:
-            binders[record.get('Contract_Type')][prefix]['children'].append(record)
+            binders[group][prefix]['children'].append(record)
     
-    for ct, binderDict in binders.items():
+    for (_, ct), binderDict in binders.items():
         for prefix, binderObj in binderDict.items():
             contract_type = ct
             trim_number = prefix
@@ -698,9 +773,7 @@ def processBindersDataCommercialContract(id_prefix = '', customer_name = '', par
             if ucn_type == 'PARENT':
                 parent_ucn = ucn
             elif ucn_type == 'INDIVIDUAL':
-                rows = session.scalars(select(ExplosionReportData).where(ExplosionReportData.INDIV_UCN == ucn)).fetchall()
-                pucns = [it.M_SUPER_PARNT_UNI_CUST_NO for it in rows]
-                ns = [it.IDN_NAME for it in rows]
+                pucns, ns = get_customer_index().parents_of_individual(ucn)
                 try:
                     indx = -1 if binderObj.get('parent') is None else ns.index(binderObj.get('parent').get('Customer_Name'))
                 except ValueError as e:
@@ -708,9 +781,7 @@ def processBindersDataCommercialContract(id_prefix = '', customer_name = '', par
                     indx = -1
                 parent_ucn = pucns[indx] if indx != -1 else None if pucns is None or len(pucns) == 0 else pucns[0]
             elif ucn_type == 'SHIPTO':
-                rows = session.scalars(select(ExplosionReportData).where(ExplosionReportData.MEMBER_SHIPTO_UCN == ucn)).fetchall()
-                pucns = [it.M_SUPER_PARNT_UNI_CUST_NO for it in rows]
-                ns = [it.IDN_NAME for it in rows]
+                pucns, ns = get_customer_index().parents_of_shipto(ucn)
                 try:
                     indx = ns.index(binderObj.get('parent').get('Customer_Name'))
                 except ValueError as e:
@@ -734,37 +805,6 @@ def processBindersDataCommercialContract(id_prefix = '', customer_name = '', par
                     session.query(BindersData).filter(BindersData.binders_id == rec.get('binders_id')).update(payload)
                     session.commit()
 
-# Recursive function to retrieve hierarchical data
-def fetchChildren(parent_artNumbr, Related_Records, children_t, relation_map = [], child_track=[], parents_t_Article_Numbers = []):
-    if Related_Records is None:
-        return []
-    
-    children = []
-    pattern = r'\b\d+~\d+\.\d{1,3}\b'
-    # Find all matches in the string
-    matches = re.findall(pattern, Related_Records)
-    for match in matches:
-        if match in parents_t_Article_Numbers:
-            continue
-        if match in children_t:
-            if match not in child_track:
-                children.append(children_t[match])
-                child_track.append(match)
-            if f"{parent_artNumbr}#{match}" not in relation_map:
-                relation_map.append(f"{parent_artNumbr}#{match}")
-                children.extend(fetchChildren(match, children_t.get(match, {}).get('Related_Records'), children_t, relation_map, child_track, parents_t_Article_Numbers))
-        else:
-            conditions = [InventoryData.Article_Number == match]
-            records = findInventoryDataByParams(conditions)
-            for rec in records:
-                if match not in child_track:
-                    children.append(rec)
-                    child_track.append(match)
-                if f"{parent_artNumbr}#{match}" not in relation_map:
-                    relation_map.append(f"{parent_artNumbr}#{match}")
-                    children.extend(fetchChildren(rec.get('Article_Number'), rec.get('Related_Records'), children_t, relation_map, child_track, parents_t_Article_Numbers))
-    return children
-
 def separateParentChildren(childs_dict, parent_key):
     if childs_dict is None or len(childs_dict) == 0:
         return None, []
@@ -786,10 +826,22 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
     if len(customer_name) > 0:
         conditions.append(InventoryData.Customer_Name == customer_name)
     if len(parent_UCN) > 0:
-        conditions.append(InventoryData.Parent_UCN == parent_UCN)
+        conditions.append(parentUCNCondition(parent_UCN))
     # temp
     # conditions.append(InventoryData.pk_id >= 2368)
     records = findInventoryDataByParams(conditions)
+
+    # Related_Records are resolved against one graph loaded up front in batches
+    graph = RelatedRecordsGraph()
+    graph.load_references(records, findInventoryDataByArticleNumbers)
+
+    records_by_parent_ucn = defaultdict(list)
+    for record in records:
+        records_by_parent_ucn[record.get('Parent_UCN')].append(record)
+    for parent_ucn_records in records_by_parent_ucn.values():
+        processProductBinders(parent_ucn_records, graph)
+
+def processProductBinders(records, graph):
     # result_dicts = [{column.name: getattr(row, column.name) for column in InventoryData.__table__.columns} for row in records]
     sorted_list = sorted(records, key=lambda x: x['Article_Number'])
     sorted_dict = {item.get('Article_Number'): item for item in sorted_list}
@@ -808,12 +860,10 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
             #     else:
             #         children_t[obj.get('Article_Number')] = obj
     # Iterate through the parents and build the binder instance
-    parents_t_Article_Numbers = list(parents_t.keys())
+    parents_t_Article_Numbers = set(parents_t.keys())
     for artNumbr, obj in parents_t.items():
-        relation_map = []
-        child_track = []
         prefix = artNumbr[:artNumbr.index('.')]
-        childs = fetchChildren(artNumbr, obj.get('Related_Records'), children_t, relation_map, child_track, parents_t_Article_Numbers)
+        childs = graph.children(artNumbr, obj.get('Related_Records'), children_t, parents_t_Article_Numbers)
         childs_dict = {it.get('Article_Number'): it for it in childs}
         childs_dict = {key: childs_dict[key] for key in childs_dict if key not in parents_t_Article_Numbers}
         if artNumbr in childs_dict:
@@ -834,9 +884,7 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
         if ucn_type == 'PARENT':
             parent_ucn = ucn
         elif ucn_type == 'INDIVIDUAL':
-            rows = session.scalars(select(ExplosionReportData).where(ExplosionReportData.INDIV_UCN == ucn)).fetchall()
-            pucns = [it.M_SUPER_PARNT_UNI_CUST_NO for it in rows]
-            ns = [it.IDN_NAME for it in rows]
+            pucns, ns = get_customer_index().parents_of_individual(ucn)
             try:
                 indx = ns.index(obj.get('Customer_Name'))
             except ValueError as e:
@@ -844,9 +892,7 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
                 indx = -1
             parent_ucn = pucns[indx] if indx != -1 else None if pucns is None or len(pucns) == 0 else pucns[0]
         elif ucn_type == 'SHIPTO':
-            rows = session.scalars(select(ExplosionReportData).where(ExplosionReportData.MEMBER_SHIPTO_UCN == ucn)).fetchall()
-            pucns = [it.M_SUPER_PARNT_UNI_CUST_NO for it in rows]
-            ns = [it.IDN_NAME for it in rows]
+            pucns, ns = get_customer_index().parents_of_shipto(ucn)
             try:
                 indx = ns.index(obj.get('Customer_Name'))
             except ValueError as e:
@@ -873,16 +919,12 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
     # Iterate through the childs. process for one entry items
     children_t = {}
     for artNumbr, obj in children_t.items():
-        relation_map = []
-        child_track = []
         final_p = None
         final_cs = []
-        pattern = r'\b\d+~\d+\.\d{1,3}\b'
-        # Find all matches in the string
-        matches = re.findall(pattern, obj.get('Related_Records'))
+        matches = parse_related_records(obj.get('Related_Records'))
         if len(matches) == 1:
             prefix = artNumbr[:artNumbr.index('.')]
-            childs = fetchChildren(artNumbr, obj.get('Related_Records'), children_t, relation_map, child_track, parents_t_Article_Numbers)
+            childs = graph.children(artNumbr, obj.get('Related_Records'), children_t, parents_t_Article_Numbers)
 
             # Verify which one is the parent
             childs_dict = {}
@@ -942,9 +984,7 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
             if ucn_type == 'PARENT':
                 parent_ucn = ucn
             elif ucn_type == 'INDIVIDUAL':
-                rows = session.scalars(select(ExplosionReportData).where(ExplosionReportData.INDIV_UCN == ucn)).fetchall()
-                pucns = [it.M_SUPER_PARNT_UNI_CUST_NO for it in rows]
-                ns = [it.IDN_NAME for it in rows]
+                pucns, ns = get_customer_index().parents_of_individual(ucn)
                 try:
                     indx = -1 if final_p is None else ns.index(final_p.get('Customer_Name'))
                 except ValueError as e:
@@ -952,9 +992,7 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
                     indx = -1
                 parent_ucn = pucns[indx] if indx != -1 else None if pucns is None or len(pucns) == 0 else pucns[0]
             elif ucn_type == 'SHIPTO':
-                rows = session.scalars(select(ExplosionReportData).where(ExplosionReportData.MEMBER_SHIPTO_UCN == ucn)).fetchall()
-                pucns = [it.M_SUPER_PARNT_UNI_CUST_NO for it in rows]
-                ns = [it.IDN_NAME for it in rows]
+                pucns, ns = get_customer_index().parents_of_shipto(ucn)
                 try:
                     indx = -1 if final_p is None else ns.index(final_p.get('Customer_Name'))
                 except ValueError as e:
@@ -977,76 +1015,54 @@ def processBindersDataProdcutContract(id_prefix = '', customer_name = '', parent
                     rec.update(**payload)
                     session.commit()
 
-def createGoldenRecords():
-    inv_records = findInventoryDataAll()
-    inv_records = convertRowToDict(InventoryData, inv_records)
-    inv_dict = {a['ContentID']: a for a in inv_records}
-
-    binders_records = findBindersDataAll()
-    binders_records = convertRowToDict(BindersData, binders_records)
-    # Using defaultdict with list comprehension
-    binders_dict = defaultdict(list)
-    [binders_dict[a["binder_identifier"]].append(a) for a in binders_records]
-    # Convert defaultdict to a normal dictionary if needed
-    binders_dict = dict(binders_dict)
-    for inv_record in inv_records:
-        if inv_record['Article_Type'] == 'Template':
-            continue
-        inv_record['Product_Agreement_Or_Amendment'] = 'N/A'
-        if inv_record['Contract_Type'] == 'PRODUCT AGREEMENT':
-            if inv_record['End_Date'] is not None:
-                inv_record['Product_Agreement_Or_Amendment'] = 'AGREEMENT'
-            else:
-                inv_record['Product_Agreement_Or_Amendment'] = 'AMENDMENT'
-                prefix = inv_record.get('Article_Number')[:inv_record.get('Article_Number').index('.')]
-                suffix = int(inv_record.get('Article_Number')[inv_record.get('Article_Number').index('.')+1:])
-                binder_identifier = prefix[prefix.index('~')+1:]
-                for rec in binders_records:
-                    if inv_record['Parent_UCN'] == rec['parent_ucn']:
-                        if rec['child_content_ids']is not None and len(rec['child_content_ids']) > 0:
-                            if inv_record['ContentID'] in rec['child_content_ids'].split(','):
-                                inv_record['End_Date'] = None if rec['parent_content_id'] is None else inv_dict[rec['parent_content_id']]['End_Date']
-                                break
-
-
-                        # if rec['contract_type'] in ['MASTER AGREEMENT', 'MASTER W/ CSC', 'MASTER BUSINESS ASSOCIATE']:
-                        #     inv_record['End_Date'] = None if rec['parent_content_id'] is None else inv_dict[rec['parent_content_id']]['End_Date']
-                            
-
-    pass
-    df = pd.DataFrame(inv_records)
-    if 'Article_Number' in df.columns:
-        df['Article_Number'] = df['Article_Number'].astype(str)
-    if 'UCN' in df.columns:
-        df['UCN'] = df['UCN'].astype(str)
-    if 'Policy_Number' in df.columns:
-        df['Policy_Number'] = df['Policy_Number'].astype(str)
-    if 'Parent_UCN' in df.columns:
-        df['Parent_UCN'] = df['Parent_UCN'].astype(str)
-    # Write DataFrame to Excel file
-    df.to_excel('3Customers.xlsx', index=False, sheet_name='3 Customers')
-    #Filter Banner health
-    banner_df = df[df['Parent_UCN'] == '01018471']
-
-    banner_df.reset_index(drop=True, inplace=True)
-    banner_df = banner_df.copy()
-    # Convert End_Date column to datetime, handling None values
-    banner_df['End_Date'] = pd.to_datetime(banner_df['End_Date'], errors='coerce')
-
-    # Get today's date
-    # today = datetime.today()
-    # Define the target check date (1st March 2025)
-    check_date = datetime(2025, 3, 1)
-
-    # Define the date range (last 30 days from today)
-    # last_30_days = today - timedelta(days=30)
-
-    # Filter data: Include rows where End_Date is within the last 30 days OR is NaT (None)
-    # filtered_df = banner_df[(banner_df['End_Date'].isna()) | (banner_df['End_Date'] >= last_30_days)]
-    filtered_df = banner_df[(banner_df['End_Date'].isna()) | (banner_df['End_Date'] >= check_date)]
-    filtered_df.reset_index(drop=True, inplace=True)
-
-    filtered_df.to_excel('Banner_Health_1st_March.xlsx', index=False, sheet_name='BANNER HEALTH')
+def findInventoryDataFrame():
+    return pd.read_sql(
+        select(InventoryData.__table__).order_by(InventoryData.Policy_Number, InventoryData.ContentID), engine
+    )
+
+def findBindersDataFrame():
+    return pd.read_sql(select(BindersData.__table__).order_by(BindersData.binders_id), engine)
+
+# ContentID -> binder index: one row per (parent_ucn, child ContentID), first binder wins
+def buildChildBinderIndex(binders_df):
+    index = binders_df[['parent_ucn', 'parent_content_id', 'child_content_ids']]
+    index = index[index['child_content_ids'].fillna('') != '']
+    index = index.assign(ContentID=index['child_content_ids'].str.split(',')).explode('ContentID')
+    return index.drop_duplicates(['parent_ucn', 'ContentID'])[['parent_ucn', 'ContentID', 'parent_content_id']]
+
+def createGoldenRecords(parent_UCN = '', check_date = datetime(2025, 3, 1), output_path = 'golden_records.parquet',
+                        active_output_path = 'golden_records_active.parquet'):
+    df = findInventoryDataFrame()
+    if len(parent_UCN) > 0:
+        df = df[df['Parent_UCN'].isin([parent_UCN] if isinstance(parent_UCN, str) else list(parent_UCN))]
+    df = df.reset_index(drop=True)
+
+    # Product agreements carry an End_Date, their amendments inherit the binder parent's
+    is_template = df['Article_Type'] == 'Template'
+    is_product = (df['Contract_Type'] == 'PRODUCT AGREEMENT') & ~is_template
+    is_amendment = is_product & df['End_Date'].isna()
+    df['Product_Agreement_Or_Amendment'] = np.select(
+        [is_template, is_amendment, is_product], [None, 'AMENDMENT', 'AGREEMENT'], default='N/A'
+    )
+
+    parent_end_dates = df.drop_duplicates('ContentID', keep='last').set_index('ContentID')['End_Date']
+    amendments = df.loc[is_amendment, ['Parent_UCN', 'ContentID']].reset_index()
+    amendments = amendments.merge(
+        buildChildBinderIndex(findBindersDataFrame()),
+        left_on=['Parent_UCN', 'ContentID'], right_on=['parent_ucn', 'ContentID'], how='inner',
+    )
+    df.loc[amendments['index'], 'End_Date'] = amendments['parent_content_id'].map(parent_end_dates).to_numpy()
+
+    for column in ['Article_Number', 'UCN', 'Policy_Number', 'Parent_UCN']:
+        df[column] = df[column].astype(str)
+    df['End_Date'] = pd.to_datetime(df['End_Date'], errors='coerce')
+    df.to_parquet(output_path, index=False)
+
+    # Active records: no End_Date, or ending on/after check_date
+    active_df = df[df['End_Date'].isna() | (df['End_Date'] >= check_date)].reset_index(drop=True)
+    active_df.to_parquet(active_output_path, index=False)
+    logger.info(f"Golden records: {len(df)} written to {output_path}, {len(active_df)} active written to {active_output_path}")
+    return df
 
 def updateGoldenMD():
     excel_file = r"metadata/Golden Record Lexora-01-08-2026_Processed 1.xlsx"
@@ -1057,36 +1073,54 @@ def updateGoldenMD():
     df = df.replace(np.nan, None)
     df.reset_index(drop=True, inplace=True)
     df.columns = df.columns.str.strip()
+    df = parse_date_columns(df, INVENTORY_DATE_COLUMNS)
     excel_metadata_json = df.to_dict(orient='records')
-    for index, item in enumerate(excel_metadata_json):
-        item['Ingestion_Date'] = None if item.get('Ingestion_Date') is None else datetime.strptime(item['Ingestion_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Effective_Date'] = None if item.get('Effective_Date') is None else datetime.strptime(item['Effective_Date'], "%Y-%m-%d %H:%M:%S")
-        item['End_Date'] = None if item.get('End_Date') is None else datetime.strptime(item['End_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Created_Date'] = None if item.get('Created_Date') is None else datetime.strptime(item['Created_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Last_Modified_Date'] = None if item.get('Last_Modified_Date') is None else datetime.strptime(item['Last_Modified_Date'], "%Y-%m-%d %H:%M:%S")
-        item['First_Published_Date'] = None if item.get('First_Published_Date') is None else datetime.strptime(item['First_Published_Date'], "%Y-%m-%d %H:%M:%S")
-        item['Date_of_Last_Review'] = None if item.get('Date_of_Last_Review') is None else datetime.strptime(item['Date_of_Last_Review'], "%Y-%m-%d %H:%M:%S")
-        item['Expiration_Date'] = None if item.get('Expiration_Date') is None else datetime.strptime(item['Expiration_Date'], "%Y-%m-%d %H:%M:%S")
+    for item in excel_metadata_json:
         item['Demo'] = 'YES'
-        
 
-        inventoryData = findInventoryDataByContentID(ContentID=item.get('ContentID'))        
-        if inventoryData is not None:
-            if item.get('FileName') == inventoryData.FileName:
-                inventoryData.update(**item)
-                session.commit()
-            else:
-                logger.error(f"************ ContentID mismatch for  - {item.get('FileName')}. Input - {item.get('ContentID')}  DB = {inventoryData.ContentID}")
+    stats = bulk_upsert(
+        engine, InventoryData.__table__, excel_metadata_json,
+        key_columns=['ContentID'], guard_columns=['FileName'], update_only=True, log=logger.info,
+    )
+    logInventoryMismatches(stats)
+
+# =============================================================================
+# The DAO access patterns above, with sample values, for EXPLAIN QUERY PLAN
+def daoQueries():
+    return {
+        'isItParentUCN': select(ExplosionReportData).where(ExplosionReportData.M_SUPER_PARNT_UNI_CUST_NO == '0'),
+        'isItIndividualUCN': select(ExplosionReportData).where(ExplosionReportData.INDIV_UCN == '0', ExplosionReportData.MEMBER_SHIPTO_UCN == '0'),
+        'isItShipToUCN': select(ExplosionReportData).where(ExplosionReportData.MEMBER_SHIPTO_UCN == '0'),
+        'findExplosionReportData': select(ExplosionReportData).where(
+            ExplosionReportData.M_SUPER_PARNT_UNI_CUST_NO == '0', ExplosionReportData.INDIV_UCN == '0', ExplosionReportData.MEMBER_SHIPTO_UCN == '0'),
+        'findInventoryDataAll': select(InventoryData).order_by(InventoryData.Policy_Number, InventoryData.ContentID),
+        'findInventoryDataByContentID': select(InventoryData).where(InventoryData.ContentID == '0'),
+        'findInventoryDataByFileName': select(InventoryData).where(InventoryData.FileName == '0'),
+        'findInventoryDataByArticleNumbers': select(InventoryData).where(InventoryData.Article_Number.in_(['0', '1'])).order_by(InventoryData.pk_id),
+        'findInventoryDataByParams(Record_Type, Parent_UCN)': select(InventoryData).where(
+            InventoryData.Record_Type == '0', parentUCNCondition('0')),
+        'findInventoryDataByParams(Record_Type, Customer_Name)': select(InventoryData).where(
+            InventoryData.Record_Type == '0', InventoryData.Customer_Name == '0'),
+        'findInventoryDataByParams(ContentID LIKE)': select(InventoryData).where(InventoryData.ContentID.like('0%')),
+        'findBindersDataByParams': select(BindersData).where(
+            BindersData.ucn == '0', BindersData.contract_type == '0', BindersData.trim_number == '0',
+            BindersData.binder_identifier == '0', BindersData.parent_content_id == '0'),
+    }
+
+# Log the plan of every DAO query and flag full table scans
+def checkQueryPlans():
+    return check_query_plans(engine, daoQueries(), log=logger.info)
 
 # =============================================================================
 
 if __name__ == '__main__':
+    # checkQueryPlans()
     # processExplosionData()
     # processInventoryData()
     # # BANNER HEALTH => 01018471 INTERMOUNTAIN HEALTH => 01533908 PROVIDENCE  ST. JOSEPH HEALTH => 01018864
-    # Only working one at a time, need to optimize later
-    processBindersDataCommercialContract(parent_UCN= '01030242')
-    processBindersDataProdcutContract(parent_UCN= '01030242')
+    # All parent UCNs in one run; pass parent_UCN='...' or a list of UCNs to limit it
+    processBindersDataCommercialContract()
+    processBindersDataProdcutContract()
     # '01018471, 01018845, 01030242'
     createGoldenRecords()
     updateGoldenMD()
@@ -13,11 +13,11 @@ import re
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
 from requests.exceptions import RequestException
-from urllib.parse import quote as urlquote
+
+from trim_client import DOWNLOAD_WORKERS, TRIMSearchError, get_trim_client
 
 # -----------------------
 # Defaults & Constants
@@ -224,54 +224,21 @@ def confirm_or_exit(args: argparse.Namespace, logger: logging.Logger) -> bool:
 # -----------------------
 def get_search_results(route_url: str, query: str, logger: logging.Logger) -> Optional[Dict[str, Any]]:
     """
-    Perform a GET against the ServiceAPI with the formed query.
-    Returns parsed JSON dict (ConvertFrom-Json equivalent) or None on failure.
+    Run the search against the ServiceAPI through the pooled TRIM client,
+    following every result page. Returns the combined JSON dict
+    (ConvertFrom-Json equivalent) or None on failure.
     """
-
-    # Escape query string similarly to PS ([uri]::EscapeUriString)
-    final_query = urlquote(query, safe=":/?&=')(")  # keep some safe characters; adjust if needed
-
-    # PS bug workaround: replace tilde with question when searching record number
-    # (they replaced only when valueFilter == "Number" earlier; we'll keep to general safety)
-    if "Number:" in query and "~" in final_query:
-        final_query = final_query.replace("~", "?")
-
-    search_uri = f"{route_url}?q={final_query}&propertySets={PROPERTY_SETS_PARAMETER}&properties={PROPERTIES_PARAMETER}&format=json&pageSize={PAGE_SIZE}"
+    client = get_trim_client(route_url, page_size=PAGE_SIZE)
     logger.info("Invoking Search via ServiceAPI: %s", query)
-    logger.debug("Search URI: %s", search_uri)
+    logger.debug("Search URI: %s", client.search_uri(query))
 
     try:
-        resp = requests.get(search_uri, timeout=60)
-        logger.debug("HTTP Status Code: %s", resp.status_code)
-        if resp.status_code != 200:
-            logger.error("Unexpected HTTP Status Code %s", resp.status_code)
-            logger.debug("Response body: %s", resp.text[:2000])
-            return None
-
-        text = resp.text
-        # PS bug when parsing UTC date times, they removed '.0000000Z"'
-        text = text.replace('.0000000Z"', '"')
-        if not text.strip():
-            logger.warning("Search failed to return results (empty body)")
-            return None
-        # Parse JSON - attempt safe parsing
-        try:
-            result = resp.json()
-            logger.info("Search received a response (Results count: %s)", safe_get(result, "TotalResults", default="unknown"))
-            return result
-        except json.JSONDecodeError:
-            # fallback: try loading modified text
-            try:
-                result = json.loads(text)
-                logger.info("Search received a response (parsed from modified text)")
-                return result
-            except Exception as ex2:
-                logger.exception("Failed to parse JSON response: %s", ex2)
-                logger.debug("Raw response (truncated): %s", text[:2000])
-                return None
-    except RequestException as e:
+        result = client.search(query, property_sets=PROPERTY_SETS_PARAMETER, properties=PROPERTIES_PARAMETER)
+    except TRIMSearchError as e:
         logger.exception("Get-SearchResults failed: %s", e)
         return None
+    logger.info("Search received a response (Results count: %s)", len(result.get("Results", [])))
+    return result
 
 
 # -----------------------
@@ -288,28 +255,41 @@ def download_record(route_url: str, record_uri: str, extension: Optional[str], a
     # Ensure attachments folder
     ensure_dir(attachments_path)
 
+    client = get_trim_client(route_url)
     local_filename = attachments_path / f"{record_uri}.{extension}"
-    download_url = f"{route_url}/{record_uri}/File/document"
-    logger.info("Downloading record from: %s", download_url)
+    logger.info("Downloading record from: %s", client.document_url(record_uri))
     logger.debug("Downloading record to: %s", local_filename)
 
     try:
-        with requests.get(download_url, stream=True, timeout=120) as r:
-            if r.status_code != 200:
-                logger.error("Failed to download %s (HTTP %s)", download_url, r.status_code)
-                return None
-            # stream to file
-            with open(local_filename, "wb") as fh:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        fh.write(chunk)
-        logger.info("Downloaded Uri %s to: %s", record_uri, local_filename)
+        status, _ = client.download(record_uri, local_filename)
+        logger.info("Downloaded Uri %s to: %s (%s)", record_uri, local_filename, status)
         return str(local_filename)
-    except RequestException as ex:
+    except (RequestException, ValueError) as ex:
         logger.exception("Get-RecordDownload failed: %s", ex)
         return None
 
 
+# -----------------------
+# Download documents concurrently
+# -----------------------
+def download_records(route_url: str, jobs: List[Tuple[Any, Optional[str]]], attachments_path: Path, logger: logging.Logger,
+                     workers: int = DOWNLOAD_WORKERS) -> Dict[str, Any]:
+    """
+    Download (record_uri, extension) jobs into attachments_path with a pool
+    of `workers`; documents already downloaded are skipped and partial
+    ones resumed. Returns the download stats of TRIMClient.download_all.
+    """
+    ensure_dir(attachments_path)
+    stats = get_trim_client(route_url).download_all(
+        ({"uri": uri, "path": attachments_path / f"{uri}.{ext or 'pdf'}"} for uri, ext in jobs),
+        workers=workers,
+    )
+    logger.info("Downloads complete in %ss: %d downloaded, %d resumed, %d skipped, %d failed",
+                stats["seconds"], stats["downloaded"], stats["resumed"], stats["skipped"], stats["failed"])
+    return stats
+
+
+
 # -----------------------
 # Invoke-SearchAndDownload
 # -----------------------
@@ -368,9 +348,9 @@ def invoke_search_and_download(args: argparse.Namespace, logger: logging.Logger)
         logger.info("Skipping downloads (download flag is False). Results placed at: %s", args.batch_path)
         return
 
-    # Step 4 - iterate results and download attachments
+    # Step 4 - collect the PDF records, then download them concurrently
     logger.info("Step 4 - Downloading documents (limit: %s)", "unlimited" if args.download_all else "5 per contract")
-    download_count = 0
+    jobs = []
     results_list = search_results.get("Results", []) if isinstance(search_results, dict) else []
     for rec in results_list:
         try:
@@ -396,14 +376,12 @@ def invoke_search_and_download(args: argparse.Namespace, logger: logging.Logger)
             # if (Record.RecordExtension.Value -ne $null -and Record.RecordExtension.Value -eq "pdf")
             # We'll replicate that: require ext present and equals "pdf" (case-insensitive)
             if ext and str(ext).lower() == "pdf":
-                logger.info(" * Downloading Record: %s (Uri=%s)", record_number or "<unknown>", record_uri)
-                dl = download_record(args.route_url, record_uri, ext, args.attachments_path, logger)
-                if dl:
-                    download_count += 1
+                logger.debug(" * Queueing Record: %s (Uri=%s)", record_number or "<unknown>", record_uri)
+                jobs.append((record_uri, ext))
             else:
                 logger.debug("Skipping record %s due to extension not 'pdf' (ext=%s)", record_uri, ext)
 
-            if not args.download_all and download_count > 5:
+            if not args.download_all and len(jobs) > 5:
                 logger.info("Download limit for non-downloadAll reached; breaking.")
                 break
 
@@ -411,6 +389,8 @@ def invoke_search_and_download(args: argparse.Namespace, logger: logging.Logger)
             logger.exception("Error processing record for download: %s", ex)
             continue
 
+    stats = download_records(args.route_url, jobs, args.attachments_path, logger, workers=args.download_workers)
+    download_count = stats["downloaded"] + stats["resumed"] + stats["skipped"]
     logger.info("Downloaded a total of %d documents", download_count)
     logger.info("Contract export complete")
     logger.info("Results are at: %s", args.batch_path)
@@ -432,6 +412,7 @@ def main():
     parser.add_argument("--end-date", type=str, dest="end_date", default="", help="EndDate for search (ISO format recommended)")
     parser.add_argument("--view-transcript", action="store_true", dest="view_transcript", help="Open transcript at end (not implemented on all platforms)")
     parser.add_argument("--route-url", type=str, dest="route_url", default="http://awsdrbnvaw0003/CMServiceAPI/Record", help="Service API route URL")
+    parser.add_argument("--download-workers", type=int, dest="download_workers", default=DOWNLOAD_WORKERS, help="Number of concurrent document downloads")
     parser.add_argument("--root-download-folder", type=str, dest="root_download_folder", default=str(ROOT_DOWNLOAD_FOLDER_DEFAULT), help="Root download folder")
     args = parser.parse_args()
 
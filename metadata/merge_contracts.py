@@ -1,10 +1,10 @@
 import pandas as pd
 
-def merge_contracts(excel_file_1, excel_file_2, sheet_name_1, sheet_name_2, COL1, COL2):
-    df_extracted = pd.read_excel(excel_file_1, sheet_name=sheet_name_1, engine="openpyxl")
-    df_regents_joe = pd.read_excel(excel_file_2, sheet_name=sheet_name_2, engine="openpyxl")
-    
+def match_active_records(df_extracted, df_regents_joe, COL1, COL2):
+    """(extracted rows whose COL1 is an active COL2, active .xxx records missing from the extract)"""
     # Normalize columns
+    df_extracted = df_extracted.copy()
+    df_regents_joe = df_regents_joe.copy()
     df_extracted.columns = df_extracted.columns.str.strip()
     df_regents_joe.columns = df_regents_joe.columns.str.strip()
     
@@ -24,6 +24,13 @@ def merge_contracts(excel_file_1, excel_file_2, sheet_name_1, sheet_name_2, COL1
         print("\nMissing values:")
         for val in missing[COL2].tolist():
             print(" ❗", val)
+    return merged, missing
+
+
+def merge_contracts(excel_file_1, excel_file_2, sheet_name_1, sheet_name_2, COL1, COL2):
+    df_extracted = pd.read_excel(excel_file_1, sheet_name=sheet_name_1, engine="openpyxl")
+    df_regents_joe = pd.read_excel(excel_file_2, sheet_name=sheet_name_2, engine="openpyxl")
+    merged, missing = match_active_records(df_extracted, df_regents_joe, COL1, COL2)
 
     # Save merged and missing data into workbook
     with pd.ExcelWriter(excel_file_1, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
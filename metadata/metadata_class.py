@@ -1,13 +1,17 @@
 import os
 import re
 import json
+import time
+import hashlib
+import uuid
 import numpy as np
 import shutil
 import logging
 import configparser
 import subprocess
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 import pandas as pd
@@ -19,7 +23,9 @@ from logging.handlers import TimedRotatingFileHandler
  
 from metadata_preprocessor import metadata_preprocessor
 from python_TRIM_script import run_search_and_download
-from merge_contracts import merge_contracts
+from merge_contracts import match_active_records
+from pipeline_context import PipelineContext, as_missing, as_text
+from radar_queries import download_to_parquet, read_radar_file
 # ---------------------------
 # Logger setup
 # ---------------------------
@@ -31,6 +37,23 @@ logger.addHandler(handler)
 console = logging.StreamHandler()
 console.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
 logger.addHandler(console)
+
+# Ship-to extraction: UCNs per TRIM search, concurrent searches, attempts per batch
+SHIPTO_BATCH_SIZE = 300
+TRIM_MAX_WORKERS = 4
+TRIM_BATCH_RETRIES = 3
+TRIM_RETRY_BACKOFF_SECONDS = 5
+TRIM_ROUTE_URL = "http://awsdrbnvaw0003/CMServiceAPI/Record"
+RADAR_END_DATE_FROM = "2025-10-01"
+# RADAR contract fields copied onto the TRIM metadata in the second iteration
+RADAR_UCN_FIELD_MAP = {
+    "cntrc_id": "Policy_Number",
+    "cntrc_start_dt": "Effective_Date",
+    "cntrc_end_dt": "End_Date",
+    "last_updt": "Last_Modified_Date",
+    # "cntrc_org": "Business_Unit",
+    # "agmt_type": "Contract_Type",
+}
  
 # ---------------------------
 # ConfigManager
@@ -74,9 +97,11 @@ class TRIMService:
       - processing IDN/explosion excel -> IND/SHIPTO lists
       - combining parent & child metadata files
     """
-    def __init__(self, powershell_script: str = ".\\Invoke-SearchAndDownload-v9.ps1"):
+    def __init__(self, powershell_script: str = ".\\Invoke-SearchAndDownload-v9.ps1",
+                 route_url: str = TRIM_ROUTE_URL):
         self.powershell_script = powershell_script
         self.python_trim_script = run_search_and_download
+        self.route_url = route_url
  
     def run_trim_script(self,
                        filter_type: str,
@@ -159,6 +184,84 @@ class TRIMService:
         logger.info("Moved %s -> %s (replace=%s)", source, dest_file, replace)
         return dest_file
  
+    def _search_batch(self, batch: List[str], retries: int, search_kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """One TRIM search for a batch of UCNs, retried with exponential backoff."""
+        for attempt in range(1, retries + 1):
+            result = self.python_trim_script(
+                customer_ucns=",".join(batch),
+                route_url=self.route_url,
+                save_metadata=False,
+                logger=logger,
+                **search_kwargs
+            )
+            if result is not None:
+                return result.get("Results", [])
+            if attempt < retries:
+                delay = TRIM_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+                logger.warning("TRIM batch of %d UCNs failed (attempt %d/%d), retrying in %ss", len(batch), attempt, retries, delay)
+                time.sleep(delay)
+        raise RuntimeError(f"TRIM search failed after {retries} attempts for batch starting {batch[0]}")
+
+    def extract_ucn_batches(self, ucns: List[str], batch_size: int = SHIPTO_BATCH_SIZE,
+                            max_workers: int = TRIM_MAX_WORKERS, retries: int = TRIM_BATCH_RETRIES,
+                            checkpoint_dir: Optional[Path] = None, **search_kwargs) -> List[Dict[str, Any]]:
+        """
+        Search TRIM for `ucns` in batches of batch_size, up to max_workers at
+        a time, and return the combined "Results" records in batch order.
+
+        With checkpoint_dir each completed batch is saved there, and a rerun
+        after a failure or interruption only searches the missing batches.
+        The checkpoints are removed once every batch has completed. If a
+        batch still fails after `retries` attempts, RuntimeError is raised
+        once the others have finished and been checkpointed, so partial
+        results never pass as complete.
+        """
+        batches = [ucns[i:i + batch_size] for i in range(0, len(ucns), batch_size)]
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(batches)
+
+        def checkpoint(batch: List[str]) -> Path:
+            digest = hashlib.sha1(",".join(batch).encode("utf-8")).hexdigest()[:16]
+            return Path(checkpoint_dir) / f"batch-{digest}.json"
+
+        pending = []
+        for i, batch in enumerate(batches):
+            if checkpoint_dir is not None and checkpoint(batch).exists():
+                with open(checkpoint(batch), "r") as jf:
+                    results[i] = json.load(jf)
+            else:
+                pending.append(i)
+        logger.info("TRIM batches: %d total, %d resumed from checkpoints, %d to search with %d workers",
+                    len(batches), len(batches) - len(pending), len(pending), max_workers)
+        if checkpoint_dir is not None:
+            Path(checkpoint_dir).mkdir(parents=True, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(self._search_batch, batches[i], retries, search_kwargs): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    logger.exception("TRIM batch %d/%d failed: %s", i + 1, len(batches), e)
+                    continue
+                logger.info("TRIM batch %d/%d done: %d records", i + 1, len(batches), len(results[i]))
+                if checkpoint_dir is not None:
+                    # Written aside and renamed into place, so a crash never leaves a truncated checkpoint
+                    path = checkpoint(batches[i])
+                    tmp_path = path.with_name(path.name + ".tmp")
+                    with open(tmp_path, "w") as jf:
+                        json.dump(results[i], jf)
+                    os.replace(tmp_path, path)
+
+        failed = [i + 1 for i, r in enumerate(results) if r is None]
+        if failed:
+            logger.error("TRIM batches failed: %s; rerun to resume them", failed)
+            raise RuntimeError(f"{len(failed)} of {len(batches)} TRIM batches failed: {failed}")
+        if checkpoint_dir is not None:
+            for batch in batches:
+                checkpoint(batch).unlink(missing_ok=True)
+        return [record for r in results if r for record in r]
+
     def identify_distinct_ind_shipto_ucn(self, df_idn: pd.DataFrame, parent_ucn: str,
                                          col_parent: str, col_ind: str, col_shipto: str) -> Dict[str, Any]:
         """
@@ -192,19 +295,15 @@ class TRIMService:
             "SHIPTO UCN List": distinct_shipto
         }
  
-    def extract_ind_shipto_ucn(self, ucns: List[str], excel_file: str, output_file: str,
-                               sheet_name: str = "Sheet1",
+    def explode_ind_shipto_ucn(self, ucns: List[str], df_idn: pd.DataFrame,
                                col_parent: str = "M_SUPER_PARNT_UNI_CUST_NO",
                                col_ind: str = "INDIV_UCN",
-                               col_shipto: str = "MEMBER_SHIPTO_UCN") -> List[str]:
+                               col_shipto: str = "MEMBER_SHIPTO_UCN") -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
-        Read the IDN explosion excel and produce:
-         - Summary sheet with counts
-         - Exploded sheet with parent->ind->shipto rows
-        Returns list of distinct shipto UCNs (flattened) as in previous script.
+        From the IDN explosion frame:
+         - Summary frame with counts per parent UCN
+         - Exploded frame with parent->ind->shipto rows
         """
-        df_idn = pd.read_excel(excel_file, sheet_name=sheet_name, engine="openpyxl",
-                               dtype={col_parent: str, col_ind: str, col_shipto: str})
         results = []
         exploded_rows = []
         for ucn in ucns:
@@ -221,7 +320,29 @@ class TRIMService:
                 })
  
         df_out = pd.DataFrame(results).drop(columns=["IND UCN List", "SHIPTO UCN List"], errors="ignore")
-        df_exploded = pd.DataFrame(exploded_rows)
+        df_exploded = pd.DataFrame(exploded_rows, columns=["Parent UCN", "IND UCN", "SHIPTO UCN"])
+        return df_out, df_exploded
+ 
+    @staticmethod
+    def distinct_shipto_ucns(df_exploded: pd.DataFrame) -> List[str]:
+        """Distinct ship-to UCNs of the Exploded frame, without the blanks padding shorter lists."""
+        shipto = df_exploded["SHIPTO UCN"].dropna().astype(str)
+        return shipto[shipto != ""].unique().tolist()
+ 
+    def extract_ind_shipto_ucn(self, ucns: List[str], excel_file: str, output_file: str,
+                               sheet_name: str = "Sheet1",
+                               col_parent: str = "M_SUPER_PARNT_UNI_CUST_NO",
+                               col_ind: str = "INDIV_UCN",
+                               col_shipto: str = "MEMBER_SHIPTO_UCN") -> List[str]:
+        """
+        Read the IDN explosion excel and produce:
+         - Summary sheet with counts
+         - Exploded sheet with parent->ind->shipto rows
+        Returns list of distinct shipto UCNs (flattened) as in previous script.
+        """
+        df_idn = pd.read_excel(excel_file, sheet_name=sheet_name, engine="openpyxl",
+                               dtype={col_parent: str, col_ind: str, col_shipto: str})
+        df_out, df_exploded = self.explode_ind_shipto_ucn(ucns, df_idn, col_parent, col_ind, col_shipto)
  
         out_path = Path(output_file)
         out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -230,13 +351,11 @@ class TRIMService:
             df_exploded.to_excel(writer, sheet_name="Exploded", index=False)
  
         logger.info("Written IDN extraction to: %s", out_path)
-        distinct_shipto = df_exploded["SHIPTO UCN"].dropna().astype(str).unique().tolist()
-        return distinct_shipto
+        return self.distinct_shipto_ucns(df_exploded)
  
-    def merge_parent_child_metadata(self, parent_excel: str, child_excel: str, final_output: str):
-        df1 = pd.read_excel(parent_excel)
-        df2 = pd.read_excel(child_excel)
-        combined = pd.concat([df1, df2], ignore_index=True)
+    def merge_parent_child(self, df_parent: pd.DataFrame, df_child: pd.DataFrame) -> pd.DataFrame:
+        """Parent rows followed by the child rows whose Article_Number is not already present."""
+        combined = pd.concat([df_parent, df_child], ignore_index=True)
         # Display record nos of duplicates that were dropped
         duplicates = combined[combined.duplicated(subset=['Article_Number'], keep=False)]
         if not duplicates.empty:
@@ -246,25 +365,31 @@ class TRIMService:
                 print(" ❗ %s", rec)
                 
         # Drop duplicates based on 'RecordNumber', keeping the first occurrence
-        combined = combined.drop_duplicates(subset=['Article_Number'], keep='first')
+        return combined.drop_duplicates(subset=['Article_Number'], keep='first')
+ 
+    def merge_parent_child_metadata(self, parent_excel: str, child_excel: str, final_output: str):
+        combined = self.merge_parent_child(pd.read_excel(parent_excel), pd.read_excel(child_excel))
         final_path = Path(final_output)
         final_path.parent.mkdir(parents=True, exist_ok=True)
         with pd.ExcelWriter(final_path, engine="openpyxl", datetime_format="yyyy-mm-dd HH:MM:SS") as writer:
             combined.to_excel(writer, sheet_name="Metadata", index=False)
         logger.info("Merged parent and child metadata into %s", final_output)
     
-    def add_parent_shipto(
+    def apply_parent_shipto(
         self,
-        excel_file_shipto_parent,
-        excel_file_metadata,
+        df_metadata: pd.DataFrame,
+        df_shipto_parent: pd.DataFrame,
         COL_NAME_PARENT,
         COL_NAME_SHIPTO,
         COL_NAME_METADATA_SHIPTO,
         COL_NAME_METADATA_PARENT,
-    ):
-        # Load data
-        df_shipto_parent = pd.read_excel(excel_file_shipto_parent, sheet_name="Exploded", engine="openpyxl", dtype=str)
-        df_metadata = pd.read_excel(excel_file_metadata, engine="openpyxl", dtype=str)
+    ) -> pd.DataFrame:
+        """
+        Metadata as text with COL_NAME_METADATA_PARENT mapped from the
+        ship-to UCN through the Exploded frame.
+        """
+        df_shipto_parent = as_text(df_shipto_parent)
+        df_metadata = as_text(df_metadata)
 
         # Normalize column names (remove case sensitivity and spaces)
         df_shipto_parent.columns = df_shipto_parent.columns.str.strip()
@@ -279,25 +404,40 @@ class TRIMService:
         
         # Map Parent UCN to metadata DataFrame based on SHIPTO UCN
         df_metadata[COL_NAME_METADATA_PARENT] = df_metadata[COL_NAME_METADATA_SHIPTO].map(shipto_to_parent_dict)
+        return df_metadata
+ 
+    def add_parent_shipto(
+        self,
+        excel_file_shipto_parent,
+        excel_file_metadata,
+        COL_NAME_PARENT,
+        COL_NAME_SHIPTO,
+        COL_NAME_METADATA_SHIPTO,
+        COL_NAME_METADATA_PARENT,
+    ):
+        # Load data
+        df_shipto_parent = pd.read_excel(excel_file_shipto_parent, sheet_name="Exploded", engine="openpyxl", dtype=str)
+        df_metadata = pd.read_excel(excel_file_metadata, engine="openpyxl", dtype=str)
+        df_metadata = self.apply_parent_shipto(df_metadata, df_shipto_parent, COL_NAME_PARENT, COL_NAME_SHIPTO,
+                                               COL_NAME_METADATA_SHIPTO, COL_NAME_METADATA_PARENT)
         
         with pd.ExcelWriter(excel_file_metadata, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
             df_metadata.to_excel(writer, index=False, sheet_name="Metadata")
         
         print(f"✅ Updated metadata with Parent UCN saved: {excel_file_metadata}")
     
-    def add_agreement_amendment_record_no_column(
+    def apply_agreement_amendment_record_no(
         self,
-        excel_file_metadata,
+        df_metadata: pd.DataFrame,
         col_name_related_rec
-    ):
-        # Load data
-        df_metadata = pd.read_excel(
-            excel_file_metadata,
-            engine="openpyxl",
-            dtype=str
-        )
-
+    ) -> pd.DataFrame:
+        """
+        Metadata with Product_Agreement_Rec and Amendments_Rec, the record
+        numbers of col_name_related_rec split by their "Add Prod Agree" line,
+        inserted after it. Rows without any are left empty (NaN).
+        """
         # Normalize column names
+        df_metadata = df_metadata.copy()
         df_metadata.columns = df_metadata.columns.str.strip()
 
         # Column names
@@ -316,12 +456,10 @@ class TRIMService:
         product_agreement_col = []
         amendment_col = []
 
-        for _, row in df_metadata.iterrows():
-            related_to = row.get(col_name_related_rec, "")
-
+        for related_to in df_metadata[col_name_related_rec]:
             if pd.isna(related_to):
-                product_agreement_col.append("")
-                amendment_col.append("")
+                product_agreement_col.append(np.nan)
+                amendment_col.append(np.nan)
                 continue
 
             product_agreements = []
@@ -339,18 +477,32 @@ class TRIMService:
                     else:
                         amendments.append(record_no)
 
-            product_agreement_col.append(", ".join(product_agreements))
-            amendment_col.append(", ".join(amendments))
+            product_agreement_col.append(", ".join(product_agreements) or np.nan)
+            amendment_col.append(", ".join(amendments) or np.nan)
 
         # Find index of related_records column
         insert_idx = df_metadata.columns.get_loc(col_name_related_rec) + 1
 
         # Insert columns right next to related_records
-        df_metadata.insert(insert_idx, PRODUCT_COL, product_agreement_col)
-        df_metadata.insert(insert_idx + 1, AMENDMENT_COL, amendment_col)
+        df_metadata.insert(insert_idx, PRODUCT_COL, pd.Series(product_agreement_col, index=df_metadata.index, dtype=object))
+        df_metadata.insert(insert_idx + 1, AMENDMENT_COL, pd.Series(amendment_col, index=df_metadata.index, dtype=object))
 
-        # Drop all columns which are completely empty
-        df_metadata = df_metadata.dropna(axis=1, how="all")
+        # Drop all other columns which are completely empty; the two above are kept even when blank
+        empty = df_metadata.columns[df_metadata.isna().all()].difference([PRODUCT_COL, AMENDMENT_COL])
+        return df_metadata.drop(columns=empty)
+ 
+    def add_agreement_amendment_record_no_column(
+        self,
+        excel_file_metadata,
+        col_name_related_rec
+    ):
+        # Load data
+        df_metadata = pd.read_excel(
+            excel_file_metadata,
+            engine="openpyxl",
+            dtype=str
+        )
+        df_metadata = self.apply_agreement_amendment_record_no(df_metadata, col_name_related_rec)
 
         # Save if output path provided
         with pd.ExcelWriter(excel_file_metadata, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
@@ -392,161 +544,196 @@ class RADARService:
             return None
  
     def download_using_ucn(self, conn: psycopg2.extensions.connection, table_name: str,
-                         filters: List[str], output_excel: str):
+                         filters: List[str], output_path: str, columns: Optional[List[str]] = None,
+                         end_date_from: str = RADAR_END_DATE_FROM):
         """
-        Query RADAR table filtering by cntrc_cust_id ILIKE patterns from filters.
-        Saves results to Excel.
+        Query RADAR table for contracts whose cntrc_cust_id is one of the
+        filters UCNs and that end on or after end_date_from. Streams the
+        selected columns (all when None) to a Parquet file.
         """
         if conn is None:
             logger.error("No connection provided to download_for_all.")
             return
  
-        where_clause = " OR ".join([f"cntrc_cust_id ILIKE '%{f}%'" for f in filters])
-        query = f"""
-            SELECT *
-            FROM {table_name}
-            WHERE ({where_clause})
-            AND (
-                cntrc_end_dt >= CURRENT_DATE
-                OR cntrc_end_dt >= CURRENT_DATE - INTERVAL '90 days'
-            );
-        """
-        query = f"""
-            SELECT *
-            FROM {table_name}
-            WHERE ({where_clause})
-            AND cntrc_end_dt >= DATE '2025-10-01';
-        """
-        logger.info("Running redshift query (table=%s) ...", table_name)
+        logger.info("Running redshift query (table=%s, %d UCNS) ...", table_name, len(filters))
         try:
-            df = pd.read_sql(query, conn)
-            if df.empty:
+            rows = download_to_parquet(conn, table_name, columns, "cntrc_cust_id", filters, output_path,
+                                       conditions=[("cntrc_end_dt", ">=", end_date_from)])
+            if rows == 0:
                 logger.warning("No rows found in RADAR for filters: %s", filters)
-            else:
-                out_path = Path(output_excel)
-                out_path.parent.mkdir(parents=True, exist_ok=True)
-                with pd.ExcelWriter(out_path, engine="openpyxl", datetime_format="yyyy-mm-dd HH:MM:SS") as writer:
-                    df.to_excel(writer, sheet_name="Metadata", index=False)
-                logger.info("Saved RADAR results to %s", out_path)
+            logger.info("Saved %d RADAR rows to %s", rows, output_path)
         except Exception as e:
             logger.exception("Error while querying RADAR: %s", e)
+            raise
  
     def download_using_ics(self, conn: psycopg2.extensions.connection, table_name: str,
-                         filters: List[str], output_excel: str):
+                         filters: List[str], output_path: str, columns: Optional[List[str]] = None):
+        """Same as download_using_ucn, matching cntrc_id against the ICS filters."""
         if conn is None:
             logger.error("No connection provided to download_for_all.")
             return
        
+        logger.info("Running redshift query (table=%s, %d ICS) ...", table_name, len(filters))
         try:
-            where_clause = " OR ".join([f"cntrc_id ILIKE '%{f}%'" for f in filters])
- 
-            query = f"""
-                SELECT *
-                FROM {table_name}
-                WHERE ({where_clause});
-            """
-            df = pd.read_sql(query, conn)
-       
-            if df.empty:
-                print(f"\n⚠️ No rows found in '{table_name}' where contract_name contains '{filter}'.")
-            else:
-                out_path = Path(output_excel)
-                out_path.parent.mkdir(parents=True, exist_ok=True)
-                with pd.ExcelWriter(out_path, engine="openpyxl", datetime_format="yyyy-mm-dd HH:MM:SS") as writer:
-                    df.to_excel(writer, sheet_name="Metadata", index=False)
-                logger.info("Saved RADAR results to %s", out_path)
+            rows = download_to_parquet(conn, table_name, columns, "cntrc_id", filters, output_path)
+            if rows == 0:
+                logger.warning("No rows found in '%s' for the %d ICS filters", table_name, len(filters))
+            logger.info("Saved %d RADAR rows to %s", rows, output_path)
         except Exception as e:
             logger.exception("Error while querying RADAR: %s", e)
+            raise
        
-    def run_radar_download(self, UCNS_list: List[str], table_ucn: List[str], table_ics: List[str], temp_root: Path):
+    def run_radar_download(self, UCNS_list: List[str], ICS_list: List[str], table_ucn: List[str], table_ics: List[str],
+                           temp_root: Path, columns: Optional[Dict[str, List[str]]] = None):
+        """
+        Download every RADAR table to temp_root/RADAR_{UCN|ICS}_<view>.parquet,
+        selecting columns[table]. ICS_list are the ICS values of the TRIM metadata.
+        """
+        columns = columns or {}
         conn = self.test_redshift_connection()
         if not conn:
             raise ConnectionError("Could not connect to Redshift")
         try:
             for table in table_ucn:
-                self.download_using_ucn(conn, table, UCNS_list, temp_root / f"RADAR_UCN_{table.split('.')[-1]}.xlsx")
-            df_ics = pd.read_excel(temp_root / "processed_metadata_iter_1.xlsx", dtype={"ICS": str})
-            ICS_list = df_ics["ICS"].dropna().astype(str).unique().tolist()
+                self.download_using_ucn(conn, table, UCNS_list, temp_root / f"RADAR_UCN_{table.split('.')[-1]}.parquet",
+                                        columns=columns.get(table))
+            ICS_list = pd.Series(ICS_list, dtype=object).dropna().astype(str).unique().tolist()
             # Only consider ICS values that are numeric
             ICS_list = [ics for ics in ICS_list if re.match(r'^\d+$', ics)]
             
             for table in table_ics:
-                self.download_using_ics(conn, table, ICS_list, temp_root / f"RADAR_ICS_{table.split('.')[-1]}.xlsx")
+                self.download_using_ics(conn, table, ICS_list, temp_root / f"RADAR_ICS_{table.split('.')[-1]}.parquet",
+                                        columns=columns.get(table))
         finally:
             conn.close()
             logger.info("Closed Redshift connection")
  
-    def replace_trim_with_radar_ucn(self,
-                                excel_file_trim: str,
-                                excel_file_radar: str,
-                                sheet_name_trim: str,
-                                sheet_name_radar: str,
-                                common_column_name_trim: str,
-                                common_column_name_radar: str,
-                                field_map: Dict[str, str],
-                                output_trim_file: Optional[str] = None) -> Dict[str, Any]:
+    def apply_radar_ucn(self, df_trim: pd.DataFrame, df_radar: pd.DataFrame,
+                        common_column_name_trim: str, common_column_name_radar: str,
+                        field_map: Dict[str, str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
-        Replace values in TRIM dataframe with matching RADAR values using field_map mapping.
-        Returns a report dict with counts and path to saved files.
+        Replace TRIM values with the RADAR values of the matching record, per
+        field_map {radar_field: trim_field}, as one join. Missing RADAR values
+        are ignored. Returns the updated TRIM frame (blanks filled with "N/A")
+        and one row per changed record with the old and new values.
         """
-        df_trim = pd.read_excel(excel_file_trim, sheet_name=sheet_name_trim, engine="openpyxl")
+        df_trim = df_trim.copy()
         df_trim.columns = df_trim.columns.str.strip()
-        df_radar = pd.read_excel(excel_file_radar, sheet_name=sheet_name_radar, engine="openpyxl")
+        df_radar = df_radar.copy()
         df_radar.columns = df_radar.columns.str.strip()
  
         df_trim[common_column_name_trim] = df_trim[common_column_name_trim].astype(str).str.strip()
         df_radar[common_column_name_radar] = df_radar[common_column_name_radar].astype(str).str.strip()
  
         df_trim = df_trim.drop_duplicates(subset=[common_column_name_trim])
-        df_radar = df_radar.drop_duplicates(subset=[common_column_name_radar])
+        df_radar = df_radar.drop_duplicates(subset=[common_column_name_radar]).set_index(common_column_name_radar)
  
-        radar_lookup = df_radar.set_index(common_column_name_radar).to_dict(orient="index")
+        # Position of every TRIM record's RADAR row, -1 without one
+        positions = df_radar.index.get_indexer(df_trim[common_column_name_trim])
  
-        changes = []
-        for idx, row in df_trim.iterrows():
-            rec_id = row.get(common_column_name_trim, "")
-            if rec_id in radar_lookup:
-                radar_row = radar_lookup[rec_id]
-                updated = False
-                change_record = {"RecordNumber": rec_id, "row_index": int(idx)}
-                for radar_field, trim_field in field_map.items():
-                    if radar_field not in radar_row:
-                        continue
-                    radar_val = radar_row[radar_field]
-                    if pd.isna(radar_val):
-                        continue
-                    old_val = df_trim.at[idx, trim_field] if trim_field in df_trim.columns else None
-                    new_val = radar_val
-                    if str(old_val) != str(new_val):
-                        if trim_field not in df_trim.columns:
-                            df_trim[trim_field] = pd.NA
-                        df_trim.at[idx, trim_field] = new_val
-                        updated = True
-                        change_record[f"{trim_field}_old"] = old_val
-                        change_record[f"{trim_field}_new"] = new_val
-                if updated:
-                    changes.append(change_record)
+        changes = pd.DataFrame({"RecordNumber": df_trim[common_column_name_trim], "row_index": df_trim.index.astype(int)},
+                               index=df_trim.index)
+        changed = pd.Series(False, index=df_trim.index)
+        first_change = {}
+        for radar_field, trim_field in field_map.items():
+            if radar_field not in df_radar.columns:
+                continue
+            # Object values keep RADAR's own types; the trailing None is picked by position -1
+            values = np.append(df_radar[radar_field].to_numpy(dtype=object), None)
+            new_val = pd.Series(values[positions], index=df_trim.index, dtype=object)
+            old_val = df_trim[trim_field] if trim_field in df_trim.columns else pd.Series(None, index=df_trim.index, dtype=object)
+            differs = new_val.notna() & (old_val.map(str) != new_val.map(str))
+            if not differs.any():
+                continue
+            changes[f"{trim_field}_old"] = old_val.where(differs)
+            changes[f"{trim_field}_new"] = new_val.where(differs)
+            df_trim[trim_field] = old_val.astype(object).mask(differs, new_val)
+            changed |= differs
+            first_change[trim_field] = int(differs.to_numpy().argmax())
  
-        if output_trim_file is None:
-            output_trim_file = str(Path(excel_file_trim).with_name(Path(excel_file_trim).stem + "_updated.xlsx"))
+        # Report columns in the order the fields first change, record by record
+        fields = sorted(first_change, key=first_change.get)
+        columns = ["RecordNumber", "row_index"] + [f"{f}_{kind}" for f in fields for kind in ("old", "new")]
+        return df_trim.fillna("N/A"), changes.loc[changed, columns].reset_index(drop=True)
+ 
+    def apply_radar_ics_pricing_terms(self, df_trim: pd.DataFrame, df_radar: pd.DataFrame,
+                                      common_column_name_trim: str, common_column_name_radar: str,
+                                      column_map_trim: str, column_map_radar: str) -> pd.DataFrame:
+        """Set column_map_trim to the distinct RADAR pricing programs of each ICS, comma-separated."""
+        # Remove patterns like: PP001, PP001 -, PP002 ..., PP007 ..., PP001B - 
+        programs = df_radar[[common_column_name_radar]].assign(
+            **{column_map_radar: df_radar[column_map_radar].str.replace(r"^PP\d{3}[A-Z]?\s*-?\s*", "", regex=True)}
+        )
+        radar_map = self._join_distinct(programs, common_column_name_radar, column_map_radar)
+        df_trim = df_trim.copy()
+        df_trim[column_map_trim] = df_trim[common_column_name_trim].map(radar_map)
+        return df_trim
  
-        df_trim = df_trim.fillna("N/A")
+    def apply_radar_ics_eligible_participants(self, df_trim: pd.DataFrame, df_radar: pd.DataFrame,
+                                              common_column_name_trim: str, common_column_name_radar: str,
+                                              column_map_trim: str, column_map_radar: List[str]) -> pd.DataFrame:
+        """Set column_map_trim to the distinct RADAR eligible customers of each ICS, comma-separated."""
+        # Combine multiple columns in radar into single space-separated string
+        parts = df_radar[column_map_radar].fillna('').astype(str)
+        combined = parts.iloc[:, 0]
+        for column in parts.columns[1:]:
+            combined = combined + ' ' + parts[column]
+        combined = combined.str.strip(' ')
+        participants = pd.DataFrame({common_column_name_radar: df_radar[common_column_name_radar], 'combined_elig': combined})
+        radar_map = self._join_distinct(participants, common_column_name_radar, 'combined_elig')
+        df_trim = df_trim.copy()
+        df_trim[column_map_trim] = df_trim[common_column_name_trim].map(radar_map)
+        return df_trim
+ 
+    @staticmethod
+    def _join_distinct(df: pd.DataFrame, key: str, column: str) -> pd.Series:
+        """key -> ", " joined distinct values of column, in order of appearance."""
+        return df.drop_duplicates(subset=[key, column]).groupby(key, sort=False)[column].agg(", ".join)
+ 
+    @staticmethod
+    def write_trim(df_trim: pd.DataFrame, output_trim_file: str, sheet_name: str = "Metadata"):
         out_path = Path(output_trim_file)
         out_path.parent.mkdir(parents=True, exist_ok=True)
         with pd.ExcelWriter(out_path, engine="xlsxwriter", datetime_format="yyyy-mm-dd HH:MM:SS") as writer:
-            df_trim.to_excel(writer, sheet_name=sheet_name_trim, index=False)
- 
-        changes_df = pd.DataFrame(changes)
-        changes_report_path = str(out_path).replace(".xlsx", "_changes_report.xlsx")
-        if not changes_df.empty:
-            with pd.ExcelWriter(changes_report_path, engine="xlsxwriter", datetime_format="yyyy-mm-dd HH:MM:SS" ) as writer:
-                changes_df.to_excel(writer, index=False, sheet_name="Summary")
-            logger.info("Saved changes report to: %s", changes_report_path)
-        else:
+            df_trim.to_excel(writer, sheet_name=sheet_name, index=False)
+ 
+    @staticmethod
+    def write_changes_report(changes_df: pd.DataFrame, output_trim_file: str) -> Optional[str]:
+        """Save the changes next to output_trim_file; returns its path, None if there were none."""
+        if changes_df.empty:
             logger.info("No changes were made during radar->trim replace.")
+            return None
+        changes_report_path = str(output_trim_file).replace(".xlsx", "_changes_report.xlsx")
+        with pd.ExcelWriter(changes_report_path, engine="xlsxwriter", datetime_format="yyyy-mm-dd HH:MM:SS" ) as writer:
+            changes_df.to_excel(writer, index=False, sheet_name="Summary")
+        logger.info("Saved changes report to: %s", changes_report_path)
+        return changes_report_path
+ 
+    def replace_trim_with_radar_ucn(self,
+                                excel_file_trim: str,
+                                excel_file_radar: str,
+                                sheet_name_trim: str,
+                                sheet_name_radar: str,
+                                common_column_name_trim: str,
+                                common_column_name_radar: str,
+                                field_map: Dict[str, str],
+                                output_trim_file: Optional[str] = None) -> Dict[str, Any]:
+        """
+        File-based apply_radar_ucn: reads both extracts, saves the updated TRIM
+        file and its changes report. Returns a report dict with counts and paths.
+        """
+        df_trim = pd.read_excel(excel_file_trim, sheet_name=sheet_name_trim, engine="openpyxl")
+        df_radar = read_radar_file(excel_file_radar, sheet_name=sheet_name_radar)
+        df_trim, changes_df = self.apply_radar_ucn(df_trim, df_radar, common_column_name_trim,
+                                                   common_column_name_radar, field_map)
+ 
+        if output_trim_file is None:
+            output_trim_file = str(Path(excel_file_trim).with_name(Path(excel_file_trim).stem + "_updated.xlsx"))
+        self.write_trim(df_trim, output_trim_file, sheet_name_trim)
+        changes_report_path = self.write_changes_report(changes_df, output_trim_file)
  
-        logger.info("Updated TRIM saved to: %s", out_path)
-        return {"updated_trim": str(out_path), "changes_report": changes_report_path if not changes_df.empty else None, "changes_count": len(changes)}
+        logger.info("Updated TRIM saved to: %s", output_trim_file)
+        return {"updated_trim": str(output_trim_file), "changes_report": changes_report_path, "changes_count": len(changes_df)}
 
     def replace_trim_with_radar_ics_pricing_terms(self,
                                     excel_file_trim: str,
@@ -558,43 +745,13 @@ class RADARService:
                                     column_map_trim: str,
                                     column_map_radar: str,
                                     output_trim_file: Optional[str] = None) -> Dict[str, Any]:
-        """
-        Replace values in TRIM dataframe with matching RADAR values using field_map mapping.
-        Returns a report dict with counts and path to saved files.
-        """
+        """File-based apply_radar_ics_pricing_terms."""
         try:
-            # Load data
             df_trim = pd.read_excel(excel_file_trim, sheet_name=sheet_name_trim, engine="openpyxl", dtype={"ICS": str})
-            df_radar = pd.read_excel(excel_file_radar, sheet_name=sheet_name_radar, engine="openpyxl", dtype={"cntrc_id": str})
-            
-            # # Normalize columns
-            # df_trim.columns = df_trim.columns.str.strip()
-            # df_radar.columns = df_radar.columns.str.strip()
-            
-            # Remove patterns like: PP001, PP001 -, PP002 ..., PP007 ..., PP001B - 
-            df_radar[column_map_radar] = df_radar[column_map_radar].str.replace(
-                r"^PP\d{3}[A-Z]?\s*-?\s*", "", 
-                regex=True
-            )
-            
-            # Group values into comma-separated text
-            radar_map = (
-                df_radar
-                .groupby(common_column_name_radar)[column_map_radar]
-                .apply(lambda x: ", ".join(x.unique()))
-                .to_dict()
-            )
-            
-            # Ensure Type_of_Pricing column exists
-            if column_map_trim not in df_trim.columns:
-                df_trim[column_map_trim] = np.nan  # create at end
-
-            # Replace Type_of_Pricing based on ICS values
-            df_trim[column_map_trim] = df_trim[common_column_name_trim].map(radar_map)
-
-            # Save
-            with pd.ExcelWriter(output_trim_file, engine="xlsxwriter", datetime_format="yyyy-mm-dd HH:MM:SS") as writer:
-                df_trim.to_excel(writer, sheet_name=sheet_name_trim, index=False)
+            df_radar = read_radar_file(excel_file_radar, sheet_name=sheet_name_radar, dtype={"cntrc_id": str})
+            df_trim = self.apply_radar_ics_pricing_terms(df_trim, df_radar, common_column_name_trim,
+                                                         common_column_name_radar, column_map_trim, column_map_radar)
+            self.write_trim(df_trim, output_trim_file, sheet_name_trim)
             logger.info("Updated TRIM with Pricing Terms saved to: %s", output_trim_file)    
         except Exception as e:
             logger.exception("Error in replace_trim_with_radar_ics_pricing_terms: %s", e)
@@ -610,38 +767,13 @@ class RADARService:
                                 column_map_trim: str,
                                 column_map_radar: List[str],
                                 output_trim_file: Optional[str] = None) -> Dict[str, Any]:
-        """
-        Replace values in TRIM dataframe with matching RADAR values using field_map mapping.
-        Returns a report dict with counts and path to saved files.
-        """
+        """File-based apply_radar_ics_eligible_participants."""
         try:
-            # Load data
             df_trim = pd.read_excel(excel_file_trim, sheet_name=sheet_name_trim, engine="openpyxl", dtype={"ICS": str})
-            df_radar = pd.read_excel(excel_file_radar, sheet_name=sheet_name_radar, engine="openpyxl", dtype={"cntrc_id": str})
-            
-            # Combine multiple columns in radar into single comma-separated string
-            df_radar[column_map_radar] = df_radar[column_map_radar].astype(str).fillna('')
-            df_radar['combined_elig'] = df_radar[column_map_radar].agg(' '.join, axis=1).str.strip(' ')
-            
-            
-            # Group values into comma-separated text
-            radar_map = (
-                df_radar
-                .groupby(common_column_name_radar)['combined_elig']
-                .apply(lambda x: ", ".join(x.unique()))
-                .to_dict()
-            )
-            
-            # Ensure Eligible_Participants column exists
-            if column_map_trim not in df_trim.columns:
-                df_trim[column_map_trim] = np.nan  # create at end
-
-            # Replace Eligible_Participants based on ICS values
-            df_trim[column_map_trim] = df_trim[common_column_name_trim].map(radar_map)
-
-            # Save
-            with pd.ExcelWriter(output_trim_file, engine="xlsxwriter", datetime_format="yyyy-mm-dd HH:MM:SS") as writer:
-                df_trim.to_excel(writer, sheet_name=sheet_name_trim, index=False)
+            df_radar = read_radar_file(excel_file_radar, sheet_name=sheet_name_radar, dtype={"cntrc_id": str})
+            df_trim = self.apply_radar_ics_eligible_participants(df_trim, df_radar, common_column_name_trim,
+                                                                 common_column_name_radar, column_map_trim, column_map_radar)
+            self.write_trim(df_trim, output_trim_file, sheet_name_trim)
             logger.info("Updated TRIM with Eligible Participants saved to: %s", output_trim_file)
         except Exception as e:
             logger.exception("Error in replace_trim_with_radar_ics_eligible_participants: %s", e)
@@ -652,22 +784,21 @@ class LexoraService:
     def __init__(self):
         self.lexora_file_path = Path(r"C:\temp\metadata\lexora_metadata.xlsx")
     
-    def add_lexora_metadata(self,
-                                excel_file_iter_2: str,
-                                excel_file_lexora: str,
-                                sheet_name_iter_2: str,
-                                sheet_name_lexora: str,
-                                common_column_name_iter_2: str,
-                                common_column_name_lexora: str,
-                                field_map: Dict[str, str],
-                                output_trim_file: Optional[str] = None) -> Dict[str, Any]:
+    def apply_lexora_metadata(self,
+                              df_iter_2: pd.DataFrame,
+                              df_lexora: pd.DataFrame,
+                              common_column_name_iter_2: str,
+                              common_column_name_lexora: str,
+                              field_map: Dict[str, str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
-        Replace values in TRIM dataframe with matching RADAR values using field_map mapping.
-        Returns a report dict with counts and path to saved files.
+        Fill TRIM values missing from df_iter_2 (Contract_Type always) with the
+        matching Lexora values, per field_map {trim_field: lexora_field}.
+        Returns the updated frame (blanks filled with "N/A") and one row per
+        changed record with the new values.
         """
-        df_iter_2 = pd.read_excel(excel_file_iter_2, sheet_name=sheet_name_iter_2, engine="openpyxl")
+        df_iter_2 = df_iter_2.copy()
         df_iter_2.columns = df_iter_2.columns.str.strip()
-        df_lexora = pd.read_excel(excel_file_lexora, sheet_name=sheet_name_lexora, engine="openpyxl")
+        df_lexora = df_lexora.copy()
         df_lexora.columns = df_lexora.columns.str.strip()
  
         df_iter_2[common_column_name_iter_2] = df_iter_2[common_column_name_iter_2].astype(str).str.strip()
@@ -705,28 +836,56 @@ class LexoraService:
                 if updated:
                     changes.append(change_record)
  
+        return df_iter_2.fillna("N/A"), pd.DataFrame(changes)
+ 
+    @staticmethod
+    def write_changes_report(changes_df: pd.DataFrame, output_trim_file: str) -> Optional[str]:
+        """Save the changes next to output_trim_file; returns its path, None if there were none."""
+        if changes_df.empty:
+            print("No changes were made during radar->trim replace.")
+            return None
+        changes_report_path = str(output_trim_file).replace(".xlsx", "_changes_report.xlsx")
+        with pd.ExcelWriter(changes_report_path, engine="xlsxwriter") as writer:
+            changes_df.to_excel(writer, index=False, sheet_name="changes")
+        print("Saved changes report to: %s", changes_report_path)
+        return changes_report_path
+ 
+    def add_lexora_metadata(self,
+                                excel_file_iter_2: str,
+                                excel_file_lexora: str,
+                                sheet_name_iter_2: str,
+                                sheet_name_lexora: str,
+                                common_column_name_iter_2: str,
+                                common_column_name_lexora: str,
+                                field_map: Dict[str, str],
+                                output_trim_file: Optional[str] = None) -> Dict[str, Any]:
+        """
+        File-based apply_lexora_metadata: reads both workbooks, saves the
+        updated TRIM file and its changes report.
+        """
+        df_iter_2 = pd.read_excel(excel_file_iter_2, sheet_name=sheet_name_iter_2, engine="openpyxl")
+        df_lexora = pd.read_excel(excel_file_lexora, sheet_name=sheet_name_lexora, engine="openpyxl")
+        df_iter_2, changes_df = self.apply_lexora_metadata(df_iter_2, df_lexora, common_column_name_iter_2,
+                                                           common_column_name_lexora, field_map)
+ 
         if output_trim_file is None:
             output_trim_file = str(Path(excel_file_iter_2).with_name(Path(excel_file_iter_2).stem + "_updated.xlsx"))
  
-        df_iter_2 = df_iter_2.fillna("N/A")
         out_path = Path(output_trim_file)
         out_path.parent.mkdir(parents=True, exist_ok=True)
         with pd.ExcelWriter(out_path, engine="xlsxwriter", datetime_format="yyyy-mm-dd") as writer:
             df_iter_2.to_excel(writer, sheet_name=sheet_name_iter_2, index=False)
+        self.write_changes_report(changes_df, str(out_path))
  
-        changes_df = pd.DataFrame(changes)
-        changes_report_path = str(out_path).replace(".xlsx", "_changes_report.xlsx")
-        if not changes_df.empty:
-            with pd.ExcelWriter(changes_report_path, engine="xlsxwriter") as writer:
-                changes_df.to_excel(writer, index=False, sheet_name="changes")
-            print("Saved changes report to: %s", changes_report_path)
-        else:
-            print("No changes were made during radar->trim replace.")
-
         print("Updated TRIM saved to: %s", out_path)
     
-    def fix_refer_parent_document(self, input_excel: str, output_excel: str) -> None:
-        df = pd.read_excel(input_excel, engine="openpyxl", dtype=str)
+    def apply_refer_parent_document(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        """
+        Metadata as text with every "refer parent document" value of a child
+        document replaced by its .001 parent's value. Returns the frame and
+        the number of values replaced.
+        """
+        df = as_text(df)
 
         # Normalize Article_Number
         df["Article_Number"] = df["Article_Number"].str.strip()
@@ -760,6 +919,11 @@ class LexoraService:
 
         # Cleanup helper columns
         df.drop(columns=["base_id", "suffix"], inplace=True)
+        return df, count_references_fixed
+ 
+    def fix_refer_parent_document(self, input_excel: str, output_excel: str) -> None:
+        df = pd.read_excel(input_excel, engine="openpyxl", dtype=str)
+        df, count_references_fixed = self.apply_refer_parent_document(df)
 
         # Save output
         with pd.ExcelWriter(output_excel, engine="xlsxwriter") as writer:
@@ -771,9 +935,11 @@ class LexoraService:
 # ---------------------------
 class MetadataPipeline:
     """High-level orchestrator that uses TRIMService and RADARService to run pipeline iterations."""
-    def __init__(self, config_path: str = "configs/config.ini", environment: str = "QA"):
+    def __init__(self, config_path: str = "configs/config.ini", environment: str = "QA",
+                 trim_route_url: str = TRIM_ROUTE_URL):
         self.config_mgr = ConfigManager(config_path=config_path, environment=environment)
-        self.trim = TRIMService()
+        # trim_route_url can point at a local stub of the TRIM ServiceAPI
+        self.trim = TRIMService(route_url=trim_route_url)
         self.radar = RADARService(self.config_mgr.redshift)
         self.lexora = LexoraService()
  
@@ -783,122 +949,104 @@ class MetadataPipeline:
         self.IDN_report = Path(r"IDN Full Explosion Report 11.24.2025.xlsx")
         self.table_ucn = ["md_ldw.dim_cntrc_vw"]
         self.table_ics = ["md_ldw.dim_prc_prg_vw", "md_ldw.dim_prc_cmpnt_cust_elig_vw"]
+        # Only the columns the second iteration reads are downloaded
+        self.radar_columns = {
+            "md_ldw.dim_cntrc_vw": ["rec_mgmt_id", *RADAR_UCN_FIELD_MAP],
+            "md_ldw.dim_prc_prg_vw": ["cntrc_id", "prc_prg_nm"],
+            "md_ldw.dim_prc_cmpnt_cust_elig_vw": ["cntrc_id", "elig_cust_ucn", "elig_cust_nm"],
+        }
+ 
+    def new_run_dir(self) -> Path:
+        """
+        A directory of its own under temp_root/runs for one pipeline run, so
+        concurrent runs never read or overwrite each other's intermediate files.
+        Shared inputs (active_records.xlsx, actual_contracts) stay in temp_root.
+        """
+        run_dir = self.temp_root / "runs" / f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        run_dir.mkdir(parents=True, exist_ok=True)
+        return run_dir
  
-    def first_iteration(self, ucns: List[str]) -> Dict[str, Any]:
+    def context(self, run_dir: Optional[Path], context: Optional[PipelineContext] = None) -> PipelineContext:
+        """The run's context, or a new one over run_dir (temp_root by default) reading its checkpoints."""
+        if context is not None:
+            return context
+        return PipelineContext(Path(run_dir) if run_dir is not None else self.temp_root)
+ 
+    def first_iteration(self, ucns: List[str], run_dir: Optional[Path] = None,
+                        context: Optional[PipelineContext] = None) -> Dict[str, Any]:
         """Performs TRIM extraction for parent UCNS and then extracts ship-to UCNs in batches."""
+        context = self.context(run_dir, context)
         start_time = datetime.now()
         # run parent extraction
         logger.info("Starting first iteration for UCNS: %s", ucns)
-        self.trim.python_trim_script(
+        parent_results = self.trim.python_trim_script(
                         full_extract=True,
                         download=False,
                         download_all=False,
                         record_uris=None,
+                        route_url=self.trim.route_url,
                         customer_ucns=",".join(ucns),
                         start_date="2020-01-01 00:00",
-                        end_date="2025-02-01 23:59"
+                        end_date="2025-02-01 23:59",
+                        save_metadata=False,
+                        logger=logger
                     )
+        if parent_results is None:
+            raise RuntimeError(f"TRIM search failed for UCNS: {ucns}")
         # self.trim.run_trim_script(filter_type="ucn", customer_ucns=",".join(ucns), download="false", download_all="false")
-        # move metadata.json from latest genai folder to metadata folder
-        try:
-            self.trim.move_file("metadata.json", str(self.temp_root), parent_folder=str(self.genai_folder), replace=True)
-        except Exception as e:
-            logger.exception("Failed to move parent metadata.json: %s", e)
-            # continue: maybe file already moved or not present
- 
-        # call metadata_preprocessor (assumes function exists in utils.metadata_preprocessor)
+        # preprocess the search results in memory, no metadata.json hand-off through the genai folder
         try:
-           
-            metadata_preprocessor(json_file=str(self.temp_root / "metadata.json"),
-                                  target_folder=str(self.temp_root / "actual_contracts"),
-                                  excel_name=str(self.temp_root / "processed_metadata.xlsx"),
-                                  active_only=False)
+            df_parent = metadata_preprocessor(json_file=parent_results,
+                                              target_folder=str(self.temp_root / "actual_contracts"),
+                                              active_only=False)
         except Exception as e:
             logger.warning("metadata_preprocessor step failed: %s", e)
             raise
        
         # For time being, using Joe's active records to merge with TRIM metadata
-        merge_contracts(excel_file_1=str(self.temp_root / "processed_metadata.xlsx"),
-                        excel_file_2=str(self.temp_root / "active_records.xlsx"),
-                        sheet_name_1="Metadata",
-                        sheet_name_2="Active Records Joe",
-                        COL1="Article_Number",
-                        COL2="Record Number")
+        df_active = pd.read_excel(self.temp_root / "active_records.xlsx", sheet_name="Active Records Joe", engine="openpyxl")
+        df_parent, df_missing = match_active_records(df_parent, df_active, COL1="Article_Number", COL2="Record Number")
+        context.checkpoint("missing_records", df_missing)
        
         # extract IND / SHIPTO UCNs from IDN report
-        idn_report = self.IDN_report
-        out_ucn_distinct = self.temp_root / "UCN_Distinct_Output.xlsx"
-        shipto_ucns = self.trim.extract_ind_shipto_ucn(ucns, excel_file=str(idn_report), output_file=str(out_ucn_distinct))
- 
-        df_shipto = pd.read_excel(out_ucn_distinct, sheet_name="Exploded", engine="openpyxl", dtype={"SHIPTO UCN": str})
-        shipto_ucns = df_shipto["SHIPTO UCN"].dropna().astype(str).unique().tolist()
- 
-        # process shipTo in batches
-        total_records = len(shipto_ucns)
-        batch_size = 300
-        left = 0
-        shipTo_metadata_results = []
-        logger.info("Total ship-to UCNS to process: %d", total_records)
- 
-        while left < total_records:
-            batch = shipto_ucns[left:left + batch_size]
-            batch_ucns = ",".join(batch)
-            left += batch_size
-            logger.info("Processing shipTo batch of size %d", len(batch))
-            self.trim.python_trim_script(
-                        full_extract=True,
-                        download=False,
-                        download_all=False,
-                        record_uris=None,
-                        customer_ucns=batch_ucns,
-                        start_date="2020-01-01 00:00",
-                        end_date="2025-02-01 23:59"
-                    )
-            # self.trim.run_trim_script(filter_type="ucn", customer_ucns=batch_ucns, download="false", download_all="false")
-            try:
-                moved = self.trim.move_file("metadata.json", str(self.temp_root / "shipTo"), parent_folder=str(self.genai_folder), replace=True)
-            except Exception as e:
-                logger.exception("Failed to move shipTo metadata.json: %s", e)
-                continue
- 
-            shipto_path = self.temp_root / "shipTo" / "metadata.json"
-            if not shipto_path.exists():
-                logger.warning("Expected shipto metadata.json not found at %s", shipto_path)
-                continue
- 
-            with open(shipto_path, "r") as jf:
-                json_data = json.load(jf)
-                shipTo_metadata_results.extend(json_data.get("Results", []))
+        df_idn = pd.read_excel(self.IDN_report, sheet_name="Sheet1", engine="openpyxl",
+                               dtype={"M_SUPER_PARNT_UNI_CUST_NO": str, "INDIV_UCN": str, "MEMBER_SHIPTO_UCN": str})
+        _, df_exploded = self.trim.explode_ind_shipto_ucn(ucns, df_idn)
+        df_exploded = context.checkpoint("ucn_exploded", df_exploded)
+        shipto_ucns = self.trim.distinct_shipto_ucns(df_exploded)
  
-        # write combined shipTo metadata
-        combined_shipto = {"Results": shipTo_metadata_results}
-        shipto_meta_file = self.temp_root / "shipTo" / "metadata.json"
-        shipto_meta_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(shipto_meta_file, "w") as ef:
-            json.dump(combined_shipto, ef, indent=4)
+        # process shipTo in concurrent batches, resuming any batches this run completed before failing
+        logger.info("Total ship-to UCNS to process: %d", len(shipto_ucns))
+        shipTo_metadata_results = self.trim.extract_ucn_batches(
+            shipto_ucns,
+            checkpoint_dir=context.run_dir / "shipTo" / "batches",
+            full_extract=True,
+            download=False,
+            download_all=False,
+            record_uris=None,
+            start_date="2020-01-01 00:00",
+            end_date="2025-02-01 23:59"
+        )
  
-        # preprocess shipTo metadata into excel
+        # preprocess the combined shipTo results
         try:
-            metadata_preprocessor(json_file=str(shipto_meta_file),
-                                  target_folder=str(self.temp_root / "actual_contracts"),
-                                  excel_name=str(self.temp_root / "shipTo" / "processed_metadata.xlsx"),
-                                  active_only=True)
+            df_child = metadata_preprocessor(json_file={"Results": shipTo_metadata_results},
+                                             target_folder=str(self.temp_root / "actual_contracts"),
+                                             active_only=True)
         except Exception as e:
             logger.warning("metadata_preprocessor for shipTo failed: %s", e)
             raise
-        # merge parent and child into a single file
+        # merge parent and child into a single frame
         try:
-            self.trim.merge_parent_child_metadata(parent_excel=str(self.temp_root / "processed_metadata.xlsx"),
-                                                  child_excel=str(self.temp_root / "shipTo" / "processed_metadata.xlsx"),
-                                                  final_output=str(self.temp_root / "processed_metadata_iter_1.xlsx"))
+            df_metadata = self.trim.merge_parent_child(df_parent, df_child)
         except Exception as e:
             logger.exception("Failed to merge parent & child metadata: %s", e)
             raise
         # add parent UCN to metadata
         try:
-            self.trim.add_parent_shipto(
-                excel_file_shipto_parent=str(out_ucn_distinct),
-                excel_file_metadata=str(self.temp_root / "processed_metadata_iter_1.xlsx"),
+            df_metadata = self.trim.apply_parent_shipto(
+                df_metadata,
+                df_exploded,
                 COL_NAME_PARENT="Parent UCN",
                 COL_NAME_SHIPTO="SHIPTO UCN",
                 COL_NAME_METADATA_SHIPTO="UCN",
@@ -910,21 +1058,22 @@ class MetadataPipeline:
         
         # dissect related_records to extract agreement and amendment record numbers
         try:
-            self.trim.add_agreement_amendment_record_no_column(
-                excel_file_metadata=str(self.temp_root / "processed_metadata_iter_1.xlsx"),
-                col_name_related_rec="Related_Records"
-            )
+            df_metadata = self.trim.apply_agreement_amendment_record_no(df_metadata, col_name_related_rec="Related_Records")
         except Exception as e:
             logger.exception("Failed to add agreement/amendment record no columns: %s", e)
             raise
+        df_metadata = context.checkpoint("iter_1", df_metadata)
         
         end_time = datetime.now()
         duration = end_time - start_time
         logger.info("Total execution time first iteration: %s", str(duration))
-        return {"status": "first_iteration_complete", "shipto_count": len(shipto_ucns)}
+        return {"status": "first_iteration_complete", "shipto_count": len(shipto_ucns), "records": len(df_metadata)}
     
-    def second_iteration(self, ucns: List[str]) -> Dict[str, Any]:
+    def second_iteration(self, ucns: List[str], run_dir: Optional[Path] = None,
+                         context: Optional[PipelineContext] = None) -> Dict[str, Any]:
         """Fetch RADAR data and replace TRIM fields with RADAR values."""
+        context = self.context(run_dir, context)
+        run_dir = context.run_dir
         start_time = datetime.now()
         
         if isinstance(ucns, str):
@@ -933,65 +1082,59 @@ class MetadataPipeline:
             raise ValueError("No UCNS provided for second_iteration")
  
         logger.info("Starting second iteration for UCNS: %s", ucns)
-        self.radar.run_radar_download(UCNS_list=ucns, table_ucn=self.table_ucn, table_ics=self.table_ics, temp_root=self.temp_root)
+        df_trim = context.get("iter_1")
+        self.radar.run_radar_download(UCNS_list=ucns, ICS_list=df_trim["ICS"].tolist(), table_ucn=self.table_ucn,
+                                     table_ics=self.table_ics, temp_root=run_dir, columns=self.radar_columns)
  
-        self.radar.replace_trim_with_radar_ucn(
-            excel_file_trim=str(self.temp_root / "processed_metadata_iter_1.xlsx"),
-            excel_file_radar=str(self.temp_root / "RADAR_UCN_dim_cntrc_vw.xlsx"),
-            sheet_name_trim="Metadata",
-            sheet_name_radar="Metadata",
+        # All three RADAR replacements run on the in-memory frame
+        df_trim, changes_df = self.radar.apply_radar_ucn(
+            df_trim,
+            read_radar_file(run_dir / "RADAR_UCN_dim_cntrc_vw.parquet"),
             common_column_name_trim="Article_Number",
             common_column_name_radar="rec_mgmt_id",
-            field_map={
-                "cntrc_id": "Policy_Number",
-                "cntrc_start_dt": "Effective_Date",
-                "cntrc_end_dt": "End_Date",
-                "last_updt": "Last_Modified_Date",
-                # "cntrc_org": "Business_Unit",
-                # "agmt_type": "Contract_Type",
-            },
-            output_trim_file=str(self.temp_root / "processed_metadata_iter_2.xlsx")
+            field_map=RADAR_UCN_FIELD_MAP,
         )
         
-        self.radar.replace_trim_with_radar_ics_pricing_terms(
-            excel_file_trim=str(self.temp_root / "processed_metadata_iter_2.xlsx"),
-            excel_file_radar=str(self.temp_root / "RADAR_ICS_dim_prc_prg_vw.xlsx"),
-            sheet_name_trim="Metadata",
-            sheet_name_radar="Metadata",
+        df_trim = self.radar.apply_radar_ics_pricing_terms(
+            df_trim,
+            read_radar_file(run_dir / "RADAR_ICS_dim_prc_prg_vw.parquet", dtype={"cntrc_id": str}),
             common_column_name_trim="ICS",
             common_column_name_radar="cntrc_id",
             column_map_trim="Type_of_Pricing",
             column_map_radar="prc_prg_nm",
-            output_trim_file=str(self.temp_root / "processed_metadata_iter_2.xlsx")
             )
         
-        self.radar.replace_trim_with_radar_ics_eligible_participants(
-            excel_file_trim=str(self.temp_root /"processed_metadata_iter_2.xlsx"),
-            excel_file_radar=str(self.temp_root / "RADAR_ICS_dim_prc_cmpnt_cust_elig_vw.xlsx"),
-            sheet_name_trim="Metadata",
-            sheet_name_radar="Metadata",
+        df_trim = self.radar.apply_radar_ics_eligible_participants(
+            df_trim,
+            read_radar_file(run_dir / "RADAR_ICS_dim_prc_cmpnt_cust_elig_vw.parquet", dtype={"cntrc_id": str}),
             common_column_name_trim="ICS",
             common_column_name_radar="cntrc_id",
             column_map_trim="Eligible_Participants",
             column_map_radar=["elig_cust_ucn", "elig_cust_nm"],
-            output_trim_file=str(self.temp_root / "processed_metadata_iter_2.xlsx")
             )
+ 
+        context.checkpoint("iter_2", df_trim)
+        self.radar.write_changes_report(changes_df, str(run_dir / "processed_metadata_iter_2.xlsx"))
+        logger.info("RADAR replacements done (%d records changed)", len(changes_df))
         end_time = datetime.now()
         duration = end_time - start_time
         logger.info("Total execution time second iteration: %s", str(duration))
-        return {"status": "second_iteration_complete"}
+        return {"status": "second_iteration_complete", "radar_changes": len(changes_df)}
     
-    def third_iteration(self, ucns: List[str]) -> Dict[str, Any]:
-        """Placeholder for third iteration logic."""
+    def third_iteration(self, ucns: List[str], run_dir: Optional[Path] = None,
+                        context: Optional[PipelineContext] = None) -> Dict[str, Any]:
+        """Add the Lexora metadata and write the final processed_metadata_iter_3.xlsx export."""
+        context = self.context(run_dir, context)
+        run_dir = context.run_dir
         start_time = datetime.now()
         logger.info("Starting third iteration for UCNS: %s", ucns)
-        # Implement third iteration logic here
+        output_file = run_dir / "processed_metadata_iter_3.xlsx"
         try:
-            self.lexora.add_lexora_metadata(
-                excel_file_iter_2=str(self.temp_root / "processed_metadata_iter_2.xlsx"),
-                excel_file_lexora=str(self.lexora.lexora_file_path),
-                sheet_name_iter_2="Metadata",
-                sheet_name_lexora="in",
+            df_lexora = pd.read_excel(self.lexora.lexora_file_path, sheet_name="in", engine="openpyxl")
+            # The "N/A" of the second iteration counts as missing, so Lexora can fill it
+            df_metadata, changes_df = self.lexora.apply_lexora_metadata(
+                as_missing(context.get("iter_2")),
+                df_lexora,
                 common_column_name_iter_2="FileName",
                 common_column_name_lexora="Trim Number",
                 field_map={
@@ -1008,33 +1151,53 @@ class MetadataPipeline:
                     "Product_details": "Product Details",
                     "Pricing_Terms": "Pricing Terms"
                 },
-                output_trim_file=str(self.temp_root /"processed_metadata_iter_3.xlsx")
             )
+            self.lexora.write_changes_report(changes_df, str(output_file))
         except Exception as e:
             logger.exception("Failed to add Lexora metadata: %s", e)
             raise
         
         try:
-            self.lexora.fix_refer_parent_document(
-                input_excel=str(self.temp_root / "processed_metadata_iter_3.xlsx"),
-                output_excel=str(self.temp_root / "processed_metadata_iter_3.xlsx")
-            )
+            df_metadata, references_fixed = self.lexora.apply_refer_parent_document(df_metadata)
+            logger.info("Fixed %d 'refer parent document' entries", references_fixed)
         except Exception as e:
             logger.exception("Failed to fix 'refer parent document': %s", e)
             raise
+ 
+        # The only workbook of the run: the final metadata and the active records missing from TRIM
+        sheets = {"Metadata": df_metadata}
+        if context.has("missing_records"):
+            sheets["Missing Records"] = context.get("missing_records")
+        context.export_excel(output_file, sheets)
+        context.checkpoint("iter_3", df_metadata)
+        logger.info("Final metadata exported to: %s", output_file)
         
         end_time = datetime.now()
         duration = end_time - start_time
         logger.info("Total execution time third iteration: %s", str(duration))
-        return {"status": "third_iteration_complete"}
+        return {"status": "third_iteration_complete", "output_file": str(output_file)}
  
-    def run_full_pipeline(self, ucns: List[str]) -> Dict[str, Any]:
-        """Run both iterations end-to-end and return result summary."""
+    def run_full_pipeline(self, ucns: List[str], run_dir: Optional[Path] = None) -> Dict[str, Any]:
+        """
+        Run the three iterations end-to-end on one in-memory context and return
+        result summary. Pass the run_dir of a failed run to resume it: the
+        iterations whose checkpoint is already there are skipped.
+        """
         try:
-            first = self.first_iteration(ucns)
-            second = self.second_iteration(ucns)
-            third = self.third_iteration(ucns)
-            return {"first": first, "second": second, "third": third}
+            run_dir = Path(run_dir) if run_dir is not None else self.new_run_dir()
+            logger.info("Pipeline run directory: %s", run_dir)
+            context = PipelineContext(run_dir)
+            result = {}
+            for key, iteration, checkpoint in (("first", self.first_iteration, "iter_1"),
+                                               ("second", self.second_iteration, "iter_2"),
+                                               ("third", self.third_iteration, "iter_3")):
+                if context.has(checkpoint):
+                    logger.info("Skipping %s iteration, resuming from checkpoint %s", key, context.checkpoint_path(checkpoint))
+                    result[key] = {"status": "resumed_from_checkpoint"}
+                    continue
+                result[key] = iteration(ucns, context=context)
+            result["run_dir"] = str(run_dir)
+            return result
         except Exception as e:
             logger.exception("Pipeline failed: %s", e)
             raise
@@ -9,6 +9,8 @@ from datetime import datetime, timedelta, timezone, date
 from zoneinfo import ZoneInfo
 import re 
 
+from date_parsing import parse_column, parse_date
+
 counter = 0
 valid_contract_types = [
       'BUSINESS ASSOCIATE',
@@ -531,6 +533,138 @@ def format_value(rule, value):
         csv_list = value.split(',')
         # Remove empty strings and trim the values
         return [item.strip() for item in csv_list if item.strip()]
+
+# **************************************************************************
+# Compiled column mapper: column_mapper is turned once into a row template
+# (every constant column already formatted) plus one accessor closure per
+# path column, so a record is mapped without splitting paths, interpreting
+# rules or comparing column names.
+# **************************************************************************
+COMMERCIAL_DOCUMENT = 'CONTRACT COMMERCIAL DOCUMENT'
+
+def _compile_path(relative_path):
+    """Accessor equivalent to get_value_from_path(dictionary, relative_path)."""
+    if isinstance(relative_path, list):
+        getters = [(lambda d: '.') if itm == 'DOT' else _compile_path(itm) for itm in relative_path]
+        def get(d):
+            return ''.join([f"{value}" for value in [g(d) for g in getters] if value is not None])
+        return get
+    keys = tuple(relative_path.split('.'))
+    if len(keys) == 2:
+        k1, k2 = keys
+        def get(d):
+            d = d.get(k1) if d is not None else None
+            return d.get(k2) if d is not None else None
+        return get
+    if len(keys) == 3:
+        k1, k2, k3 = keys
+        def get(d):
+            d = d.get(k1) if d is not None else None
+            d = d.get(k2) if d is not None else None
+            return d.get(k3) if d is not None else None
+        return get
+    def get(d):
+        for key in keys:
+            if d is None:
+                return None
+            d = d.get(key)
+        return d
+    return get
+
+def _compile_format(rule):
+    """Formatter equivalent to format_value(rule, value)."""
+    data_type = rule['data_type']
+    if data_type == 'STRING':
+        def fmt(value):
+            if value is None:
+                return None
+            if isinstance(value, str):
+                value = value.strip()
+            return str(value).replace('_x000D_\n_x000D_', '').replace('_x000D_', '')
+    elif data_type == 'INTEGER':
+        def fmt(value):
+            if value is None:
+                return None
+            return int(value.strip() if isinstance(value, str) else value)
+    elif data_type in ['DATETIME', 'DATE']:
+        data_format = rule['data_format']
+        def fmt(value):
+            if value is None:
+                return None
+            return datetime.fromisoformat(value.strip() if isinstance(value, str) else value).strftime(data_format)
+    else:
+        return lambda value: format_value(rule, value)
+    return fmt
+
+def _is_first_part(child):
+    return child.get('RecordNumber', {}).get('Value', '').endswith('.001')
+
+def _compile_step(rule):
+    """step(obj, child, parent) setting the rule's column, its special case resolved here."""
+    column = rule['column_name']
+    get = _compile_path(rule['relative_path'])
+    fmt = _compile_format(rule)
+    if rule.get('location') == 'PARENT':
+        if column == 'RecordNumber':
+            def step(obj, child, parent):
+                obj[column] = fmt(get(parent)) if _is_first_part(child) else None
+        elif column == 'Product_Lines':
+            # Only first parts of commercial documents get the column at all
+            def step(obj, child, parent):
+                if obj['Article_Number'].endswith('.001') and obj['Record_Type'] == COMMERCIAL_DOCUMENT:
+                    obj[column] = fmt(get(parent))
+                else:
+                    del obj[column]
+        elif column == 'Amendments':
+            def step(obj, child, parent):
+                val = get(parent)
+                obj[column] = "NO" if val is None or len(val) == 0 else fmt(val)
+        else:
+            def step(obj, child, parent):
+                obj[column] = fmt(get(parent))
+    else:
+        if column == 'RecordContainer_RecordNumber':
+            def step(obj, child, parent):
+                obj[column] = None if _is_first_part(child) else fmt(get(child))
+        elif column == 'End_Date':
+            def step(obj, child, parent):
+                obj[column] = fmt(get(parent if obj['Record_Type'] == COMMERCIAL_DOCUMENT else child))
+        else:
+            def step(obj, child, parent):
+                obj[column] = fmt(get(child))
+    return step
+
+def compile_column_mapper(rules):
+    """
+    Compile column_mapper rules into map_record(child, parent, counter),
+    which returns the row of one child record with the same columns, order
+    and values the rules describe. counter numbers the ContentID.
+    """
+    template = {}
+    steps = []
+    content_id_column = content_id_prefix = None
+    for rule in rules:
+        column = rule['column_name']
+        if rule['relative_path'] is None:
+            if rule['is_system_generated'] and column == 'ContentID':
+                content_id_column, content_id_prefix = column, rule['default_value']
+                template[column] = None
+            else:
+                template[column] = format_value(rule, rule['default_value'])
+        elif not rule['is_system_generated']:
+            template[column] = None
+            steps.append(_compile_step(rule))
+
+    def map_record(child, parent, counter):
+        obj = template.copy()
+        if content_id_column is not None:
+            obj[content_id_column] = f"{content_id_prefix}{str(counter).zfill(6)}"
+        for step in steps:
+            step(obj, child, parent)
+        return obj
+    return map_record
+
+map_record = compile_column_mapper(column_mapper)
     
 
 # temp_df = pd.read_excel(r"C:\JAIDA\GSIIH_Contracts - HPE\Metadata_Store\HPE_Metadata_URIs_With_Dates.xlsx", 'Content Matrix')
@@ -545,61 +679,8 @@ def try_parse_date(s):
     Try multiple parsing strategies for a date/time string.
     Returns a timezone-aware datetime (default UTC) on success, or None.
     """
-    if s is None:
-        return None
-    s = str(s).strip().strip('"').strip("'")
-    if s == "":
-        return None
-
-    # Common formats to try (order matters)
-    formats = [
-        # ISO-like full datetimes
-        "%b/%d/%Y",             # Dec/04/2003
-        "%Y-%m-%dT%H:%M:%S%z",  # with timezone offset
-        "%Y-%m-%dT%H:%M:%S",    # ISO without tz
-        "%Y-%m-%d %H:%M:%S",    # space-separated
-        "%Y-%m-%d",             # date only
-        "%Y/%m/%d",
-        "%d/%m/%Y",
-        "%m/%d/%Y",
-        "%d/%b/%Y",
-        "%b %d, %Y",            # Dec 04, 2003
-        "%d %b %Y",
-        "%B %d, %Y",            # December 04, 2003
-        "%d %B %Y",
-        "%Y-%m-%dT%H:%M:%S.%f%z",
-        "%Y-%m-%dT%H:%M:%S.%f",
-    ]
-
-    # First, try fromisoformat (handles many ISO variants)
-    try:
-        dt = datetime.fromisoformat(s)
-        # If naive, assume UTC for now (we will convert to user's tz later)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt
-    except Exception:
-        pass
-
-    # Try common formats
-    for fmt in formats:
-        try:
-            dt = datetime.strptime(s, fmt)
-            # treat naive as UTC by default
-            dt = dt.replace(tzinfo=timezone.utc)
-            return dt
-        except Exception:
-            continue
-
-    # Last resort: try to parse simple year-month without day
-    try:
-        if len(s) == 4 and s.isdigit():
-            dt = datetime(int(s), 1, 1, tzinfo=timezone.utc)
-            return dt
-    except Exception:
-        pass
-
-    return None
+    # Day-first: 04/05/2023 is 4 May, as this function always read it
+    return parse_date(s, dayfirst=True)
 
 
 def normalize_and_flag(date_input, tz_name="America/New_York", now=None):
@@ -662,52 +743,89 @@ def normalize_and_flag(date_input, tz_name="America/New_York", now=None):
         "recent_or_future": flag
     }
 
-def find_active_and_related_records(data):
-    results = data.get("Results", [])
-    final_records = []
-    active_records = []
-    related_records = set()
-    # Check if contract has expired in the last 30 days or is currently active
-    for record in results:
-        end_date_str = record.get("RecordDateClosed", {}).get("StringValue", "")
-        end_date_info = normalize_and_flag(end_date_str)
-        if not end_date_info["recent_or_future"]:
-            continue  # skip expired contracts
-        record_number = record.get("RecordNumber", {}).get("Value", "")
-        active_records.append(record_number)
-        final_records.append(record)
-    
-    for record in final_records:
-        related_to = record.get("RecordRelatedRecs", {}).get("Value", "")
-        record_related_record = record.get("RecordRelatedRecord", {}).get("RecordNumber", {}).get("Value","")
-        if record_related_record and record_related_record != "N/A":
-            related_records.add(record_related_record)
-        if related_to:
-            matches = re.findall(r"\d{9}~\d{8}(?:\.\d{3})?", related_to)
-            related_records.update(matches)
-    
-    all_records = active_records + list(related_records)
-    
-    parents = list({rec[:-4] for rec in all_records if '.' in rec})
-    
-    for record in results:
-        record_number = record.get("RecordNumber", {}).get("Value", "")
-        if record_number in related_records or record_number in parents:
-            final_records.append(record)
-    
-    return final_records
+RELATED_RECORD_NUMBER = re.compile(r"\d{9}~\d{8}(?:\.\d{3})?")
+ACTIVE_WINDOW_DAYS = 60
 
-def metadata_preprocessor(json_file: str, target_folder: str, excel_name: str, active_only: bool = False):
-    
-    with open(json_file) as jf:
-        json_data = json.load(jf)
+def find_active_and_related_records(data, cutoff=None, tz_name="America/New_York"):
+    """
+    Records closing on or after `cutoff` (a date, datetime or date string;
+    by default ACTIVE_WINDOW_DAYS before today in tz_name), every record
+    they relate to, transitively, and the containers of all of those.
+    data is a search response dict or its Results list; the records keep
+    their order in it.
+    """
+    results = data.get("Results", []) if isinstance(data, dict) else data
+    if not results:
+        return []
+    user_tz = ZoneInfo(tz_name)
+    if cutoff is None:
+        cutoff = datetime.now(user_tz).date() - timedelta(days=ACTIVE_WINDOW_DAYS)
+    cutoff = pd.Timestamp(cutoff)
+    cutoff = (cutoff.tz_convert(user_tz).tz_localize(None) if cutoff.tzinfo else cutoff).normalize()
+
+    frame = pd.DataFrame({
+        "number": [r.get("RecordNumber", {}).get("Value", "") for r in results],
+        "closed": [r.get("RecordDateClosed", {}).get("StringValue", "") for r in results],
+        "related_recs": [r.get("RecordRelatedRecs", {}).get("Value", "") for r in results],
+        "related_record": [r.get("RecordRelatedRecord", {}).get("RecordNumber", {}).get("Value", "") for r in results],
+    })
+    # All closing dates parsed at once, compared as local calendar dates
+    closed = parse_column(frame["closed"], dayfirst=True).dt.tz_convert(user_tz).dt.tz_localize(None).dt.normalize()
+    related = frame["related_recs"].fillna("").astype(str).str.findall(RELATED_RECORD_NUMBER)
+
+    # Record number -> the record numbers it relates to
+    edges = {}
+    for number, numbers, related_record in zip(frame["number"], related, frame["related_record"]):
+        targets = edges.setdefault(number, set())
+        targets.update(numbers)
+        if related_record and related_record != "N/A":
+            targets.add(related_record)
+
+    selected = set(frame.loc[closed >= cutoff, "number"])
+    frontier = selected
+    while frontier:
+        frontier = set().union(*(edges.get(number, ()) for number in frontier)) - selected
+        selected |= frontier
+    selected |= {number[:-4] for number in selected if number and '.' in number}
+
+    return [record for record, number in zip(results, frame["number"]) if number in selected]
+
+# Columns of a processed row, in the order they are written
+METADATA_COLUMNS = [rule['column_name'] for rule in column_mapper
+                    if rule['relative_path'] is None or not rule['is_system_generated']] \
+                   + ['Original_Contract_Type', 'IsValidContractType', 'Comments']
+ACTIVE_END_DATE = '2025-10-01 00:00:00'
+
+def load_results(json_file):
+    """TRIM Results from a metadata.json path, a search response dict or its Results list."""
+    if isinstance(json_file, (str, os.PathLike)):
+        with open(json_file) as jf:
+            json_file = json.load(jf)
+    return json_file['Results'] if 'Results' in json_file else json_file
+
+def list_folder(target_folder) -> set:
+    """Normalized names of the entries in target_folder, empty if it does not exist."""
+    try:
+        return {os.path.normcase(name) for name in os.listdir(target_folder)}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+
+def iter_metadata_records(json_file, target_folder: str, active_only: bool = False):
+    """
+    Yield the processed row of every electronic record in json_file (see
+    load_results), children grouped under their container. The first row of
+    each FileName wins and Comments flags files missing from target_folder.
+    With active_only, rows ending before ACTIVE_END_DATE are left out.
+    """
+    json_data = load_results(json_file)
     # if active_only:
     #     json_data = find_active_and_related_records(json_data)
         
-    json_data = json_data['Results'] if 'Results' in json_data else json_data
     global counter
     preprocessor_list = {"No_Parent": {'parent': None, 'children': []}}
-    response = []
+    # One listing of target_folder instead of an os.path.exists per record
+    existing_files = list_folder(target_folder)
+    seen_file_names = set()
     if json_data is not None:
         filtered_list = [d for d in json_data if d['RecordIsElectronic']['Value'] == False]
         for item in filtered_list:
@@ -732,59 +850,11 @@ def metadata_preprocessor(json_file: str, target_folder: str, excel_name: str, a
             parent = data['parent']
             for child in data['children']:
                     counter+=1
-                    obj = {}
-                    for rule in column_mapper:
-                        if rule['is_system_generated']:
-                                if rule["relative_path"] is None:
-                                    if rule['column_name'] == 'ContentID':
-                                            obj[rule['column_name']] = f"{rule['default_value']}{str(counter).zfill(6)}"
-                                    else:
-                                            obj[rule['column_name']] = format_value(rule, rule['default_value'])
-                                else:
-                                    pass
-                        else:
-                                if rule['relative_path'] is None:
-                                    obj[rule['column_name']] = format_value(rule, rule['default_value'])
-                                else:
-                                    if 'location' in rule and rule['location'] == 'PARENT':
-                                            val = get_value_from_path(parent, rule['relative_path'])
-                                            if rule['column_name'] == 'RecordNumber':
-                                                child_RecordNumber = child.get('RecordNumber', {}).get('Value', '')
-                                                if child_RecordNumber.endswith('.001'):
-                                                        obj[rule['column_name']] = format_value(rule, val)
-                                                else:
-                                                        obj[rule['column_name']] = None
-                                            elif rule['column_name'] == 'Product_Lines':
-                                                if obj['Article_Number'].endswith('.001') and obj['Record_Type'] == 'CONTRACT COMMERCIAL DOCUMENT':
-                                                        obj[rule['column_name']] = format_value(rule, val)                                                
-                                            elif rule['column_name'] == 'Amendments' and (val is None or len(val) == 0):
-                                                obj[rule['column_name']] = "NO"
-                                            else:
-                                                obj[rule['column_name']] = format_value(rule, val)
-                                    else:
-                                        val = get_value_from_path(child, rule['relative_path'])
-                                        if rule['column_name'] == 'RecordContainer_RecordNumber':
-                                            child_RecordNumber = child.get('RecordNumber', {}).get('Value', '')
-                                            if not child_RecordNumber.endswith('.001'):
-                                                    obj[rule['column_name']] = format_value(rule, val)
-                                            else:
-                                                    obj[rule['column_name']] = None
-                                        elif rule['column_name'] == 'End_Date':
-                                            if obj['Record_Type'] == 'CONTRACT COMMERCIAL DOCUMENT':
-                                                    val = get_value_from_path(parent, rule['relative_path'])
-                                            obj[rule['column_name']] = format_value(rule, val)                                                    
-                                    #   elif rule['column_name'] == 'Thesaurus':
-                                    #         # if obj['Article_Number'].endswith('.001') and obj['Record_Type'] == 'CONTRACT COMMERCIAL DOCUMENT':
-                                    #         if obj['Record_Type'] == 'CONTRACT COMMERCIAL DOCUMENT':
-                                    #               if val is None or (isinstance(val, str) and len(val.strip())) == 0:
-                                    #                     val = get_value_from_path(parent, rule['relative_path'])
-                                    #         obj[rule['column_name']] = format_value(rule, val)
-                                        elif rule['column_name'] == 'Realated_Records':
-                                            val = format_value(rule, val)
-                                            obj[rule['column_name']] = '|'.join(val.splitlines()) if val is not None else val
-                                        else:
-                                            obj[rule['column_name']] = format_value(rule, val)
-                        
+                    obj = map_record(child, parent, counter)
+                    if obj['FileName'] in seen_file_names:
+                        continue
+                    seen_file_names.add(obj['FileName'])
+
                     if 'Thumbnail_URL' in obj and obj['Thumbnail_URL'].strip() == '':
                         obj['Thumbnail_URL'] = f"{obj['FilePath']}{pathlib.Path(obj['FileName']).stem}.jpg"
 
@@ -809,37 +879,60 @@ def metadata_preprocessor(json_file: str, target_folder: str, excel_name: str, a
                 #         obj['Effective_Date'] = pl['Effective_Date'] if pl['Effective_Date'] is not None else obj['Effective_Date']
                 #         #End Date
                 #         obj['End_Date'] = pl['End_Date'] if pl['End_Date'] is not None else obj['End_Date']
-                    if os.path.exists(os.path.join(target_folder, obj['FileName'])):
+                    if os.path.normcase(obj['FileName']) in existing_files:
                         obj['Comments'] = None
                     else:
                         obj['Comments'] = 'FILE NOT FOUND'
-                # ADD OBJECT TO RESPONSE
-                    if not any(dictionary.get('FileName') == obj['FileName'] for dictionary in response):
-                        response.append(obj)
-                        #print(rule)
-            # Convert list of dictionaries to DataFrame
-    df = pd.DataFrame(response)
-    df['UCN'] = df['UCN'].astype(str)
-
-    # Filter active records after october 1st 2025
-    if active_only:
-        df = df[df['End_Date'] >= '2025-10-01 00:00:00']
-
-    # Write DataFrame to Excel file
-    with pd.ExcelWriter(f'{excel_name}', engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Metadata", index=False)
+                    obj['UCN'] = str(obj['UCN'])
+                    # Filter active records after october 1st 2025
+                    if active_only and (obj['End_Date'] is None or obj['End_Date'] < ACTIVE_END_DATE):
+                        continue
+                    yield obj
+
+def write_metadata_excel(records, excel_name: str, columns=METADATA_COLUMNS) -> int:
+    """
+    Stream rows into the "Metadata" sheet of excel_name one at a time
+    (openpyxl write-only mode), so the rows are never held in memory
+    together. Returns the number of rows written.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Metadata")
+    sheet.append(columns)
+    written = 0
+    for row in records:
+        sheet.append([row.get(column) for column in columns])
+        written += 1
+    workbook.save(excel_name)
+    return written
+
+def metadata_preprocessor(json_file, target_folder: str, excel_name: str = None, active_only: bool = False):
+    """
+    json_file is a TRIM metadata.json path, or the search results themselves
+    (the response dict or its Results list) as returned by
+    run_search_and_download. With excel_name the rows are streamed into
+    that workbook and their count is returned; without it they are
+    returned as a DataFrame.
+    """
+    records = iter_metadata_records(json_file, target_folder, active_only=active_only)
+    if excel_name is None:
+        return pd.DataFrame(records, columns=METADATA_COLUMNS)
+    written = write_metadata_excel(records, excel_name)
     print(f"Metadata Excel '{excel_name}' has been created successfully.")
+    return written
 # **************************************************************************    
 
-target_folder = r"TRIM Actual Contracts"
+if __name__ == "__main__":
+    target_folder = r"TRIM Actual Contracts"
 
-json_file = r"shipTo.json"
+    json_file = r"shipTo.json"
 
-# json_data = None
-# with open(json_file) as jf:
-#         json_data = json.load(jf)
+    # json_data = None
+    # with open(json_file) as jf:
+    #         json_data = json.load(jf)
 
-# if json_data is not None:
-#     active_records = find_active_and_related_records(json_data)
-    # metadata_preprocessor(active_records, target_folder=target_folder, excel_name="processed_metadata.xlsx")
-metadata_preprocessor(json_file, target_folder=target_folder, excel_name="processed_metadata.xlsx", active_only=True)
\ No newline at end of file
+    # if json_data is not None:
+    #     active_records = find_active_and_related_records(json_data)
+        # metadata_preprocessor(active_records, target_folder=target_folder, excel_name="processed_metadata.xlsx")
+    metadata_preprocessor(json_file, target_folder=target_folder, excel_name="processed_metadata.xlsx", active_only=True)
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+In-memory state of one MetadataPipeline run.
+
+The metadata DataFrame is handed from step to step, and from iteration to
+iteration, in memory instead of through processed_metadata*.xlsx files
+that every step re-read and rewrote. Each iteration's result is also
+saved as run_dir/checkpoints/<name>.parquet, so a failed run can resume
+from the last completed iteration. Excel is written once, as the final
+export.
+"""
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+CHECKPOINT_DIR = "checkpoints"
+# Cell strings read_excel reads as missing by default, e.g. the "N/A" the iterations fill blanks with
+NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+
+
+def _text(value):
+    """A cell as read_excel(dtype=str) returned it: whole numbers without '.0', NA_STRINGS as NaN."""
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    value = str(value)
+    return np.nan if value in NA_STRINGS else value
+
+
+def as_text(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Every value of df as text, missing values and NA_STRINGS as NaN: the
+    frame read_excel(dtype=str) returned from a workbook the pipeline had written.
+    """
+    return pd.DataFrame({column: df[column].map(_text).astype(object) for column in df.columns}, index=df.index)
+
+
+def as_missing(df: pd.DataFrame) -> pd.DataFrame:
+    """df with its NA_STRINGS values as NaN, so the blanks an earlier iteration filled read as missing again."""
+    return df.where(~df.isin(NA_STRINGS))
+
+
+def _parquet_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Object columns mixing value types (e.g. RADAR dates among TRIM strings) stored as text."""
+    mixed = [c for c in df.columns
+             if df[c].dtype == object and pd.api.types.infer_dtype(df[c], skipna=True).startswith("mixed")]
+    if not mixed:
+        return df
+    return df.assign(**{c: df[c].map(lambda v: v if pd.isna(v) else str(v)) for c in mixed})
+
+
+class PipelineContext:
+    """
+    The frames of one run by name, each checkpointed to Parquet under
+    run_dir. get() falls back to the checkpoint, so an iteration run on its
+    own picks up where the previous one stopped.
+    """
+    def __init__(self, run_dir: Path):
+        self.run_dir = Path(run_dir)
+        self.checkpoint_dir = self.run_dir / CHECKPOINT_DIR
+        self.frames: Dict[str, pd.DataFrame] = {}
+
+    def checkpoint_path(self, name: str) -> Path:
+        return self.checkpoint_dir / f"{name}.parquet"
+
+    def has(self, name: str) -> bool:
+        return name in self.frames or self.checkpoint_path(name).exists()
+
+    def checkpoint(self, name: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Keep df (renumbered from 0, as re-reading a workbook did) and save it as Parquet."""
+        df = df.reset_index(drop=True)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        _parquet_safe(df).to_parquet(self.checkpoint_path(name), index=False)
+        self.frames[name] = df
+        return df
+
+    def get(self, name: str) -> pd.DataFrame:
+        if name not in self.frames:
+            path = self.checkpoint_path(name)
+            if not path.exists():
+                raise FileNotFoundError(f"No '{name}' checkpoint in {self.checkpoint_dir}; run the earlier iteration first")
+            self.frames[name] = pd.read_parquet(path)
+        return self.frames[name]
+
+    def export_excel(self, output_file, sheets: Dict[str, pd.DataFrame],
+                     datetime_format: Optional[str] = None) -> Path:
+        """Write sheets {sheet_name: frame}, in order, to one workbook."""
+        out_path = Path(output_file)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        options = {"datetime_format": datetime_format} if datetime_format else {}
+        with pd.ExcelWriter(out_path, engine="xlsxwriter", **options) as writer:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+        return out_path
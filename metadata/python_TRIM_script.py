@@ -13,11 +13,11 @@ import re
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
 from requests.exceptions import RequestException
-from urllib.parse import quote as urlquote
+
+from trim_client import DOWNLOAD_WORKERS, TRIMSearchError, get_trim_client
 
 # -----------------------
 # Defaults & Constants
@@ -70,54 +70,21 @@ def safe_get(d: Dict[str, Any], *keys, default=None):
 # -----------------------
 def get_search_results(route_url: str, query: str, logger: logging.Logger) -> Optional[Dict[str, Any]]:
     """
-    Perform a GET against the ServiceAPI with the formed query.
-    Returns parsed JSON dict (ConvertFrom-Json equivalent) or None on failure.
+    Run the search against the ServiceAPI through the pooled TRIM client,
+    following every result page. Returns the combined JSON dict
+    (ConvertFrom-Json equivalent) or None on failure.
     """
-
-    # Escape query string similarly to PS ([uri]::EscapeUriString)
-    final_query = urlquote(query, safe=":/?&=')(")  # keep some safe characters; adjust if needed
-
-    # PS bug workaround: replace tilde with question when searching record number
-    # (they replaced only when valueFilter == "Number" earlier; we'll keep to general safety)
-    if "Number:" in query and "~" in final_query:
-        final_query = final_query.replace("~", "?")
-
-    search_uri = f"{route_url}?q={final_query}&propertySets={PROPERTY_SETS_PARAMETER}&properties={PROPERTIES_PARAMETER}&format=json&pageSize={PAGE_SIZE}"
+    client = get_trim_client(route_url, page_size=PAGE_SIZE)
     logger.info("Invoking Search via ServiceAPI: %s", query)
-    logger.debug("Search URI: %s", search_uri)
+    logger.debug("Search URI: %s", client.search_uri(query))
 
     try:
-        resp = requests.get(search_uri, timeout=120)
-        logger.debug("HTTP Status Code: %s", resp.status_code)
-        if resp.status_code != 200:
-            logger.error("Unexpected HTTP Status Code %s", resp.status_code)
-            logger.debug("Response body: %s", resp.text[:2000])
-            return None
-
-        text = resp.text
-        # PS bug when parsing UTC date times, they removed '.0000000Z"'
-        text = text.replace('.0000000Z"', '"')
-        if not text.strip():
-            logger.warning("Search failed to return results (empty body)")
-            return None
-        # Parse JSON - attempt safe parsing
-        try:
-            result = resp.json()
-            logger.info("Search received a response (Results count: %s)", safe_get(result, "TotalResults", default="unknown"))
-            return result
-        except json.JSONDecodeError:
-            # fallback: try loading modified text
-            try:
-                result = json.loads(text)
-                logger.info("Search received a response (parsed from modified text)")
-                return result
-            except Exception as ex2:
-                logger.exception("Failed to parse JSON response: %s", ex2)
-                logger.debug("Raw response (truncated): %s", text[:2000])
-                return None
-    except RequestException as e:
+        result = client.search(query, property_sets=PROPERTY_SETS_PARAMETER, properties=PROPERTIES_PARAMETER)
+    except TRIMSearchError as e:
         logger.exception("Get-SearchResults failed: %s", e)
         return None
+    logger.info("Search received a response (Results count: %s)", len(result.get("Results", [])))
+    return result
 
 
 # -----------------------
@@ -134,26 +101,39 @@ def download_record(route_url: str, record_uri: str, extension: Optional[str], a
     # Ensure attachments folder
     ensure_dir(attachments_path)
 
+    client = get_trim_client(route_url)
     local_filename = attachments_path / f"{record_uri}.{extension}"
-    download_url = f"{route_url}/{record_uri}/File/document"
-    logger.info("Downloading record from: %s", download_url)
+    logger.info("Downloading record from: %s", client.document_url(record_uri))
     logger.debug("Downloading record to: %s", local_filename)
 
     try:
-        with requests.get(download_url, stream=True, timeout=120) as r:
-            if r.status_code != 200:
-                logger.error("Failed to download %s (HTTP %s)", download_url, r.status_code)
-                return None
-            # stream to file
-            with open(local_filename, "wb") as fh:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        fh.write(chunk)
-        logger.info("Downloaded Uri %s to: %s", record_uri, local_filename)
+        status, _ = client.download(record_uri, local_filename)
+        logger.info("Downloaded Uri %s to: %s (%s)", record_uri, local_filename, status)
         return str(local_filename)
-    except RequestException as ex:
+    except (RequestException, ValueError) as ex:
         logger.exception("Get-RecordDownload failed: %s", ex)
         return None
+
+
+# -----------------------
+# Download documents concurrently
+# -----------------------
+def download_records(route_url: str, jobs: List[Tuple[Any, Optional[str]]], attachments_path: Path, logger: logging.Logger,
+                     workers: int = DOWNLOAD_WORKERS) -> Dict[str, Any]:
+    """
+    Download (record_uri, extension) jobs into attachments_path with a pool
+    of `workers`; documents already downloaded are skipped and partial
+    ones resumed. Returns the download stats of TRIMClient.download_all.
+    """
+    ensure_dir(attachments_path)
+    stats = get_trim_client(route_url).download_all(
+        ({"uri": uri, "path": attachments_path / f"{uri}.{ext or 'pdf'}"} for uri, ext in jobs),
+        workers=workers,
+    )
+    logger.info("Downloads complete in %ss: %d downloaded, %d resumed, %d skipped, %d failed",
+                stats["seconds"], stats["downloaded"], stats["resumed"], stats["skipped"], stats["failed"])
+    return stats
+
     
 def run_search_and_download(
     full_extract: bool = False,
@@ -167,15 +147,22 @@ def run_search_and_download(
     bypass_confirm: bool = True,
     route_url: str = "http://awsdrbnvaw0003/CMServiceAPI/Record",
     root_download_folder: str = r"C:\temp\genai",
-    view_transcript: bool = False
+    view_transcript: bool = False,
+    save_metadata: bool = True,
+    logger: Optional[logging.Logger] = None,
+    download_workers: int = DOWNLOAD_WORKERS
 ):
     """
     Direct function-call version of Invoke-SearchAndDownload.
     Works without argparse or CLI parameters.
+
+    Returns the search results dict, or None if the search failed. With
+    save_metadata=False nothing is written to the batch folder unless
+    documents are downloaded. Pass a logger to share one across
+    concurrent calls instead of opening a transcript per call.
     """
 
     from datetime import datetime, timedelta
-    import json, requests, os
     from pathlib import Path
 
     start_time = datetime.now()
@@ -187,7 +174,8 @@ def run_search_and_download(
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
     transcript_path = Path(os.getenv("TEMP", "/tmp")) / f"Transcript-{username}-{hostname}-v9-{timestamp}.txt"
 
-    logger = setup_logging(transcript_path)
+    if logger is None:
+        logger = setup_logging(transcript_path)
     logger.info("Function-based execution started")
 
     # -----------------------------
@@ -200,8 +188,9 @@ def run_search_and_download(
     metadata_path = batch_folder / "metadata.json"
 
     # Pre-create folders
-    batch_folder.mkdir(parents=True, exist_ok=True)
-    attachments_folder.mkdir(parents=True, exist_ok=True)
+    if save_metadata or download:
+        batch_folder.mkdir(parents=True, exist_ok=True)
+        attachments_folder.mkdir(parents=True, exist_ok=True)
 
     # -----------------------------
     # Determine value search string
@@ -262,39 +251,40 @@ def run_search_and_download(
     results = get_search_results(route_url, search_string, logger)
     if not results:
         logger.error("No TRIM results returned.")
-        return
+        return None
 
     # -----------------------------
     # SAVE METADATA JSON
     # -----------------------------
-    if metadata_path.exists():
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        metadata_path = metadata_path.with_name(f"metadata-{timestamp}.json")
-    with open(metadata_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=4)
+    if save_metadata:
+        if metadata_path.exists():
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            metadata_path = metadata_path.with_name(f"metadata-{timestamp}.json")
+        with open(metadata_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
 
-    logger.info("Metadata saved to %s", metadata_path)
+        logger.info("Metadata saved to %s", metadata_path)
 
     # -----------------------------
     # DOWNLOAD ATTACHMENTS
     # -----------------------------
     if not download:
         logger.info("Skipping downloads.")
-        return
+        return results
 
-    count = 0
+    jobs = []
     for rec in results.get("Results", []):
         uri = rec.get("Uri")
         ext = rec.get("RecordExtension", {}).get("Value")
 
         if ext and (ext.lower() == "pdf" or ext.lower() == "zip"):
-            download_record(route_url, uri, ext.lower(), attachments_folder, logger)
-            count += 1
+            jobs.append((uri, ext.lower()))
 
-        if not download_all and count > 5:
+        if not download_all and len(jobs) > 5:
             break
 
-    logger.info("Downloaded %s documents", count)
+    stats = download_records(route_url, jobs, attachments_folder, logger, workers=download_workers)
+    logger.info("Downloaded %s documents", stats["downloaded"] + stats["resumed"] + stats["skipped"])
     logger.info("Completed successfully.")
 
     if view_transcript:
@@ -303,6 +293,7 @@ def run_search_and_download(
     end_time = datetime.now()
     duration = end_time - start_time
     logger.info("Total execution time: %s", str(duration))
+    return results
         
 # # Example function call
 # run_search_and_download(
@@ -0,0 +1,42 @@
+"""
+EXPLAIN QUERY PLAN diagnostics for the SQLite metadata store.
+
+Each query is compiled with its parameters inlined and explained on the
+engine; a plan step that reads a whole table ("SCAN <table>" without an
+index) is reported as a full table scan.
+"""
+import re
+
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)$')
+
+
+def explain_query_plan(engine, statement) -> list:
+    """Plan step details (the 'detail' column) of a SQLAlchemy statement or SQL string."""
+    if not isinstance(statement, str):
+        statement = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_table_scans(plan) -> list:
+    """Tables a plan reads in full."""
+    return [match.group(1) for match in map(FULL_SCAN.match, plan) if match]
+
+
+def check_query_plans(engine, queries, log=print) -> dict:
+    """
+    Explain every {name: statement} in `queries` and log its plan; queries
+    with a full table scan are flagged. Returns {name: [scanned tables]}
+    for the flagged queries.
+    """
+    flagged = {}
+    for name, statement in queries.items():
+        plan = explain_query_plan(engine, statement)
+        scans = full_table_scans(plan)
+        if scans:
+            flagged[name] = scans
+            log(f"************ FULL TABLE SCAN in {name} on {', '.join(scans)}: {' | '.join(plan)}")
+        else:
+            log(f"{name}: {' | '.join(plan)}")
+    return flagged
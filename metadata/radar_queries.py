@@ -0,0 +1,163 @@
+"""
+Parameterized, batched queries against the RADAR Redshift views.
+
+IDs are matched exactly through a bound `IN %s` parameter instead of
+OR-ed ILIKE '%id%' patterns, long ID lists are split into chunks, and only
+the requested columns are selected. Rows stream from a server-side (named)
+cursor into a Parquet file one record batch at a time, so a result never
+has to fit in a DataFrame.
+"""
+import os
+import uuid
+from datetime import datetime, time, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycopg2 import sql
+
+ID_CHUNK_SIZE = 1000
+FETCH_SIZE = 10000
+CONDITION_OPERATORS = ("=", "<>", "<", "<=", ">", ">=")
+
+# PostgreSQL / Redshift type OIDs -> (Arrow type, value converter); other types are read as text
+_BOOL, _INT2, _INT4, _INT8, _FLOAT4, _FLOAT8, _NUMERIC = 16, 21, 23, 20, 700, 701, 1700
+_DATE, _TIMESTAMP, _TIMESTAMPTZ = 1082, 1114, 1184
+ARROW_TYPES = {
+    _BOOL: (pa.bool_(), None),
+    _INT2: (pa.int64(), None),
+    _INT4: (pa.int64(), None),
+    _INT8: (pa.int64(), None),
+    _FLOAT4: (pa.float64(), None),
+    _FLOAT8: (pa.float64(), None),
+    _NUMERIC: (pa.float64(), float),
+    # Dates become midnight timestamps, as they came back from the Excel extracts
+    _DATE: (pa.timestamp("us"), lambda v: datetime.combine(v, time())),
+    _TIMESTAMP: (pa.timestamp("us"), None),
+    _TIMESTAMPTZ: (pa.timestamp("us", tz="UTC"), lambda v: v.astimezone(timezone.utc)),
+}
+_TEXT = (pa.string(), str)
+
+
+def table_identifier(table_name: str) -> sql.Identifier:
+    """'schema.view' as a quoted identifier."""
+    return sql.Identifier(*table_name.split("."))
+
+
+def column_list(columns: Optional[Sequence[str]]) -> sql.Composable:
+    if not columns:
+        return sql.SQL("*")
+    return sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+
+
+def select_by_ids(table_name: str, columns: Optional[Sequence[str]], key_column: str,
+                  conditions: Sequence[Tuple[str, str, Any]] = ()) -> sql.Composed:
+    """
+    SELECT columns FROM table WHERE key_column IN %s, AND-ed with every
+    (column, operator, value) in conditions. Parameters are the ID tuple
+    followed by the condition values.
+    """
+    where = [sql.SQL("{} IN %s").format(sql.Identifier(key_column))]
+    for column, operator, _ in conditions:
+        if operator not in CONDITION_OPERATORS:
+            raise ValueError(f"Unsupported condition operator: {operator}")
+        where.append(sql.SQL("{} " + operator + " %s").format(sql.Identifier(column)))
+    return sql.SQL("SELECT {} FROM {} WHERE {}").format(
+        column_list(columns), table_identifier(table_name), sql.SQL(" AND ").join(where)
+    )
+
+
+def arrow_schema(description) -> Tuple[pa.Schema, List]:
+    """Arrow schema and per-column value converters for a cursor description."""
+    fields, converters = [], []
+    for column in description:
+        arrow_type, convert = ARROW_TYPES.get(column.type_code, _TEXT)
+        fields.append(pa.field(column.name, arrow_type))
+        converters.append(convert)
+    return pa.schema(fields), converters
+
+
+def fetch_schema(conn, table_name: str, columns: Optional[Sequence[str]]) -> Tuple[pa.Schema, List]:
+    """Schema of the selected columns, read from an empty result."""
+    query = sql.SQL("SELECT {} FROM {} LIMIT 0").format(column_list(columns), table_identifier(table_name))
+    with conn.cursor() as cur:
+        cur.execute(query)
+        return arrow_schema(cur.description)
+
+
+def to_record_batch(rows: List[tuple], schema: pa.Schema, converters: List) -> pa.RecordBatch:
+    arrays = []
+    for values, field, convert in zip(zip(*rows), schema, converters):
+        if convert is not None:
+            values = [convert(v) if v is not None else None for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_record_batches(conn, table_name: str, columns: Optional[Sequence[str]], key_column: str,
+                        ids: Iterable[Any], conditions: Sequence[Tuple[str, str, Any]] = (),
+                        chunk_size: int = ID_CHUNK_SIZE, fetch_size: int = FETCH_SIZE,
+                        schema: Optional[Tuple[pa.Schema, List]] = None) -> Iterator[pa.RecordBatch]:
+    """
+    Record batches of at most fetch_size rows for the distinct `ids`,
+    queried chunk_size IDs at a time through a server-side cursor.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return
+    arrow, converters = schema or fetch_schema(conn, table_name, columns)
+    query = select_by_ids(table_name, columns, key_column, conditions)
+    condition_values = [value for _, _, value in conditions]
+    for start in range(0, len(ids), chunk_size):
+        with conn.cursor(name=f"radar_{uuid.uuid4().hex}") as cur:
+            cur.itersize = fetch_size
+            cur.execute(query, [tuple(ids[start:start + chunk_size]), *condition_values])
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield to_record_batch(rows, arrow, converters)
+
+
+def download_to_parquet(conn, table_name: str, columns: Optional[Sequence[str]], key_column: str,
+                        ids: Iterable[Any], output_path, conditions: Sequence[Tuple[str, str, Any]] = (),
+                        chunk_size: int = ID_CHUNK_SIZE, fetch_size: int = FETCH_SIZE) -> int:
+    """
+    Stream the rows of table_name whose key_column is one of `ids` (see
+    iter_record_batches) into a Parquet file. The file is written, with its
+    schema, even when nothing matches; if any chunk fails the error is
+    raised and no file is left behind. Returns the number of rows.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Written aside and renamed into place once every chunk succeeded, so a failed query leaves no extract
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    rows = 0
+    try:
+        schema = fetch_schema(conn, table_name, columns)
+        with pq.ParquetWriter(tmp_path, schema[0]) as writer:
+            for batch in iter_record_batches(conn, table_name, columns, key_column, ids, conditions,
+                                             chunk_size, fetch_size, schema=schema):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if not conn.closed:
+            conn.rollback()  # end the read transaction the named cursors ran in
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+def read_radar_file(path, sheet_name: str = "Metadata", dtype: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """A RADAR extract as a DataFrame, from Parquet or a legacy Excel download."""
+    if Path(path).suffix.lower() != ".parquet":
+        return pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl", dtype=dtype)
+    df = pd.read_parquet(path)
+    for column, column_type in (dtype or {}).items():
+        if column in df.columns:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(column_type))
+    return df
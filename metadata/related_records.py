@@ -0,0 +1,85 @@
+"""
+Contract relationship graph built from the inventory Related_Records field.
+
+Each record's Related_Records text is parsed once into a list of article
+numbers (its adjacency list). Article numbers that are referenced but not
+loaded yet are fetched in batches, and binder children are collected with
+an iterative traversal over set-based visited tracking instead of
+recursion over lists.
+"""
+import re
+from functools import lru_cache
+
+RELATED_RECORD_PATTERN = re.compile(r'\b\d+~\d+\.\d{1,3}\b')
+LOOKUP_BATCH_SIZE = 500
+
+
+@lru_cache(maxsize=None)
+def parse_related_records(related_records) -> tuple:
+    """Article numbers referenced by a Related_Records string, in text order."""
+    if related_records is None:
+        return ()
+    return tuple(RELATED_RECORD_PATTERN.findall(related_records))
+
+
+class RelatedRecordsGraph:
+    def __init__(self, records=()):
+        # Article_Number -> inventory record, first loaded wins
+        self.records = {}
+        self.add(records)
+
+    def add(self, records):
+        for record in records:
+            self.records.setdefault(record.get('Article_Number'), record)
+
+    def load_references(self, records, lookup, batch_size: int = LOOKUP_BATCH_SIZE):
+        """
+        Load every article number reachable from `records` through
+        Related_Records. `lookup(article_numbers)` returns the matching
+        inventory records in table order; it is called once per batch of
+        article numbers not loaded yet, hop by hop.
+        """
+        requested = set(self.records)
+        frontier = list(records)
+        while frontier:
+            missing = []
+            for record in frontier:
+                for article_number in parse_related_records(record.get('Related_Records')):
+                    if article_number not in requested:
+                        requested.add(article_number)
+                        missing.append(article_number)
+            frontier = []
+            for start in range(0, len(missing), batch_size):
+                found = [r for r in lookup(missing[start:start + batch_size]) if r.get('Article_Number') not in self.records]
+                self.add(found)
+                frontier.extend(found)
+
+    def children(self, root, related_records, nodes, skip=frozenset()) -> list:
+        """
+        Records reachable from `root` through Related_Records, in depth-first
+        discovery order. `nodes` (Article_Number -> record) takes precedence
+        over the loaded records, article numbers in `skip` are never entered,
+        and an edge is followed only once.
+        """
+        found = []
+        seen_nodes = set()
+        seen_edges = set()
+        stack = [(root, iter(parse_related_records(related_records)))]
+        while stack:
+            parent, matches = stack[-1]
+            for match in matches:
+                if match in skip:
+                    continue
+                record = nodes[match] if match in nodes else self.records.get(match)
+                if record is None:
+                    continue
+                if match not in seen_nodes:
+                    seen_nodes.add(match)
+                    found.append(record)
+                if (parent, match) not in seen_edges:
+                    seen_edges.add((parent, match))
+                    stack.append((match, iter(parse_related_records(record.get('Related_Records')))))
+                    break
+            else:
+                stack.pop()
+        return found
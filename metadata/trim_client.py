@@ -0,0 +1,317 @@
+"""
+Pooled, paginated client for the TRIM (Content Manager) ServiceAPI.
+
+One requests.Session per route URL keeps connections alive across searches
+and downloads, retries GETs with backoff on 5xx responses and connection
+errors, and follows result pages (start/pageSize) until the search is
+exhausted. Pages are parsed as a stream with ijson when it is installed.
+
+Documents are downloaded concurrently into a .part file that is renamed
+into place when complete; an interrupted .part is resumed with a Range
+request guarded by If-Range (the ETag or Last-Modified it was started
+from), so a document changed upstream is downloaded again from the start.
+A file already present with the expected size or checksum is skipped.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote as urlquote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+PAGE_SIZE = 3000
+PROPERTY_SETS_PARAMETER = "GenAI"
+PROPERTIES_PARAMETER = "RecordRelatedRecord,RecordAttachedKeywords,RecordKeywords"
+REQUEST_TIMEOUT = 120
+HTTP_RETRIES = 5
+HTTP_BACKOFF_FACTOR = 1.0
+RETRY_STATUSES = (500, 502, 503, 504)
+POOL_SIZE = 16
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+PROGRESS_EVERY = 50
+
+_CONTAINER_EVENTS = ("start_map", "end_map", "start_array", "end_array", "map_key")
+
+
+class TRIMSearchError(Exception):
+    """A search page could not be fetched or parsed."""
+
+
+def build_session(pool_size: int = POOL_SIZE, retries: int = HTTP_RETRIES,
+                  backoff_factor: float = HTTP_BACKOFF_FACTOR) -> requests.Session:
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _parse_page_stream(raw) -> Dict[str, Any]:
+    """Top-level scalars of a search page plus its Results, built item by item."""
+    page: Dict[str, Any] = {}
+    results: List[Any] = []
+    builder = None
+    for prefix, event, value in ijson.parse(raw, use_float=True):
+        if builder is None and prefix == "Results.item" and event in ("start_map", "start_array"):
+            builder = ObjectBuilder()
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == "Results.item" and event in ("end_map", "end_array"):
+                results.append(builder.value)
+                builder = None
+        elif prefix == "Results.item":
+            results.append(value)
+        elif prefix and "." not in prefix and event not in _CONTAINER_EVENTS:
+            page[prefix] = value
+    page["Results"] = results
+    return page
+
+
+class TRIMClient:
+    def __init__(self, route_url: str, page_size: int = PAGE_SIZE, timeout: int = REQUEST_TIMEOUT,
+                 session: Optional[requests.Session] = None, logger: Optional[logging.Logger] = None):
+        self.route_url = route_url
+        self.page_size = page_size
+        self.timeout = timeout
+        self.session = session or build_session()
+        self.logger = logger or logging.getLogger("TRIMClient")
+
+    def search_uri(self, query: str, start: int = 1,
+                   property_sets: str = PROPERTY_SETS_PARAMETER, properties: str = PROPERTIES_PARAMETER) -> str:
+        # Escape query string similarly to PS ([uri]::EscapeUriString)
+        final_query = urlquote(query, safe=":/?&=')(")
+        # PS bug workaround: replace tilde with question when searching record number
+        if "Number:" in query and "~" in final_query:
+            final_query = final_query.replace("~", "?")
+        return (f"{self.route_url}?q={final_query}&propertySets={property_sets}&properties={properties}"
+                f"&format=json&pageSize={self.page_size}&start={start}")
+
+    def _get_page(self, uri: str) -> Dict[str, Any]:
+        try:
+            with self.session.get(uri, timeout=self.timeout, stream=True) as resp:
+                self.logger.debug("HTTP Status Code: %s", resp.status_code)
+                if resp.status_code != 200:
+                    raise TRIMSearchError(f"Unexpected HTTP Status Code {resp.status_code}: {resp.text[:2000]}")
+                if ijson is not None:
+                    resp.raw.decode_content = True
+                    try:
+                        return _parse_page_stream(resp.raw)
+                    except ijson.JSONError as e:
+                        raise TRIMSearchError(f"Failed to parse JSON response: {e}") from e
+                text = resp.text
+        except requests.RequestException as e:
+            raise TRIMSearchError(f"Search request failed: {e}") from e
+
+        if not text.strip():
+            raise TRIMSearchError("Search failed to return results (empty body)")
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            # PS bug when parsing UTC date times, they removed '.0000000Z"'
+            try:
+                return json.loads(text.replace('.0000000Z"', '"'))
+            except json.JSONDecodeError as e:
+                raise TRIMSearchError(f"Failed to parse JSON response: {e}") from e
+
+    def iter_pages(self, query: str, **uri_kwargs) -> Iterator[Dict[str, Any]]:
+        """Every result page of `query`, fetched with start=1, 1+pageSize, ..."""
+        start = 1
+        while True:
+            page = self._get_page(self.search_uri(query, start=start, **uri_kwargs))
+            count = len(page.get("Results") or [])
+            self.logger.info("Search page start=%d: %d results (total %s)", start, count, page.get("TotalResults", "unknown"))
+            yield page
+            has_more = page.get("HasMoreItems")
+            if has_more is None:
+                total = page.get("TotalResults")
+                has_more = total is not None and start - 1 + count < total
+            if count == 0 or not has_more:
+                return
+            start += count
+
+    def iter_records(self, query: str, **uri_kwargs) -> Iterator[Dict[str, Any]]:
+        for page in self.iter_pages(query, **uri_kwargs):
+            yield from page.get("Results") or []
+
+    def search(self, query: str, **uri_kwargs) -> Dict[str, Any]:
+        """
+        All pages of `query` combined into one response: the first page's
+        top-level fields with Results spanning every page.
+        """
+        response: Dict[str, Any] = {}
+        results: List[Any] = []
+        for page in self.iter_pages(query, **uri_kwargs):
+            if not response:
+                response = {k: v for k, v in page.items() if k != "Results"}
+            results.extend(page.get("Results") or [])
+        response["Results"] = results
+        response["Count"] = len(results)
+        response["HasMoreItems"] = False
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def document_url(self, record_uri) -> str:
+        return f"{self.route_url}/{record_uri}/File/document"
+
+    def remote_size(self, record_uri) -> Optional[int]:
+        resp = self.session.head(self.document_url(record_uri), timeout=self.timeout, allow_redirects=True)
+        length = resp.headers.get("Content-Length")
+        return int(length) if resp.status_code == 200 and length is not None else None
+
+    def download(self, record_uri, destination: Path, expected_size: Optional[int] = None,
+                 expected_sha256: Optional[str] = None) -> Tuple[str, int]:
+        """
+        Download a record's document to `destination`. Returns (status, bytes
+        transferred) with status "skipped", "downloaded" or "resumed". An
+        existing destination is skipped when its checksum or size matches, or
+        when no size is known to compare it with.
+        """
+        destination = Path(destination)
+        if destination.exists():
+            if expected_sha256 is not None:
+                if sha256_file(destination) == expected_sha256.lower():
+                    return "skipped", 0
+            else:
+                size = expected_size if expected_size is not None else self.remote_size(record_uri)
+                # Without a known size, trust the file: destinations are only ever written by a completed download
+                if size is None or destination.stat().st_size == size:
+                    return "skipped", 0
+
+        part = destination.with_name(destination.name + ".part")
+        # ETag / Last-Modified of the response the .part was started from
+        validator_file = destination.with_name(destination.name + ".part.validator")
+        validator = validator_file.read_text().strip() if validator_file.exists() else ""
+        offset = part.stat().st_size if part.exists() and validator else 0
+        # If-Range: the server sends the rest (206) only if the document is unchanged, else all of it (200)
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+        with self.get(self.document_url(record_uri), stream=True, headers=headers) as resp:
+            if resp.status_code == 416:
+                if not offset:
+                    # No Range was sent, so starting over would get the same answer
+                    raise requests.HTTPError(f"HTTP 416 without a Range request for {resp.url}", response=resp)
+                total = _content_range_total(resp.headers.get("Content-Range"))
+                if total != offset:
+                    # Not a complete .part of the current document: start over
+                    part.unlink(missing_ok=True)
+                    validator_file.unlink(missing_ok=True)
+                    return self.download(record_uri, destination, expected_size, expected_sha256)
+                resumed, written = True, 0
+            elif resp.status_code in (200, 206):
+                resumed = resp.status_code == 206
+                written = 0
+                if not resumed:
+                    validator = _resume_validator(resp.headers)
+                    if validator:
+                        validator_file.write_text(validator)
+                    else:
+                        validator_file.unlink(missing_ok=True)
+                with open(part, "ab" if resumed else "wb", buffering=DOWNLOAD_CHUNK_SIZE) as fh:
+                    for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        fh.write(chunk)
+                        written += len(chunk)
+            else:
+                raise requests.HTTPError(f"HTTP {resp.status_code} for {resp.url}", response=resp)
+
+        if expected_sha256 is not None and sha256_file(part) != expected_sha256.lower():
+            part.unlink()
+            validator_file.unlink(missing_ok=True)
+            raise ValueError(f"Checksum mismatch for record {record_uri}")
+        os.replace(part, destination)
+        validator_file.unlink(missing_ok=True)
+        return ("resumed" if resumed else "downloaded"), written
+
+    def download_all(self, jobs: Iterable[Dict[str, Any]], workers: int = DOWNLOAD_WORKERS) -> Dict[str, Any]:
+        """
+        Download every job ({"uri", "path", optional "size"/"sha256"}) with
+        `workers` threads, logging progress and throughput. Returns the
+        counts per status, the bytes transferred, the elapsed seconds and
+        {"uri": path} of the files now on disk.
+        """
+        jobs = list(jobs)
+        stats = {"downloaded": 0, "resumed": 0, "skipped": 0, "failed": 0, "bytes": 0, "files": {}}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(self.download, job["uri"], job["path"], job.get("size"), job.get("sha256")): job
+                for job in jobs
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                try:
+                    status, written = future.result()
+                except Exception as e:
+                    self.logger.error("Failed to download record %s: %s", job["uri"], e)
+                    stats["failed"] += 1
+                else:
+                    stats[status] += 1
+                    stats["bytes"] += written
+                    stats["files"][job["uri"]] = str(job["path"])
+                if done % PROGRESS_EVERY == 0 or done == len(jobs):
+                    elapsed = time.perf_counter() - start
+                    self.logger.info("Downloads %d/%d - %.1f MB at %.2f MB/s (%d skipped, %d failed)",
+                                     done, len(jobs), stats["bytes"] / 1e6, stats["bytes"] / 1e6 / elapsed if elapsed else 0.0,
+                                     stats["skipped"], stats["failed"])
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return stats
+
+
+def _resume_validator(headers) -> str:
+    """A strong ETag, else Last-Modified: what If-Range accepts. "" if the response has neither."""
+    etag = headers.get("ETag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified", "")
+
+
+def _content_range_total(content_range: Optional[str]) -> Optional[int]:
+    """Complete length of a Content-Range header ("bytes */1234" on a 416), None if unknown."""
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_clients: Dict[str, TRIMClient] = {}
+_clients_lock = threading.Lock()
+
+
+# One pooled client per route URL, shared across calls and threads
+def get_trim_client(route_url: str, page_size: int = PAGE_SIZE) -> TRIMClient:
+    with _clients_lock:
+        key = f"{route_url}#{page_size}"
+        if key not in _clients:
+            _clients[key] = TRIMClient(route_url, page_size=page_size)
+        return _clients[key]
@@ -1,6 +1,5 @@
 import os
 import re
-import io
 import fitz
 import boto3, fitz
 import configparser
@@ -17,53 +16,55 @@ DOLLAR_THRESHOLD = 30
  
 textract = boto3.client(service_name = 'textract', region_name = aws_region, aws_access_key_id = awsAccessKey, aws_secret_access_key = awsSecretKey)
  
-def find_truncation_page(pdf_path):
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+def find_truncation_page(pdf_path, doc=None):
+    # Open by path so MuPDF reads pages on demand instead of holding the whole file in memory.
+    # Callers that already have the document open pass it in to avoid opening it twice.
+    owns_doc = doc is None
+    if owns_doc:
+        doc = fitz.open(pdf_path)
  
-    for i, page in enumerate(doc):
-        pix = page.get_pixmap(dpi=300)
-        response = textract.analyze_document(
-            Document={"Bytes": pix.tobytes("png")},
-            FeatureTypes=["TABLES"]
-        )
+    try:
+        for i, page in enumerate(doc):
+            pix = page.get_pixmap(dpi=300)
+            png_bytes = pix.tobytes("png")
+            pix = None  # release the raster before the Textract round trip
+            response = textract.analyze_document(
+                Document={"Bytes": png_bytes},
+                FeatureTypes=["TABLES"]
+            )
  
-        dollar_count = sum(
-            block["Text"].count("$")
-            for block in response["Blocks"]
-            if block["BlockType"] == "WORD"
-        )
+            dollar_count = sum(
+                block["Text"].count("$")
+                for block in response["Blocks"]
+                if block["BlockType"] == "WORD"
+            )
  
-        if dollar_count > DOLLAR_THRESHOLD:
-            doc.close()
-            return i
+            if dollar_count > DOLLAR_THRESHOLD:
+                return i
  
-    doc.close()
-    return None
+        return None
+    finally:
+        if owns_doc:
+            doc.close()
  
 def truncate_pdf(input_pdf, output_pdf):
     try:
-        truncate_from = find_truncation_page(input_pdf)
-        with open(input_pdf, "rb") as f:
-            pdf_bytes = f.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        # One handle shared by detection and truncation
+        with fitz.open(input_pdf) as doc:
+            truncate_from = find_truncation_page(input_pdf, doc=doc)
     
-        # No truncation → save full PDF
-        if truncate_from is None:
-            print("ℹ️ No truncation needed, len of doc:", len(doc))
-            doc.save(output_pdf)
-            doc.close()
-            return True
-    
-        new_doc = fitz.open()
-        if truncate_from > 0:
-            print("🛑 Truncating from page:", truncate_from, "Total pages:", len(doc))
-            new_doc.insert_pdf(doc, from_page=0, to_page=truncate_from - 1)
+            # No truncation → copy the file as-is, no need to re-serialise it
+            if truncate_from is None:
+                print("ℹ️ No truncation needed, len of doc:", len(doc))
+                shutil.copyfile(input_pdf, output_pdf)
+                return True
     
-        new_doc.save(output_pdf)
-        doc.close()
-        new_doc.close()
+            with fitz.open() as new_doc:
+                if truncate_from > 0:
+                    print("🛑 Truncating from page:", truncate_from, "Total pages:", len(doc))
+                    new_doc.insert_pdf(doc, from_page=0, to_page=truncate_from - 1)
+        
+                new_doc.save(output_pdf, garbage=3, deflate=True)
         return True
     except Exception as e:
         print("❌ Error during truncation:", str(e))
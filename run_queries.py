@@ -11,6 +11,8 @@ from langchain_openai import AzureOpenAIEmbeddings
 from tenacity import retry, stop_after_attempt, wait_exponential
 from typing import List
 
+from clause_chunker import collapse_chunks
+
 config = ConfigParser()
 
 config.read('configs/config.ini')
@@ -56,6 +58,7 @@ def banner_health_neuwave():
         },
         limit=100
     )
+    result = collapse_chunks(result)
 
     # Save output as excel file
     out = []
@@ -136,6 +139,7 @@ def does_banner_health_have_audit_rights(text_query: str):
         },
         limit=100
     )
+    result = collapse_chunks(result)
     # Save output as excel file
     out = []
     for res in result:
@@ -175,6 +179,7 @@ def dispute_resolution_clauses():
         },
         limit=100
     )
+    result = collapse_chunks(result)
     # Save output as excel file
     out = []
     for res in result:
@@ -246,6 +251,7 @@ def performance_requirement():
         },
         limit=100
     )
+    result = collapse_chunks(result)
     # Save output as excel file
     out = []
     for res in result:
@@ -282,6 +288,7 @@ def total_energy_pa():
         },
         limit=1000
     )
+    result = collapse_chunks(result)
     out = []
     for res in result:
         out.append({
@@ -317,6 +324,7 @@ def rebate():
         },
         limit=1000
     )
+    result = collapse_chunks(result)
     out = []
     for res in result:
         out.append({
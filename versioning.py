@@ -0,0 +1,56 @@
+from typing import Callable, Hashable, Iterable
+
+
+def amendment_number(record_no: str) -> int:
+    """Sequence of a record within its article: 1234.001 -> 1, 1234.012 -> 12."""
+    _, _, suffix = str(record_no).strip().rpartition(".")
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def version_order(effective_iso: str, record_no: str) -> tuple:
+    """
+    Sort key of a version: effective date (ISO-8601, "" if unknown sorts
+    first), then amendment number, then record number as a tie-breaker.
+    """
+    return (effective_iso or "", amendment_number(record_no), str(record_no))
+
+
+class VersionIndex:
+    """
+    Tracks the current version per key, e.g. (agreement_id, clause title) or
+    (agreement_id, meta_field), in one pass.
+
+    Each added payload gets its `is_current` flag set immediately; when it
+    supersedes the current version of its key, only that previous payload is
+    flipped to False. Versions are compared by their order key, not by the
+    order they are added in; between equal keys the one added last wins.
+    """
+
+    def __init__(self):
+        self._current = {}
+
+    def add(self, key: Hashable, order: tuple, payload: dict):
+        """Add a version and return the payload it superseded, if any."""
+        current = self._current.get(key)
+        if current is not None and order < current[0]:
+            payload["is_current"] = False
+            return None
+
+        payload["is_current"] = True
+        self._current[key] = (order, payload)
+        if current is None:
+            return None
+        current[1]["is_current"] = False
+        return current[1]
+
+    def current(self, key: Hashable):
+        entry = self._current.get(key)
+        return None if entry is None else entry[1]
+
+    @classmethod
+    def from_payloads(cls, payloads: Iterable[dict], key_fn: Callable, order_fn: Callable):
+        """Rebuild the index over already-versioned payloads, e.g. a previous output file."""
+        index = cls()
+        for payload in payloads:
+            index.add(key_fn(payload), order_fn(payload), payload)
+        return index